@@ -1,6 +1,6 @@
 import os
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Adaptive Lending Platform"
@@ -10,12 +10,129 @@ class Settings(BaseSettings):
     # Firebase
     FIREBASE_CREDENTIALS_PATH: str = "app/adaptive-lending-firebase-adminsdk-fbsvc-3514e2cff2.json"
     
+    # Storage / auth backends: "firestore" / "firebase" in production; "local" / "fake"
+    # run the app without a Firebase project (load tests, local development)
+    STORAGE_BACKEND: str = "firestore"
+    AUTH_BACKEND: str = "firebase"
+    LOCAL_FIRESTORE_SEED_PATH: str = ""
+    LOCAL_FIRESTORE_LATENCY_MS: float = 0.0
+    
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
     
     # Model paths
     MODEL_PATH: str = "models/cnn_loan_default_model.keras"
     SCALER_PATH: str = "models/loan_default_scaler.pkl"
+    MODEL_VERSION: str = "cnn-v1"
+    MODEL_LOAD_ON_IMPORT: bool = True  # the prefork server loads the model in each worker instead
+    
+    # Prefork serving (python -m app.serve)
+    SERVE_WORKERS: int = os.cpu_count() or 1
+    TF_INTRA_OP_THREADS: int = 1  # per worker, so workers x threads does not oversubscribe the cores
+    TF_INTER_OP_THREADS: int = 1
+    # Delinquency sweep, metrics rollup persistence and outbox sweep; app.serve runs them in worker 0 only
+    SINGLETON_JOBS_ENABLED: bool = True
+    
+    # Inference worker pool: 0 runs the model in the API process
+    INFERENCE_WORKERS: int = 0
+    INFERENCE_SLOTS_PER_PROCESS: int = 256  # shared-memory request slots per API process
+    INFERENCE_MAX_BATCH: int = 64
+    INFERENCE_TIMEOUT_SECONDS: float = 10.0
+    
+    # Model performance tracking
+    MODEL_DECISION_THRESHOLD: float = 0.5
+    CALIBRATION_BINS: int = 10
+    SCORE_BINS: int = 100
+    
+    # Risk bands: band name -> inclusive upper bound on default probability
+    RISK_BANDS: Dict[str, float] = {"low": 0.3, "medium": 0.7, "high": 1.0}
+    
+    # Delinquency
+    DELINQUENCY_GRACE_DAYS: int = 5
+    DELINQUENCY_SWEEP_INTERVAL_SECONDS: int = 3600
+    LATE_FEE_RATE: float = 0.05  # share of the missed installment
+    LATE_FEE_MIN: float = 5.0
+    
+    # Loan event outbox: handlers for lifecycle side effects run after the loan write
+    EVENT_DISPATCH_WORKERS: int = 4  # events of one customer always go to the same worker
+    EVENT_QUEUE_SIZE: int = 10000
+    EVENT_LEASE_SECONDS: int = 60  # the sweep takes over pending events after this long
+    EVENT_SWEEP_INTERVAL_SECONDS: int = 30
+    EVENT_MAX_ATTEMPTS: int = 8
+    EVENT_RETRY_BASE_SECONDS: float = 1.0
+    EVENT_RETENTION_DAYS: int = 7
+    
+    # Idempotency-Key on loan applications and repayments
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    IDEMPOTENCY_LOCK_SECONDS: int = 60  # an in-progress key older than this is taken over
+    
+    # Admission control (per worker): loan applications are capped and shed first
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENCY: int = 64
+    ADMISSION_QUEUE_SIZE: int = 256
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 5.0
+    ADMISSION_SCORING_CONCURRENCY: int = 8
+    ADMISSION_SCORING_QUEUE_SIZE: int = 64
+    ADMISSION_SCORING_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    
+    # Responses larger than this are gzipped for clients that accept it
+    GZIP_MINIMUM_SIZE: int = 1024
+    
+    # Conditional GET: no validator is issued for a list changed more recently than this,
+    # since a write stamped earlier may still commit (clock skew, commit latency)
+    CONDITIONAL_GET_SETTLE_SECONDS: float = 5.0
+    
+    # Delta sync (loans/changes): the returned watermark trails the clock by this much
+    DELTA_SYNC_WINDOW_SECONDS: float = 5.0
+    
+    # Live feeds (Server-Sent Events), per worker
+    LIVE_FEED_MAX_SUBSCRIBERS: int = 500
+    LIVE_FEED_QUEUE_SIZE: int = 100  # a subscriber further behind is resent the snapshot
+    LIVE_FEED_KEEP_ALIVE_SECONDS: float = 15.0
+    LIVE_FEED_RETRY_MS: int = 3000  # client reconnect delay
+    LIVE_FEED_MAX_CONNECTION_SECONDS: float = 300.0
+    
+    # System metrics sampling (samples stay in memory; only hourly rollups are persisted)
+    METRICS_SAMPLE_INTERVAL_SECONDS: int = 60
+    
+    # Tracing (spans are recorded for a sampled share of requests)
+    TRACE_SAMPLE_RATE: float = 0.01
+    TRACE_EXPORTER: str = "none"  # "none", "otlp" or "jsonl" (local debugging only: the file is never rotated)
+    TRACE_FILE_PATH: str = "traces.jsonl"
+    TRACE_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    # Requests a client may force into sampling with X-Trace-Id (token bucket, per worker)
+    TRACE_FORCED_PER_SECOND: float = 1.0
+    TRACE_FORCED_BURST: int = 10
+    
+    # Event-loop lag monitor
+    LOOP_MONITOR_INTERVAL_SECONDS: float = 0.1
+    LOOP_STALL_THRESHOLD_SECONDS: float = 0.1
+    LOOP_STALL_STACK_DEPTH: int = 25
+    
+    # Sampling profiler
+    PROFILER_MAX_SECONDS: int = 60
+    PROFILER_CONTINUOUS_ENABLED: bool = False  # start the per-route profiler at startup
+    PROFILER_CONTINUOUS_INTERVAL_SECONDS: float = 0.1
+    
+    # Memory accounting (tracemalloc slows allocation, so it is opt-in)
+    MEMORY_TRACEMALLOC_ENABLED: bool = False
+    MEMORY_TRACEMALLOC_FRAMES: int = 1
+    MEMORY_TRACKED_CALLS: int = 50
+    
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: Dict[str, str] = {}  # per-logger overrides, e.g. {"app.services.loan_service": "DEBUG"}
+    LOG_DEBUG_SAMPLE_RATE: float = 0.1
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_REDACT_FIELDS: List[str] = [
+        "email", "name", "address", "date_of_birth", "income", "phone",
+        "password", "token", "credentials", "authorization"
+    ]
+    
+    # Portfolio stress testing
+    # Simulation processes per API process; 0 uses every core, and app.serve splits the cores among its workers
+    STRESS_TEST_WORKERS: int = 0
+    STRESS_TEST_MAX_SIMULATIONS: int = 100000
     
     class Config:
         case_sensitive = True
@@ -1,13 +1,29 @@
 import os
+import logging
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
 from app.config import settings
 
-# Initialize Firebase
-cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
-firebase_app = firebase_admin.initialize_app(cred)
+logger = logging.getLogger(__name__)
 
-db = firestore.client()
+if settings.STORAGE_BACKEND == "local" and settings.AUTH_BACKEND == "fake":
+    firebase_app = None
+else:
+    # Initialize Firebase
+    cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
+    firebase_app = firebase_admin.initialize_app(cred)
+
+if settings.STORAGE_BACKEND == "local":
+    from app.utils.local_firestore import create_client
+    logger.warning("Using the in-memory local Firestore stand-in")
+    db = create_client()
+else:
+    db = firestore.client()
+
+if settings.AUTH_BACKEND == "fake":
+    from app.utils.fake_auth import FakeAuth
+    logger.warning("Using the fake token verifier - tokens are NOT checked")
+    auth = FakeAuth
 
 # Collection references for easy access
 users_ref = db.collection("users")
@@ -15,6 +31,9 @@ loans_ref = db.collection("loans")
 repayments_ref = db.collection("repayments")
 system_metrics_ref = db.collection("system_metrics")
 bank_analytics_ref = db.collection("bank_analytics")
+model_performance_ref = db.collection("model_performance")
+loan_events_ref = db.collection("loan_events")
+idempotency_keys_ref = db.collection("idempotency_keys")
 
 def verify_firebase_token(id_token: str):
     """Verify Firebase ID token"""
@@ -1,40 +1,117 @@
 from datetime import datetime
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
 from app.config import settings
 from app.routes import customers, banks, admin, auth, loan_packages
 from app.services.system_monitoring import SystemMonitoringService
+from app.services.stress_test_service import shutdown_executor
+from app.services.delinquency_service import DelinquencyService
+from app.middleware.metrics_middleware import RequestMetricsMiddleware, request_metrics
+from app.middleware.tracing_middleware import TracingMiddleware
+from app.middleware.admission_middleware import AdmissionMiddleware
+from app.utils.admission import admission
+from app.utils.json_responses import FastJSONResponse
+from app.utils import live_feed
+from app.services.live_feeds import pending_loans_feed, system_metrics_feed
+from app.utils.tracing import exporter as trace_exporter
+from app.utils.loop_monitor import loop_monitor
+from app.utils.event_bus import event_bus
+from app.utils.profiler import continuous_profiler
+from app.utils import memory_tracking, inference_pool
+from app.utils.logging_config import configure_logging, shutdown_logging
 import asyncio
+import logging
 from contextlib import asynccontextmanager
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    print("Starting Adaptive Lending Platform...")
+    configure_logging()  # no-op unless this is a freshly forked worker
+    logger.info("Starting Adaptive Lending Platform...")
+    
+    # Watch for blocking calls on the event loop
+    loop_monitor.start()
+    if settings.PROFILER_CONTINUOUS_ENABLED:
+        continuous_profiler.start(app.routes)
+    if settings.MEMORY_TRACEMALLOC_ENABLED:
+        memory_tracking.start_tracing(settings.MEMORY_TRACEMALLOC_FRAMES)
     
     # Start background tasks for system monitoring
     asyncio.create_task(collect_metrics_periodically())
+    if settings.SINGLETON_JOBS_ENABLED:
+        asyncio.create_task(sweep_delinquencies_periodically())
+    event_bus.start(sweep=settings.SINGLETON_JOBS_ENABLED)
+    
+    # Under app.serve the pool is started by the supervisor; run standalone, own one
+    pool = None
+    if settings.INFERENCE_WORKERS > 0 and inference_pool.client is None:
+        pool = inference_pool.create_pool()
+        pool.start()
+        inference_pool.attach(pool)
+        asyncio.create_task(check_inference_workers_periodically(pool))
     
     yield
     
     # Shutdown
-    print("Shutting down Adaptive Lending Platform...")
+    logger.info("Shutting down Adaptive Lending Platform...")
+    loop_monitor.stop()
+    continuous_profiler.stop()
+    event_bus.stop()
+    shutdown_executor()
+    if pool is not None:
+        await asyncio.to_thread(pool.stop)
+    await asyncio.to_thread(SystemMonitoringService.flush)
+    await asyncio.to_thread(trace_exporter.flush)
+    shutdown_logging()
 
 async def collect_metrics_periodically():
-    """Collect system metrics every 5 minutes"""
+    """Sample system metrics into the in-memory buffer"""
+    # CPU usage is measured as a delta between samples, so take the baseline first
+    await asyncio.to_thread(SystemMonitoringService.prime)
+    await asyncio.sleep(1)
     while True:
         try:
-            await SystemMonitoringService.collect_system_metrics()
-        except Exception as e:
-            print(f"Error collecting metrics: {e}")
-        await asyncio.sleep(300)  # 5 minutes
+            metrics = await SystemMonitoringService.collect_system_metrics()
+            if metrics is not None:
+                system_metrics_feed.publish("sample", metrics.dict())
+        except Exception:
+            logger.exception("Error collecting metrics")
+        await asyncio.sleep(settings.METRICS_SAMPLE_INTERVAL_SECONDS)
+
+async def sweep_delinquencies_periodically():
+    """Mark overdue installments and charge late fees"""
+    while True:
+        try:
+            await asyncio.to_thread(DelinquencyService.run_sweep)
+        except Exception:
+            logger.exception("Error sweeping delinquencies")
+        await asyncio.sleep(settings.DELINQUENCY_SWEEP_INTERVAL_SECONDS)
+
+async def check_inference_workers_periodically(pool):
+    """Restart inference workers that died"""
+    while True:
+        await asyncio.sleep(5)
+        await asyncio.to_thread(pool.check_workers)
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
+    default_response_class=FastJSONResponse,
     lifespan=lifespan
 )
 
+# Compression (streamed list bodies are compressed chunk by chunk as they are written)
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE)
+
+# Admission control (inside CORS, so shed responses still carry the CORS headers)
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -44,6 +121,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Tracing (per-request trace id, sampled spans)
+app.add_middleware(TracingMiddleware)
+
+# Request metrics (outermost, so latency covers CORS, tracing and routing)
+app.add_middleware(RequestMetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
 app.include_router(customers.router, prefix="/api/v1/customers", tags=["Customers"])
@@ -59,6 +142,17 @@ async def root():
         "status": "healthy"
     }
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint for this worker"""
+    text = request_metrics.prometheus_text() + loop_monitor.prometheus_text() + event_bus.prometheus_text()
+    text += live_feed.prometheus_text(pending_loans_feed, system_metrics_feed)
+    if settings.ADMISSION_ENABLED:
+        text += admission.prometheus_text()
+    if inference_pool.client is not None:
+        text += inference_pool.client.prometheus_text()
+    return text
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
\ No newline at end of file
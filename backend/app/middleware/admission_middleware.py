@@ -0,0 +1,63 @@
+import json
+import math
+import re
+import time
+from typing import List, Optional, Tuple
+
+from app.utils.admission import AdmissionController, AdmissionRejected, admission
+
+# (method or None for any, path pattern, traffic class); first match wins, no match means "default"
+TRAFFIC_RULES: List[Tuple[Optional[str], re.Pattern, Optional[str]]] = [
+    (None, re.compile(r"^/(health|metrics|docs|redoc|openapi\.json)?$"), None),  # never limited
+    ("GET", re.compile(r"^/api/v1/.+/stream$"), None),  # live feeds hold their connection; capped per feed instead
+    ("POST", re.compile(r"^/api/v1/customers/loans/apply(-package)?$"), "scoring"),
+    ("GET", re.compile(r"^/api/v1/(banks|admin)/"), "interactive")
+]
+
+def traffic_class(method: str, path: str) -> Optional[str]:
+    for rule_method, pattern, name in TRAFFIC_RULES:
+        if (rule_method is None or rule_method == method) and pattern.match(path):
+            return name
+    return "default"
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the admission controller; shed requests get 503 with Retry-After"""
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = traffic_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(name)
+        except AdmissionRejected as e:
+            await self._shed(send, e)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name, time.perf_counter() - started)
+
+    @staticmethod
+    async def _shed(send, rejection: AdmissionRejected):
+        body = json.dumps({"detail": "Server is busy, please retry", "reason": rejection.reason}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(rejection.retry_after)).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -2,13 +2,16 @@ from fastapi import Request, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.firebase_admin import verify_firebase_token
 from app.utils.firestore_utils import get_user_by_uid
+from app.utils.tracing import span
 
 security = HTTPBearer()
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        decoded_token = verify_firebase_token(credentials.credentials)
-        user = get_user_by_uid(decoded_token['uid'])
+        with span("auth.verify_token"):
+            decoded_token = verify_firebase_token(credentials.credentials)
+        with span("auth.user_read"):
+            user = get_user_by_uid(decoded_token['uid'])
         if not user:
             raise HTTPException(status_code=404, detail="User not found in database")
         return user
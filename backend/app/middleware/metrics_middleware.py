@@ -0,0 +1,194 @@
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Latency histogram bucket upper bounds in seconds (Prometheus-style, cumulative on export)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+# Live feeds hold their connection open for minutes; their latency is time to first byte
+STREAM_PATH = re.compile(r"^/api/v1/.+/stream$")
+
+class RouteStats:
+    __slots__ = ("count", "status_classes", "buckets", "total_seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.status_classes = {"1xx": 0, "2xx": 0, "3xx": 0, "4xx": 0, "5xx": 0}
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.total_seconds = 0.0
+
+    def observe(self, status_code: int, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        status_class = f"{status_code // 100}xx"
+        if status_class in self.status_classes:
+            self.status_classes[status_class] += 1
+        for index, upper in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper:
+                self.buckets[index] += 1
+                break
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a latency quantile by interpolating inside the histogram bucket"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for index, upper in enumerate(LATENCY_BUCKETS):
+            in_bucket = self.buckets[index]
+            if in_bucket and seen + in_bucket >= rank:
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / in_bucket
+            seen += in_bucket
+            lower = upper
+        return lower
+
+class RequestMetrics:
+    """
+    Per-worker request counters and latency histograms.
+
+    Only the event-loop thread records observations, so plain ints are enough -
+    no locks on the request path. Each worker process exposes its own series
+    (labelled with its pid) and Prometheus sums them.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.routes: Dict[Tuple[str, str], RouteStats] = {}
+        self.total_requests = 0
+        self.total_seconds = 0.0
+        self._last_sample = (time.monotonic(), 0)
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float):
+        key = (method, route)
+        stats = self.routes.get(key)
+        if stats is None:
+            stats = self.routes[key] = RouteStats()
+        stats.observe(status_code, seconds)
+        self.total_requests += 1
+        self.total_seconds += seconds
+
+    def sample_rate(self) -> float:
+        """Requests per second since the previous call"""
+        now = time.monotonic()
+        last_time, last_total = self._last_sample
+        total = self.total_requests
+        self._last_sample = (now, total)
+        elapsed = now - last_time
+        return (total - last_total) / elapsed if elapsed > 0 else 0.0
+
+    def average_response_time(self) -> float:
+        return self.total_seconds / self.total_requests if self.total_requests else 0.0
+
+    def summary(self) -> Dict:
+        routes: List[Dict] = []
+        for (method, route), stats in sorted(self.routes.items(), key=lambda item: -item[1].count):
+            routes.append({
+                "method": method,
+                "route": route,
+                "count": stats.count,
+                "status_classes": dict(stats.status_classes),
+                "avg_seconds": stats.total_seconds / stats.count if stats.count else 0,
+                "p50_seconds": stats.quantile(0.5),
+                "p95_seconds": stats.quantile(0.95),
+                "p99_seconds": stats.quantile(0.99)
+            })
+
+        uptime = time.time() - self.started_at
+        return {
+            "worker_pid": os.getpid(),
+            "uptime_seconds": uptime,
+            "total_requests": self.total_requests,
+            "average_request_rate": self.total_requests / uptime if uptime > 0 else 0,
+            "avg_response_time": self.average_response_time(),
+            "routes": routes
+        }
+
+    def prometheus_text(self) -> str:
+        worker = f'worker="{os.getpid()}"'
+        lines = [
+            "# HELP http_requests_total Requests handled, by route and status class.",
+            "# TYPE http_requests_total counter"
+        ]
+        for (method, route), stats in self.routes.items():
+            for status_class, count in stats.status_classes.items():
+                if count:
+                    lines.append(
+                        f'http_requests_total{{{worker},method="{method}",route="{route}",status="{status_class}"}} {count}'
+                    )
+
+        lines += [
+            "# HELP http_request_duration_seconds Request latency, by route.",
+            "# TYPE http_request_duration_seconds histogram"
+        ]
+        for (method, route), stats in self.routes.items():
+            labels = f'{worker},method="{method}",route="{route}"'
+            cumulative = 0
+            for upper, count in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative += count
+                bound = "+Inf" if upper == float("inf") else f"{upper:g}"
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.total_seconds}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+
+        return "\n".join(lines) + "\n"
+
+request_metrics = RequestMetrics()
+
+def route_template(scope) -> str:
+    """
+    Path template of the matched route (e.g. /api/v1/customers/loans/{loan_id}).
+    Depending on the FastAPI version the route in the scope may or may not carry
+    its router prefix, so the prefix is recovered from the request path.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return "unmatched"
+
+    path = scope.get("path", "")
+    path_regex = getattr(route, "path_regex", None)
+    if path_regex is None or path_regex.match(path):
+        return template
+
+    for index, char in enumerate(path):
+        if char == "/" and index and path_regex.match(path[index:]):
+            return path[:index] + template
+    return template
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording count, status class and latency per matched route.
+    Event streams are timed to their response start, not to the connection closing.
+    """
+
+    def __init__(self, app, registry: RequestMetrics = request_metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        first_byte: Optional[float] = None
+        streaming = STREAM_PATH.match(scope.get("path", "")) is not None
+
+        async def send_wrapper(message):
+            nonlocal status_code, first_byte
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                first_byte = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished = first_byte if streaming and first_byte is not None else time.perf_counter()
+            # Label by route template, not the raw path, to keep cardinality bounded
+            self.registry.observe(scope["method"], route_template(scope), status_code, finished - started)
@@ -0,0 +1,45 @@
+import re
+from app.utils.tracing import forced_sampling, start_trace, finish_trace, span
+from app.middleware.metrics_middleware import route_template
+
+TRACE_HEADER = b"x-trace-id"
+_TRACE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+class TracingMiddleware:
+    """
+    Starts a trace for every HTTP request and returns its id in X-Trace-Id.
+    A valid X-Trace-Id from the client becomes the trace id, so its logs can
+    be correlated, and also forces the request to be sampled - how a single
+    slow call is traced on demand - as long as TRACE_FORCED_PER_SECOND allows.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope.get("headers", []):
+            if name == TRACE_HEADER:
+                incoming = value.decode("latin-1").strip().lower()
+                break
+        valid = bool(incoming and _TRACE_ID_PATTERN.match(incoming))
+        forced = valid and forced_sampling.take()
+        trace, token = start_trace(incoming if valid else None, sampled=True if forced else None)
+        trace_id_header = trace.trace_id.encode()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-trace-id", trace_id_header)]
+            await send(message)
+
+        try:
+            with span("http.request", method=scope["method"], path=scope["path"]) as root:
+                await self.app(scope, receive, send_wrapper)
+                root.set_attribute("route", route_template(scope))
+        finally:
+            finish_trace(trace, token)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, List
 from datetime import datetime
 
@@ -17,6 +17,7 @@ class SystemAnalytics(BaseModel):
     total_loans: int
     system_uptime: float
     model_accuracy: Optional[float]
+    model_auc: Optional[float] = None
     avg_response_time: float
     active_loans: int
     total_loan_volume: float
@@ -27,6 +28,17 @@ class SystemMetrics(BaseModel):
     memory_usage: float
     disk_usage: float
     gpu_usage: Optional[float]
+    gpu_memory_usage: Optional[float] = None
+    gpu_temperature: Optional[float] = None
+    gpu_power_usage: Optional[float] = None
     power_consumption: Optional[float]
     active_connections: int
-    request_rate: float
\ No newline at end of file
+    request_rate: float
+
+class StressTestScenario(BaseModel):
+    num_simulations: int = Field(20000, gt=0, description="Number of Monte Carlo simulations")
+    pd_multiplier: float = Field(1.0, gt=0, description="Scenario multiplier applied to every default probability")
+    correlation: float = Field(0.0, ge=0, lt=1, description="Asset correlation to a single systemic factor")
+    loss_given_default: float = Field(1.0, gt=0, le=1, description="Share of the remaining amount lost on default")
+    confidence_level: float = Field(0.99, gt=0, lt=1, description="Confidence level for VaR and expected shortfall")
+    seed: Optional[int] = None
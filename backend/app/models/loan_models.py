@@ -2,8 +2,17 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
+from enum import Enum
 from .user_models import LoanStatus
 
+class LoanEventType(str, Enum):
+    APPLIED = "loan.applied"
+    APPROVED = "loan.approved"
+    REJECTED = "loan.rejected"
+    REPAID = "loan.repaid"
+    PAID_OFF = "loan.paid_off"
+    DEFAULTED = "loan.defaulted"
+
 class LoanApplication(BaseModel):
     income: float = Field(gt=0, description="Annual income")
     interest_rate: float = Field(gt=0, le=50, description="Annual interest rate percentage")
@@ -0,0 +1,91 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Type
+from datetime import datetime
+
+# Lean list-endpoint shapes. The list routes project their Firestore queries
+# onto these fields (see field_paths), so the payment schedule and other
+# heavy or private fields are never read, encoded or sent.
+
+class LoanApplicationSummary(BaseModel):
+    loan_amount: Optional[float] = None
+    interest_rate: Optional[float] = None
+    loan_term_months: Optional[int] = None
+    purpose: Optional[str] = None
+    income: Optional[float] = None
+    dti_ratio: Optional[float] = None
+    credit_score: Optional[float] = None
+    age: Optional[int] = None
+
+class LoanSummary(BaseModel):
+    loan_id: str
+    user_id: Optional[str] = None
+    bank_id: Optional[str] = None
+    package_id: Optional[str] = None
+    status: str
+    application_data: Optional[LoanApplicationSummary] = None
+    default_probability: Optional[float] = None
+    credit_grade: Optional[str] = None
+    decision: Optional[str] = None
+    recommendation: Optional[str] = None
+    amount_remaining: Optional[float] = None
+    total_amount: Optional[float] = None
+    next_payment_date: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class UserSummary(BaseModel):
+    user_id: str
+    name: Optional[str] = None
+    email: Optional[str] = None
+    role: str
+    bank_name: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class PendingLoansResponse(BaseModel):
+    pending_loans: List[LoanSummary]
+
+class ActiveLoansResponse(BaseModel):
+    active_loans: List[LoanSummary]
+
+class UserLoansResponse(BaseModel):
+    loans: List[LoanSummary]
+
+class UsersResponse(BaseModel):
+    users: List[UserSummary]
+
+class LoanChangesResponse(BaseModel):
+    loans: List[LoanSummary]  # changed since the watermark passed in
+    removed: List[str]  # ids of loans that left the list
+    watermark: datetime  # pass as `since` on the next call
+
+def field_paths(model: Type[BaseModel], prefix: str = "") -> List[str]:
+    """Firestore field paths of a model, nested models flattened to dotted paths"""
+    paths = []
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        # Optional[Model] -> Model
+        nested = next((arg for arg in getattr(annotation, "__args__", ()) if isinstance(arg, type) and issubclass(arg, BaseModel)), annotation)
+        if isinstance(nested, type) and issubclass(nested, BaseModel):
+            paths += field_paths(nested, f"{prefix}{name}.")
+        else:
+            paths.append(f"{prefix}{name}")
+    return paths
+
+def project(data: Dict, paths: List[str]) -> Dict:
+    """The fields of `data` at `paths`, like a Firestore select()"""
+    projected = {}
+    for path in paths:
+        *parents, name = path.split(".")
+        source, target = data, projected
+        for parent in parents:
+            source = source.get(parent) if isinstance(source, dict) else None
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(parent, {})
+        else:
+            if name in source:
+                target[name] = source[name]
+    return projected
+
+LOAN_SUMMARY_FIELDS = field_paths(LoanSummary)
+USER_SUMMARY_FIELDS = field_paths(UserSummary)
@@ -1,26 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
 from app.middleware.auth_middleware import get_current_admin
 from app.services.user_service import UserService
 from app.services.system_monitoring import SystemMonitoringService
 from app.services.analytics_service import AnalyticsService
+from app.services.model_performance_service import ModelPerformanceService
+from app.services.cohort_service import CohortAnalyticsService
+from app.services.delinquency_service import DelinquencyService
 from app.models.user_models import UserCreate
-from typing import List
+from app.models.response_models import UsersResponse, USER_SUMMARY_FIELDS
+from app.utils.json_responses import stream_list
+from app.middleware.metrics_middleware import request_metrics
+from app.utils.metrics_buffer import RESOLUTIONS
+from app.utils.tracing import exporter as trace_exporter
+from app.utils.loop_monitor import loop_monitor
+from app.utils import profiler
+from app.utils import memory_tracking
+from app.utils.logging_config import logging_stats
+from app.services.memory_service import MemoryReportService
+from app.services.live_feeds import system_metrics_feed
+from app.config import settings
+from typing import List, Optional
+import asyncio
 
 router = APIRouter()
 
-@router.get("/users")
-async def get_all_users(current_user: dict = Depends(get_current_admin)):
+@router.get("/users", response_model=UsersResponse)
+async def get_all_users(
+    request: Request,
+    current_user: dict = Depends(get_current_admin),
+    full: bool = Query(False, description="Return whole user documents")
+):
+    """Streamed; send Accept: application/x-ndjson for one user per line"""
     try:
-        users = await UserService.get_all_users()
-        return {"users": users}
+        query = UserService.users_query(fields=None if full else USER_SUMMARY_FIELDS)
+        return await stream_list(request, "users", query)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/users/{role}")
-async def get_users_by_role(role: str, current_user: dict = Depends(get_current_admin)):
+@router.get("/users/{role}", response_model=UsersResponse)
+async def get_users_by_role(
+    role: str,
+    request: Request,
+    current_user: dict = Depends(get_current_admin),
+    full: bool = Query(False, description="Return whole user documents")
+):
+    """Streamed; send Accept: application/x-ndjson for one user per line"""
     try:
-        users = await UserService.get_all_users(role)
-        return {"users": users}
+        query = UserService.users_query(role, None if full else USER_SUMMARY_FIELDS)
+        return await stream_list(request, "users", query)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -42,6 +70,133 @@ async def get_system_metrics(current_user: dict = Depends(get_current_admin)):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/system/metrics/stream")
+async def stream_system_metrics(current_user: dict = Depends(get_current_admin)):
+    """Server-Sent Events: a "sample" event with each system metrics sample this worker takes"""
+    return system_metrics_feed.response()
+
+@router.get("/system/memory")
+async def get_memory_report(
+    top: int = Query(20, ge=1, le=200),
+    current_user: dict = Depends(get_current_admin)
+):
+    """
+    RSS, model parameter bytes, in-process cache sizes, tracemalloc top sites
+    (growth since the previous report) and peak allocation of recent analytics calls
+    """
+    return await asyncio.to_thread(MemoryReportService.get_memory_report, top)
+
+@router.post("/system/memory/tracemalloc/start")
+async def start_tracemalloc(
+    frames: int = Query(settings.MEMORY_TRACEMALLOC_FRAMES, ge=1, le=50),
+    current_user: dict = Depends(get_current_admin)
+):
+    memory_tracking.start_tracing(frames)
+    return {"message": "tracemalloc started", "frames": frames}
+
+@router.post("/system/memory/tracemalloc/stop")
+async def stop_tracemalloc(current_user: dict = Depends(get_current_admin)):
+    memory_tracking.stop_tracing()
+    return {"message": "tracemalloc stopped"}
+
+@router.get("/system/metrics/history")
+async def get_system_metrics_history(
+    resolution: str = Query("1m", description="raw, 1m or 1h"),
+    hours: int = Query(24, ge=1, le=168),
+    current_user: dict = Depends(get_current_admin)
+):
+    """Recent samples from this worker's in-memory metrics buffer"""
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {list(RESOLUTIONS)}")
+    return {
+        "resolution": resolution,
+        "metrics": SystemMonitoringService.get_history(resolution, hours)
+    }
+
+@router.get("/system/sampler")
+async def get_sampler_stats(current_user: dict = Depends(get_current_admin)):
+    """Overhead of the metrics sampler (loop time vs worker-thread time)"""
+    return SystemMonitoringService.get_sampler_stats()
+
+@router.get("/system/requests")
+async def get_request_metrics(current_user: dict = Depends(get_current_admin)):
+    """Per-route request counts, status classes and p50/p95/p99 latency for this worker"""
+    return request_metrics.summary()
+
+@router.get("/system/loop-lag")
+async def get_loop_lag(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_admin)
+):
+    """Event-loop lag and the handlers/call sites that blocked the loop the longest"""
+    return loop_monitor.summary(limit)
+
+@router.post("/system/loop-lag/reset")
+async def reset_loop_lag(current_user: dict = Depends(get_current_admin)):
+    loop_monitor.reset()
+    return {"message": "Loop stall statistics reset"}
+
+@router.get("/system/profile")
+async def run_profile(
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    mode: str = Query("wall", description="wall or cpu"),
+    format: str = Query("json", description="json or collapsed"),
+    limit: int = Query(30, ge=1, le=200),
+    current_user: dict = Depends(get_current_admin)
+):
+    """Sample every thread of this worker for `seconds`; returns top functions and collapsed stacks"""
+    if seconds > settings.PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be at most {settings.PROFILER_MAX_SECONDS}")
+    try:
+        result = await asyncio.to_thread(profiler.profile, seconds, interval_ms / 1000, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if format == "collapsed":
+        return PlainTextResponse(result.collapsed())
+    return {"seconds": seconds, "interval_ms": interval_ms, **result.summary(limit, interval_ms / 1000)}
+
+@router.get("/system/profile/continuous")
+async def get_continuous_profile(
+    route: Optional[str] = Query(None, description='e.g. "POST /api/v1/customers/loans/apply-package"'),
+    limit: int = Query(20, ge=1, le=200),
+    current_user: dict = Depends(get_current_admin)
+):
+    """Per-route CPU profile aggregated by the continuous profiler"""
+    return profiler.continuous_profiler.summary(route, limit)
+
+@router.post("/system/profile/continuous/start")
+async def start_continuous_profile(
+    request: Request,
+    interval_ms: float = Query(settings.PROFILER_CONTINUOUS_INTERVAL_SECONDS * 1000, ge=10, le=10000),
+    current_user: dict = Depends(get_current_admin)
+):
+    profiler.continuous_profiler.start(request.app.routes, interval_ms / 1000)
+    return {"message": "Continuous profiler started", "interval_ms": interval_ms}
+
+@router.post("/system/profile/continuous/stop")
+async def stop_continuous_profile(
+    reset: bool = Query(False),
+    current_user: dict = Depends(get_current_admin)
+):
+    profiler.continuous_profiler.stop()
+    if reset:
+        profiler.continuous_profiler.reset()
+    return {"message": "Continuous profiler stopped"}
+
+@router.get("/system/logging")
+async def get_logging_stats(current_user: dict = Depends(get_current_admin)):
+    """Log levels, debug sampling rate and queue/drop counters of this worker"""
+    return logging_stats()
+
+@router.get("/system/tracing")
+async def get_tracing_stats(current_user: dict = Depends(get_current_admin)):
+    """Trace sampling rate and exporter queue/throughput for this worker"""
+    return trace_exporter.stats()
+
 @router.get("/system/analytics")
 async def get_system_analytics(current_user: dict = Depends(get_current_admin)):
     try:
@@ -50,10 +205,55 @@ async def get_system_analytics(current_user: dict = Depends(get_current_admin)):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/system/risk")
+async def get_system_risk_analysis(current_user: dict = Depends(get_current_admin)):
+    try:
+        return await AnalyticsService.get_system_risk_analysis()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/system/cohorts")
+async def get_cohort_analysis(
+    current_user: dict = Depends(get_current_admin),
+    group_by: str = Query("bank_id", description="Second cohort key: credit_grade, package_id or bank_id"),
+    refresh: bool = Query(False, description="Drop cached closed cohorts and recompute everything")
+):
+    try:
+        return await CohortAnalyticsService.get_cohort_analysis(group_by, refresh=refresh)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/system/delinquency-sweep")
+async def run_delinquency_sweep(current_user: dict = Depends(get_current_admin)):
+    try:
+        result = await asyncio.to_thread(DelinquencyService.run_sweep)
+        return {"message": "Delinquency sweep completed", **result}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/system/collect-metrics")
 async def collect_system_metrics(current_user: dict = Depends(get_current_admin)):
     try:
         metrics = await SystemMonitoringService.collect_system_metrics()
         return {"message": "Metrics collected", "metrics": metrics}
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/system/model-performance")
+async def get_model_performance(
+    current_user: dict = Depends(get_current_admin),
+    model_version: Optional[str] = Query(None, description="Model version, e.g. cnn-v1"),
+    month: Optional[str] = Query(None, description="Outcome month as YYYY-MM")
+):
+    try:
+        return await ModelPerformanceService.get_model_performance(model_version, month)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/system/model-performance/rebuild")
+async def rebuild_model_performance(current_user: dict = Depends(get_current_admin)):
+    try:
+        result = await ModelPerformanceService.rebuild()
+        return {"message": "Model performance rebuilt", **result}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -4,6 +4,9 @@ from app.utils.auth_utils import verify_token
 from app.services.user_service import UserService
 from app.models.user_models import UserCreate
 from app.firebase_admin import auth as firebase_auth
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -37,7 +40,7 @@ async def register_user(
         return {"message": "User registered successfully", "user": user}
     
     except Exception as e:
-        print(e)
+        logger.warning("Registration failed: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/me")
@@ -1,19 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from app.middleware.auth_middleware import get_current_bank
 from app.services.loan_service import LoanService
 from app.services.analytics_service import AnalyticsService
+from app.services.stress_test_service import StressTestService
+from app.services.cohort_service import CohortAnalyticsService
+from app.services.delinquency_service import DelinquencyService
+from app.services.live_feeds import pending_loans_feed
+from app.models.analytics_models import StressTestScenario
+from app.models.response_models import ActiveLoansResponse, LoanChangesResponse, PendingLoansResponse, LOAN_SUMMARY_FIELDS
+from app.models.user_models import LoanStatus
+from app.utils.json_responses import FastJSONResponse, stream_list, wants_ndjson
+from app.utils.conditional_get import list_version
 from typing import List, Optional
+from datetime import datetime
 
 router = APIRouter()
 
-@router.get("/loans/pending")
-async def get_pending_loans(current_user: dict = Depends(get_current_bank)):
+@router.get("/loans/pending", response_model=PendingLoansResponse)
+async def get_pending_loans(
+    request: Request,
+    current_user: dict = Depends(get_current_bank),
+    full: bool = Query(False, description="Return whole loan documents, including payment schedules")
+):
+    """Streamed; send Accept: application/x-ndjson for one loan per line"""
     try:
-        loans = await LoanService.get_pending_loans()
-        return {"pending_loans": loans}
+        # A loan leaves the queue when any bank processes it, so the version covers every loan
+        version = await list_version(LoanService.loans_query(), "pending", full, wants_ndjson(request))
+        if version.matches(request):
+            return version.not_modified()
+        query = LoanService.pending_loans_query(None if full else LOAN_SUMMARY_FIELDS)
+        return version.apply(await stream_list(request, "pending_loans", query))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/loans/pending/stream")
+async def stream_pending_loans(current_user: dict = Depends(get_current_bank)):
+    """
+    Server-Sent Events: the pending queue as a "snapshot" event, then
+    "loan.added", "loan.updated" and "loan.removed" as it changes
+    """
+    return pending_loans_feed.response()
+
 @router.post("/loans/{loan_id}/approve")
 async def approve_loan(
     loan_id: str,
@@ -36,6 +63,17 @@ async def reject_loan(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/loans/{loan_id}/default")
+async def mark_loan_defaulted(
+    loan_id: str,
+    current_user: dict = Depends(get_current_bank)
+):
+    try:
+        result = await LoanService.mark_loan_defaulted(loan_id, current_user['user_id'])
+        return {"message": "Loan marked as defaulted", **result}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/dashboard")
 async def get_bank_dashboard(
     current_user: dict = Depends(get_current_bank),
@@ -47,13 +85,41 @@ async def get_bank_dashboard(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/loans/active")
-async def get_active_loans(current_user: dict = Depends(get_current_bank)):
+@router.get("/loans/active", response_model=ActiveLoansResponse)
+async def get_active_loans(
+    request: Request,
+    current_user: dict = Depends(get_current_bank),
+    full: bool = Query(False, description="Return whole loan documents, including payment schedules")
+):
+    """Streamed; send Accept: application/x-ndjson for one loan per line"""
     try:
         # Get loans managed by this bank
-        from app.firebase_admin import loans_ref
-        loans = loans_ref.where("bank_id", "==", current_user['user_id']).where("status", "in", ["active", "approved"]).stream()
-        return {"active_loans": [loan.to_dict() for loan in loans]}
+        version = await list_version(
+            LoanService.bank_loans_query(current_user['user_id']), current_user['user_id'], full, wants_ndjson(request)
+        )
+        if version.matches(request):
+            return version.not_modified()
+        query = LoanService.bank_active_loans_query(current_user['user_id'], None if full else LOAN_SUMMARY_FIELDS)
+        return version.apply(await stream_list(request, "active_loans", query))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/loans/active/changes", response_model=LoanChangesResponse)
+async def get_active_loan_changes(
+    current_user: dict = Depends(get_current_bank),
+    since: Optional[datetime] = Query(None, description="Watermark from the previous call; omit for a full sync"),
+    full: bool = Query(False, description="Return whole loan documents, including payment schedules")
+):
+    """
+    Changes to GET /loans/active since the watermark: loans that were added
+    or updated, and under `removed` those that were paid off or defaulted
+    """
+    try:
+        changes = await LoanService.get_loan_changes(
+            LoanService.bank_loans_query(current_user['user_id']), since,
+            statuses=[LoanStatus.ACTIVE, LoanStatus.APPROVED], fields=None if full else LOAN_SUMMARY_FIELDS
+        )
+        return FastJSONResponse(changes)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -66,6 +132,31 @@ async def get_risk_analysis(current_user: dict = Depends(get_current_bank)):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/analytics/stress-test")
+async def run_stress_test(
+    scenario: StressTestScenario,
+    current_user: dict = Depends(get_current_bank)
+):
+    """Monte Carlo stress test of the bank's active portfolio (loss distribution, VaR, expected shortfall)"""
+    try:
+        return await StressTestService.run_stress_test(current_user['user_id'], scenario)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/analytics/cohorts")
+async def get_cohort_analysis(
+    current_user: dict = Depends(get_current_bank),
+    group_by: str = Query("credit_grade", description="Second cohort key: credit_grade or package_id"),
+    refresh: bool = Query(False, description="Drop cached closed cohorts and recompute everything")
+):
+    """Cumulative default/paid curves by origination month and months-on-book"""
+    try:
+        if group_by == "bank_id":
+            raise ValueError("group_by must be credit_grade or package_id")
+        return await CohortAnalyticsService.get_cohort_analysis(group_by, current_user['user_id'], refresh)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/analytics/performance")
 async def get_performance_metrics(current_user: dict = Depends(get_current_bank)):
     """Get performance metrics for the bank's loan portfolio"""
@@ -79,8 +170,7 @@ async def get_performance_metrics(current_user: dict = Depends(get_current_bank)
 async def get_overdue_loans(current_user: dict = Depends(get_current_bank)):
     """Get loans that are overdue on payments"""
     try:
-        # This would require checking repayment schedules
-        # For now, return empty as placeholder
-        return {"overdue_loans": []}
+        overdue_loans = await DelinquencyService.get_overdue_loans(current_user['user_id'])
+        return {"overdue_loans": overdue_loans}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
 from app.middleware.auth_middleware import get_current_customer
 from app.services.user_service import UserService
 from app.services.loan_service import LoanService
 from app.models.user_models import UserUpdate
 from app.models.loan_models import LoanApplication, LoanApplicationWithPackage, RepaymentRequest
-from typing import List
+from app.models.response_models import LoanChangesResponse, UserLoansResponse, LOAN_SUMMARY_FIELDS
+from app.utils.idempotency import run_idempotent
+from app.utils.json_responses import FastJSONResponse, stream_list, wants_ndjson
+from app.utils.conditional_get import list_version
+from typing import List, Optional
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -23,51 +31,105 @@ async def update_customer_profile(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def _mark_replayed(response: Response, replayed: bool):
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+
 @router.post("/loans/apply")
 async def apply_for_loan(
     application: LoanApplication,
-    current_user: dict = Depends(get_current_customer)
+    response: Response,
+    current_user: dict = Depends(get_current_customer),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """Apply for a loan with custom parameters"""
     try:
-        result = await LoanService.apply_for_loan(application, current_user['user_id'])
+        result, replayed = await run_idempotent(
+            idempotency_key, current_user['user_id'], "loans.apply", application,
+            lambda: LoanService.apply_for_loan(application, current_user['user_id'])
+        )
+        _mark_replayed(response, replayed)
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/loans/apply-package")
 async def apply_for_loan_with_package(
     application: LoanApplicationWithPackage,
-    current_user: dict = Depends(get_current_customer)
+    response: Response,
+    current_user: dict = Depends(get_current_customer),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """Apply for a loan using a pre-defined package"""
     try:
-        result = await LoanService.apply_for_loan_with_package(application, current_user['user_id'])
+        result, replayed = await run_idempotent(
+            idempotency_key, current_user['user_id'], "loans.apply_package", application,
+            lambda: LoanService.apply_for_loan_with_package(application, current_user['user_id'])
+        )
+        _mark_replayed(response, replayed)
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/loans")
-async def get_my_loans(current_user: dict = Depends(get_current_customer)):
+@router.get("/loans", response_model=UserLoansResponse)
+async def get_my_loans(
+    request: Request,
+    current_user: dict = Depends(get_current_customer),
+    full: bool = Query(False, description="Return whole loan documents, including payment schedules")
+):
+    """Streamed; send Accept: application/x-ndjson for one loan per line"""
     try:
-        print(f"Current user: {current_user}")  # Debug: see what user data looks like
-        print(f"User ID: {current_user.get('user_id')}")
-        print(f"User role: {current_user.get('role')}")
+        logger.debug("Listing loans", extra={"user_id": current_user.get('user_id')})
         
-        loans = await LoanService.get_user_loans(current_user['user_id'])
-        return {"loans": loans}
+        version = await list_version(
+            LoanService.user_loans_query(current_user['user_id']), current_user['user_id'], full, wants_ndjson(request)
+        )
+        if version.matches(request):
+            return version.not_modified()
+        query = LoanService.user_loans_query(current_user['user_id'], None if full else LOAN_SUMMARY_FIELDS)
+        return version.apply(await stream_list(request, "loans", query))
+    except Exception as e:
+        logger.exception("Error in get_my_loans", extra={"user_id": current_user.get('user_id')})
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/loans/changes", response_model=LoanChangesResponse)
+async def get_my_loan_changes(
+    current_user: dict = Depends(get_current_customer),
+    since: Optional[datetime] = Query(None, description="Watermark from the previous call; omit for a full sync"),
+    full: bool = Query(False, description="Return whole loan documents, including payment schedules")
+):
+    """Loans changed since the watermark, for clients that cache GET /loans"""
+    try:
+        changes = await LoanService.get_loan_changes(
+            LoanService.user_loans_query(current_user['user_id']), since, fields=None if full else LOAN_SUMMARY_FIELDS
+        )
+        return FastJSONResponse(changes)
     except Exception as e:
-        print(f"Error in get_my_loans: {str(e)}")  # Better error logging
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/loans/{loan_id}/repay")
 async def repay_loan(
     loan_id: str,
     repayment: RepaymentRequest,
-    current_user: dict = Depends(get_current_customer)
+    response: Response,
+    current_user: dict = Depends(get_current_customer),
+    idempotency_key: Optional[str] = Header(None)
 ):
-    try:
-        result = await LoanService.make_repayment(loan_id, repayment)
+    async def repay():
+        result = await LoanService.make_repayment(loan_id, repayment, current_user)
         return {"message": "Payment successful", **result}
+    
+    try:
+        result, replayed = await run_idempotent(
+            idempotency_key, current_user['user_id'], f"loans.{loan_id}.repay", repayment, repay
+        )
+        _mark_replayed(response, replayed)
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from app.middleware.auth_middleware import get_current_bank
 from app.services.loan_package_service import LoanPackageService
 from app.models.user_models import LoanPackageCreate
+from app.utils.conditional_get import list_version
 
 router = APIRouter()
 
@@ -18,18 +19,28 @@ async def create_loan_package(
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/packages")
-async def get_loan_packages(current_user: dict = Depends(get_current_bank)):
+async def get_loan_packages(request: Request, response: Response, current_user: dict = Depends(get_current_bank)):
     """Get loan packages for the current bank"""
     try:
+        version = await list_version(
+            LoanPackageService.packages_query(current_user['user_id'], active_only=False), current_user['user_id']
+        )
+        if version.matches(request):
+            return version.not_modified()
+        version.apply(response)
         packages = await LoanPackageService.get_loan_packages(current_user['user_id'])
         return {"packages": packages}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/packages/all")
-async def get_all_loan_packages():
+async def get_all_loan_packages(request: Request, response: Response):
     """Get all active loan packages (for customers)"""
     try:
+        version = await list_version(LoanPackageService.packages_query(active_only=False), "all")
+        if version.matches(request):
+            return version.not_modified()
+        version.apply(response)
         packages = await LoanPackageService.get_loan_packages()
         return {"packages": packages}
     except Exception as e:
@@ -0,0 +1,235 @@
+"""
+Prefork production server.
+
+    python -m app.serve --workers 4 --port 8000
+
+The parent imports TensorFlow and the rest of the heavy libraries, loads the
+scaler, freezes the GC and binds the listening socket once, then forks the
+workers. Everything loaded before the fork is shared copy-on-write. Each
+worker then pins its TensorFlow thread pools, loads the model weights,
+imports the app - which creates its Firebase/Firestore clients - and runs
+uvicorn on the shared socket. The parent only supervises: it restarts
+workers that die and forwards SIGTERM/SIGINT for a graceful shutdown.
+
+Background jobs that must run once per deployment (SINGLETON_JOBS_ENABLED:
+the delinquency sweep, metrics rollup persistence, the outbox sweep) run in
+worker 0 only; the other workers serve requests and sample their own metrics.
+
+TensorFlow's runtime is not fork-safe: once it has run an op (building or
+loading a model does) a forked child hangs on its first prediction. The
+parent therefore only imports it; the weights themselves are materialised
+per worker. For the same reason the parent never imports app.firebase_admin,
+whose gRPC channels must not cross a fork.
+
+With INFERENCE_WORKERS > 0 the model runs in a separate pool of spawned
+processes instead (app.utils.inference_pool). The parent starts the pool
+before forking and never imports TensorFlow; each API worker owns a fixed
+slice of the pool's shared memory, which a respawned worker takes over.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Respawning faster than this means the worker is crash-looping
+MIN_WORKER_LIFETIME_SECONDS = 5.0
+SHUTDOWN_TIMEOUT_SECONDS = 30.0
+
+def preload():
+    """Import and load everything that is safe to share with forked workers"""
+    pooled = settings.INFERENCE_WORKERS > 0
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(settings.TF_INTRA_OP_THREADS))
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", str(settings.TF_INTER_OP_THREADS))
+    started = time.perf_counter()
+
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import sklearn.preprocessing  # noqa: F401
+    import fastapi  # noqa: F401
+    import uvicorn  # noqa: F401
+    from app.utils import model_utils
+    if not pooled:
+        # Import only: no TF op runs here with MODEL_LOAD_ON_IMPORT off
+        import tensorflow  # noqa: F401
+        model_utils.load_scaler()
+    if model_utils.model is not None:
+        raise RuntimeError("The model was loaded before forking")
+
+    # Objects that survive to here live as long as the workers: keep the
+    # collector from touching (and so copying) their pages
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded in %.2fs", time.perf_counter() - started)
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(sock: socket.socket, args, pool, index: int):
+    """Body of a forked worker; never returns"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.unfreeze()
+    # A respawned worker keeps its index, so exactly one worker runs them
+    settings.SINGLETON_JOBS_ENABLED = settings.SINGLETON_JOBS_ENABLED and index == 0
+
+    from app.utils.logging_config import configure_logging
+    configure_logging()
+
+    import uvicorn
+    if pool is not None:
+        from app.utils import inference_pool
+        inference_pool.attach(pool, index)
+    else:
+        from app.utils import model_utils
+        model_utils.configure_threads(settings.TF_INTRA_OP_THREADS, settings.TF_INTER_OP_THREADS)
+        model_utils.load_model()
+    from app.main import app
+
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        log_config=None,
+        access_log=args.access_log,
+        timeout_keep_alive=args.timeout_keep_alive,
+        timeout_graceful_shutdown=SHUTDOWN_TIMEOUT_SECONDS
+    )
+    server = uvicorn.Server(config)
+    exit_code = 0
+    try:
+        server.run(sockets=[sock])
+    except Exception:
+        logger.exception("Worker crashed")
+        exit_code = 1
+    finally:
+        from app.utils.logging_config import shutdown_logging
+        shutdown_logging()
+    os._exit(exit_code)
+
+class Supervisor:
+
+    def __init__(self, sock: socket.socket, args, pool=None):
+        self.sock = sock
+        self.args = args
+        self.pool = pool
+        self.workers = {}  # pid -> (index, start time)
+        self.stopping = False
+
+    def spawn(self, index: int):
+        from app.utils.logging_config import configure_logging, shutdown_logging
+        # No writer thread may be running across the fork
+        shutdown_logging()
+        pid = os.fork()
+        if pid == 0:
+            run_worker(self.sock, self.args, self.pool, index)
+        configure_logging(force=True)
+        self.workers[pid] = (index, time.monotonic())
+        logger.info("Started worker %d", pid)
+
+    def stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info("Received signal %d, stopping %d workers", signum, len(self.workers))
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.args.workers):
+            self.spawn(index)
+
+        deadline = None
+        while self.workers:
+            if self.stopping and deadline is None:
+                deadline = time.monotonic() + SHUTDOWN_TIMEOUT_SECONDS + 5
+            if deadline is not None and time.monotonic() > deadline:
+                for pid in self.workers:
+                    os.kill(pid, signal.SIGKILL)
+                deadline = float("inf")
+
+            exited = self.reap()
+            if exited is None:
+                if self.pool is not None and not self.stopping:
+                    self.pool.check_workers()
+                time.sleep(0.2)
+                continue
+
+            pid, status = exited
+            index, started = self.workers.pop(pid)
+            if self.stopping:
+                continue
+            lifetime = time.monotonic() - started
+            logger.error("Worker %d exited with status %d after %.0fs", pid, os.waitstatus_to_exitcode(status), lifetime)
+            if lifetime < MIN_WORKER_LIFETIME_SECONDS:
+                # Crash loop (bad config, port, credentials): back off instead of forking hot
+                time.sleep(MIN_WORKER_LIFETIME_SECONDS)
+            if not self.stopping:
+                self.spawn(index)
+
+        logger.info("All workers stopped")
+        return 0
+
+    def reap(self):
+        """(pid, status) of an exited API worker, or None. Only our own pids are
+        waited on: the inference pool's processes are reaped by multiprocessing."""
+        for pid in list(self.workers):
+            try:
+                waited, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return pid, 0
+            if waited:
+                return waited, status
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.SERVE_WORKERS)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--timeout-keep-alive", type=int, default=5)
+    parser.add_argument("--access-log", action="store_true")
+    args = parser.parse_args()
+
+    # Workers load the model themselves, after the fork
+    settings.MODEL_LOAD_ON_IMPORT = False
+    # Each worker starts its own simulation pool; together they should not exceed the cores
+    if not settings.STRESS_TEST_WORKERS:
+        settings.STRESS_TEST_WORKERS = max(1, (os.cpu_count() or 1) // args.workers)
+    from app.utils.logging_config import configure_logging
+    configure_logging()
+    preload()
+    pool = None
+    if settings.INFERENCE_WORKERS > 0:
+        from app.utils import inference_pool
+        pool = inference_pool.create_pool(api_processes=args.workers)
+        pool.start()
+    sock = bind_socket(args.host, args.port, args.backlog)
+    logger.info("Listening on %s:%d with %d workers", args.host, args.port, args.workers)
+    try:
+        exit_code = Supervisor(sock, args, pool).run()
+    finally:
+        if pool is not None:
+            pool.stop()
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,23 @@
 from app.firebase_admin import loans_ref, users_ref, repayments_ref, db
 from app.models.analytics_models import BankAnalytics, SystemAnalytics
 from app.models.user_models import CreditGrade, LoanStatus
+from app.services.model_performance_service import ModelPerformanceService
+from app.services.risk_aggregation_service import RiskAggregationService
+from app.services.delinquency_service import DelinquencyService
+from app.config import settings
+from app.middleware.metrics_middleware import request_metrics
+from app.utils.memory_tracking import track_peak
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import statistics
+import logging
+
+logger = logging.getLogger(__name__)
 
 class AnalyticsService:
     
     @staticmethod
+    @track_peak("AnalyticsService.get_bank_analytics")
     async def get_bank_analytics(bank_id: str, time_period: str = "30d") -> BankAnalytics:
         """
         Get comprehensive analytics for a bank
@@ -108,6 +118,7 @@ class AnalyticsService:
         return trends
     
     @staticmethod
+    @track_peak("AnalyticsService.get_system_analytics")
     async def get_system_analytics() -> SystemAnalytics:
         """Get system-wide analytics for admin dashboard"""
         # User statistics
@@ -144,12 +155,20 @@ class AnalyticsService:
         loan_default_probs = [loan.get('default_probability', 0) for loan in loans]
         avg_default_prob = statistics.mean(loan_default_probs) if loan_default_probs else 0
         
+        # Model performance from the outcome tracker
+        try:
+            model_performance = await ModelPerformanceService.get_model_performance(settings.MODEL_VERSION)
+        except Exception as e:
+            logger.warning("Error reading model performance: %s", e)
+            model_performance = {"accuracy": None, "auc": None}
+        
         return SystemAnalytics(
             total_users=total_users,
             total_loans=total_loans,
             system_uptime=AnalyticsService._get_system_uptime(),
-            model_accuracy=AnalyticsService._calculate_model_accuracy(),
-            avg_response_time=0.15,  # Placeholder - would need actual measurement
+            model_accuracy=model_performance["accuracy"],
+            model_auc=model_performance["auc"],
+            avg_response_time=request_metrics.average_response_time(),
             active_loans=active_loans,
             total_loan_volume=total_loan_volume,
             customer_count=len(customers),
@@ -170,100 +189,33 @@ class AnalyticsService:
         return 99.8
     
     @staticmethod
-    def _calculate_model_accuracy() -> Optional[float]:
-        """
-        Calculate model accuracy by comparing predictions with actual outcomes
-        This requires historical data with actual default outcomes
-        """
-        try:
-            # Get loans that have been completed (paid or defaulted)
-            completed_loans = loans_ref.where("status", "in", [LoanStatus.PAID, LoanStatus.DEFAULTED]).stream()
-            completed_loans_data = [loan.to_dict() for loan in completed_loans]
-            
-            if not completed_loans_data:
-                return None
-            
-            correct_predictions = 0
-            total_completed = 0
-            
-            for loan in completed_loans_data:
-                predicted_default_prob = loan.get('default_probability', 0.5)
-                actual_default = loan.get('status') == LoanStatus.DEFAULTED
-                
-                # Consider prediction correct if:
-                # - Default predicted (prob > 0.5) and actually defaulted
-                # - No default predicted (prob <= 0.5) and actually paid
-                predicted_default = predicted_default_prob > 0.5
-                if predicted_default == actual_default:
-                    correct_predictions += 1
-                
-                total_completed += 1
-            
-            return (correct_predictions / total_completed) * 100 if total_completed > 0 else None
-        
-        except Exception as e:
-            print(f"Error calculating model accuracy: {e}")
-            return None
-    
-    @staticmethod
+    @track_peak("AnalyticsService.get_risk_analysis")
     async def get_risk_analysis(bank_id: Optional[str] = None) -> Dict:
         """
         Get detailed risk analysis for loans
+        Streams the loans once through a RiskAggregator (bands from settings.RISK_BANDS)
         """
         if bank_id:
-            loans_query = loans_ref.where("bank_id", "==", bank_id)
+            aggregator = await RiskAggregationService.get_bank_risk(bank_id)
         else:
-            loans_query = loans_ref
-        
-        loans = [loan.to_dict() for loan in loans_query.stream()]
-        
-        if not loans:
-            return {
-                "high_risk_loans": 0,
-                "medium_risk_loans": 0,
-                "low_risk_loans": 0,
-                "average_risk_score": 0,
-                "risk_by_grade": {}
-            }
-        
-        # Categorize loans by risk
-        high_risk = [loan for loan in loans if loan.get('default_probability', 0) > 0.7]
-        medium_risk = [loan for loan in loans if 0.3 < loan.get('default_probability', 0) <= 0.7]
-        low_risk = [loan for loan in loans if loan.get('default_probability', 0) <= 0.3]
-        
-        # Average risk score
-        avg_risk_score = statistics.mean([loan.get('default_probability', 0) for loan in loans])
-        
-        # Risk distribution by credit grade
-        risk_by_grade = {}
-        for loan in loans:
-            grade = loan.get('credit_grade', 'unknown')
-            if grade not in risk_by_grade:
-                risk_by_grade[grade] = {
-                    "count": 0,
-                    "avg_risk": 0,
-                    "total_volume": 0
-                }
-            
-            risk_by_grade[grade]["count"] += 1
-            risk_by_grade[grade]["avg_risk"] += loan.get('default_probability', 0)
-            risk_by_grade[grade]["total_volume"] += loan['application_data']['loan_amount']
-        
-        # Calculate averages
-        for grade in risk_by_grade:
-            risk_by_grade[grade]["avg_risk"] /= risk_by_grade[grade]["count"]
+            aggregator, _ = await RiskAggregationService.get_system_risk()
         
+        return aggregator.summary()
+    
+    @staticmethod
+    @track_peak("AnalyticsService.get_system_risk_analysis")
+    async def get_system_risk_analysis() -> Dict:
+        """
+        Get system-wide risk analysis together with the per-bank breakdown it was merged from
+        """
+        system, per_bank = await RiskAggregationService.get_system_risk()
         return {
-            "high_risk_loans": len(high_risk),
-            "medium_risk_loans": len(medium_risk),
-            "low_risk_loans": len(low_risk),
-            "average_risk_score": avg_risk_score,
-            "risk_by_grade": risk_by_grade,
-            "high_risk_volume": sum(loan['application_data']['loan_amount'] for loan in high_risk),
-            "total_analyzed_loans": len(loans)
+            **system.summary(),
+            "banks": {bank_id: aggregator.summary() for bank_id, aggregator in per_bank.items()}
         }
     
     @staticmethod
+    @track_peak("AnalyticsService.get_performance_metrics")
     async def get_performance_metrics(bank_id: str) -> Dict:
         """
         Get performance metrics for a bank's loan portfolio
@@ -284,8 +236,10 @@ class AnalyticsService:
         defaulted_loans = [loan for loan in bank_loans_data if loan.get('status') == LoanStatus.DEFAULTED]
         recovered_amount = 0  # This would come from recovery records
         
-        # Delinquency rate (loans with late payments)
-        # This would require payment history analysis
+        # Delinquency rate from the counter maintained by the delinquency sweep
+        open_loans = len([loan for loan in bank_loans_data if loan.get('status') in [LoanStatus.ACTIVE, LoanStatus.APPROVED]])
+        delinquent_loans = DelinquencyService.get_delinquent_count(bank_id)
+        delinquency_rate = (delinquent_loans / open_loans) * 100 if open_loans > 0 else 0
         
         # Average time to approval
         approved_loans = [loan for loan in bank_loans_data if loan.get('status') in [LoanStatus.APPROVED, LoanStatus.ACTIVE, LoanStatus.PAID]]
@@ -317,7 +271,8 @@ class AnalyticsService:
         return {
             "portfolio_health": portfolio_health,
             "recovery_rate": (recovered_amount / sum(loan['application_data']['loan_amount'] for loan in defaulted_loans)) * 100 if defaulted_loans else 0,
-            "delinquency_rate": 0,  # Placeholder
+            "delinquency_rate": delinquency_rate,
+            "delinquent_loans": delinquent_loans,
             "avg_time_to_approval": avg_approval_time,
             "customer_satisfaction_score": 85,  # Placeholder - would come from surveys
             "default_rate": default_rate,
@@ -0,0 +1,181 @@
+from app.firebase_admin import loans_ref
+from app.models.user_models import LoanStatus
+from app.utils.firestore_utils import to_naive_utc
+from app.utils.memory_tracking import track_peak
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+
+COHORT_KEYS = ["credit_grade", "package_id", "bank_id"]
+
+# A cohort is closed once its month is over and none of its loans can change outcome
+TERMINAL_STATUSES = [LoanStatus.PAID, LoanStatus.DEFAULTED, LoanStatus.REJECTED]
+
+COHORT_FIELDS = [
+    "created_at",
+    "status",
+    "paid_at",
+    "defaulted_at",
+    "updated_at",
+    "credit_grade",
+    "package_id",
+    "bank_id",
+    "application_data.loan_amount"
+]
+
+# (bank_id or "system", group_by) -> {"open_from": datetime | None, "closed": {cohort: [rows]}}
+_cohort_cache: Dict[Tuple[str, str], Dict] = {}
+
+class CohortAnalyticsService:
+
+    @staticmethod
+    def _load_frame(bank_id: Optional[str], group_by: str, created_from: Optional[datetime]) -> pd.DataFrame:
+        query = loans_ref
+        if bank_id:
+            query = query.where("bank_id", "==", bank_id)
+        if created_from:
+            query = query.where("created_at", ">=", created_from)
+
+        rows = []
+        for loan in query.select(COHORT_FIELDS).stream():
+            loan_data = loan.to_dict()
+            status = loan_data.get('status')
+            if status == LoanStatus.DEFAULTED:
+                outcome_date = loan_data.get('defaulted_at') or loan_data.get('updated_at')
+            elif status == LoanStatus.PAID:
+                outcome_date = loan_data.get('paid_at') or loan_data.get('updated_at')
+            else:
+                outcome_date = None
+            rows.append((
+                to_naive_utc(loan_data.get('created_at')),
+                str(status.value if isinstance(status, LoanStatus) else status),
+                to_naive_utc(outcome_date),
+                loan_data.get(group_by) or 'unknown',
+                (loan_data.get('application_data') or {}).get('loan_amount', 0) or 0
+            ))
+
+        frame = pd.DataFrame(rows, columns=["created_at", "status", "outcome_date", "key", "amount"])
+        return frame.dropna(subset=["created_at"])
+
+    @staticmethod
+    def _build_cohorts(frame: pd.DataFrame, now: datetime) -> Dict[str, List[Dict]]:
+        """Cumulative default/paid curves by months-on-book for every (cohort, key) in one pass"""
+        if frame.empty:
+            return {}
+
+        current_month = pd.Period(now, freq="M")
+        created = pd.to_datetime(frame["created_at"])
+        outcome = pd.to_datetime(frame["outcome_date"])
+        frame = frame.assign(
+            cohort=created.dt.to_period("M"),
+            # Months-on-book of the outcome, -1 while the loan is still open
+            mob=((outcome.dt.year - created.dt.year) * 12 + (outcome.dt.month - created.dt.month)).fillna(-1).astype(int)
+        )
+        frame["terminal"] = frame["status"].isin([status.value for status in TERMINAL_STATUSES])
+
+        groups = frame.groupby(["cohort", "key"])
+        sizes = groups.size()
+        volumes = groups["amount"].sum()
+        all_terminal = groups["terminal"].all()
+
+        max_mob = max(int((current_month - frame["cohort"].min()).n), 0)
+        mob_columns = range(max_mob + 1)
+        outcomes = frame[frame["mob"] >= 0]
+
+        curves = {}
+        for status in (LoanStatus.DEFAULTED.value, LoanStatus.PAID.value):
+            counts = outcomes[outcomes["status"] == status] \
+                .groupby(["cohort", "key", "mob"]).size() \
+                .unstack("mob", fill_value=0) \
+                .reindex(index=sizes.index, columns=mob_columns, fill_value=0) \
+                .cumsum(axis=1)
+            curves[status] = counts.div(sizes, axis=0)
+
+        cohorts: Dict[str, List[Dict]] = {}
+        for (cohort, key), size in sizes.items():
+            months_on_book = int((current_month - cohort).n)
+            cohorts.setdefault(str(cohort), []).append({
+                "cohort": str(cohort),
+                "key": key,
+                "loans": int(size),
+                "volume": float(volumes[(cohort, key)]),
+                "months_on_book": months_on_book,
+                "closed": bool(all_terminal[(cohort, key)]) and cohort < current_month,
+                "cumulative_default_rate": curves[LoanStatus.DEFAULTED.value].loc[(cohort, key)].iloc[:months_on_book + 1].round(6).tolist(),
+                "cumulative_paid_rate": curves[LoanStatus.PAID.value].loc[(cohort, key)].iloc[:months_on_book + 1].round(6).tolist()
+            })
+        return cohorts
+
+    @staticmethod
+    def _aged(row: Dict, current_month: pd.Period) -> Dict:
+        """A cached closed cohort as of this month: its curves stay flat after the last outcome"""
+        months_on_book = int((current_month - pd.Period(row["cohort"], freq="M")).n)
+        missing = months_on_book - row["months_on_book"]
+        if missing <= 0:
+            return row
+        return {
+            **row,
+            "months_on_book": months_on_book,
+            "cumulative_default_rate": row["cumulative_default_rate"] + row["cumulative_default_rate"][-1:] * missing,
+            "cumulative_paid_rate": row["cumulative_paid_rate"] + row["cumulative_paid_rate"][-1:] * missing
+        }
+
+    @staticmethod
+    @track_peak("CohortAnalyticsService.get_cohort_analysis")
+    async def get_cohort_analysis(group_by: str = "credit_grade", bank_id: Optional[str] = None, refresh: bool = False) -> Dict:
+        """
+        Vintage analysis: loans grouped by origination month and a second key.
+        Closed cohorts are cached; only loans from the earliest open cohort onward are re-read.
+        """
+        if group_by not in COHORT_KEYS:
+            raise ValueError(f"group_by must be one of {COHORT_KEYS}")
+
+        cache_key = (bank_id or "system", group_by)
+        if refresh or cache_key not in _cohort_cache:
+            _cohort_cache[cache_key] = {"open_from": None, "closed": {}}
+        cache = _cohort_cache[cache_key]
+
+        now = datetime.utcnow()
+        frame = CohortAnalyticsService._load_frame(bank_id, group_by, cache["open_from"])
+        fresh = CohortAnalyticsService._build_cohorts(frame, now)
+
+        open_cohorts = []
+        for cohort, rows in fresh.items():
+            if all(row["closed"] for row in rows):
+                cache["closed"][cohort] = rows
+            else:
+                open_cohorts.append(cohort)
+
+        # Everything before the earliest open cohort is final; future refreshes start there
+        if open_cohorts:
+            earliest_open = pd.Period(min(open_cohorts), freq="M")
+            cache["open_from"] = earliest_open.to_timestamp().to_pydatetime()
+        else:
+            cache["open_from"] = datetime(now.year, now.month, 1)
+
+        # Cached rows keep the age they had when cached; bring them up to this month
+        current_month = pd.Period(now, freq="M")
+        closed = {
+            cohort: [CohortAnalyticsService._aged(row, current_month) for row in rows]
+            for cohort, rows in cache["closed"].items()
+        }
+        cohorts = {**closed, **{cohort: fresh[cohort] for cohort in open_cohorts}}
+        return {
+            "group_by": group_by,
+            "bank_id": bank_id,
+            "generated_at": now,
+            "open_from": cache["open_from"],
+            "cached_cohorts": len(cache["closed"]),
+            "recomputed_cohorts": len(fresh),
+            "cohorts": [row for cohort in sorted(cohorts) for row in cohorts[cohort]]
+        }
+
+    @staticmethod
+    def cache_info() -> Dict:
+        return {
+            f"{scope}:{group_by}": {
+                "closed_cohorts": len(entry["closed"]),
+                "open_from": entry["open_from"]
+            }
+            for (scope, group_by), entry in _cohort_cache.items()
+        }
@@ -0,0 +1,167 @@
+from app.firebase_admin import loans_ref, users_ref
+from app.config import settings
+from app.models.user_models import LoanStatus, RepaymentStatus
+from app.utils.firestore_utils import run_transaction, to_naive_utc
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from firebase_admin import firestore
+
+OPEN_STATUSES = [LoanStatus.ACTIVE, LoanStatus.APPROVED]
+
+class DelinquencyService:
+    """
+    Overdue detection driven by the indexed `next_payment_date` field.
+
+    A loan is delinquent once `next_payment_date` is more than
+    DELINQUENCY_GRACE_DAYS in the past. The periodic sweep marks the missed
+    installments overdue, charges late fees and keeps the bank's
+    `delinquent_loans` counter in step; repayments cure the loan again.
+    """
+
+    @staticmethod
+    def _cutoff(now: Optional[datetime] = None) -> datetime:
+        return (now or datetime.utcnow()) - timedelta(days=settings.DELINQUENCY_GRACE_DAYS)
+
+    @staticmethod
+    def calculate_late_fee(amount_due: float) -> float:
+        return round(max(settings.LATE_FEE_MIN, settings.LATE_FEE_RATE * amount_due), 2)
+
+    @staticmethod
+    def days_past_due(next_payment_date, now: Optional[datetime] = None) -> int:
+        next_payment_date = to_naive_utc(next_payment_date)
+        if not next_payment_date:
+            return 0
+        return max(0, ((now or datetime.utcnow()) - next_payment_date).days)
+
+    @staticmethod
+    async def get_overdue_loans(bank_id: str) -> List[Dict]:
+        """Overdue loans of a bank - a single query on (bank_id, status, next_payment_date)"""
+        now = datetime.utcnow()
+        query = loans_ref.where("bank_id", "==", bank_id) \
+            .where("status", "in", OPEN_STATUSES) \
+            .where("next_payment_date", "<", DelinquencyService._cutoff(now)) \
+            .order_by("next_payment_date")
+
+        overdue_loans = []
+        for loan in query.stream():
+            loan_data = loan.to_dict()
+            loan_data["days_past_due"] = DelinquencyService.days_past_due(loan_data.get('next_payment_date'), now)
+            overdue_loans.append(loan_data)
+        return overdue_loans
+
+    @staticmethod
+    def _mark_overdue_installments(schedule: List[Dict], cutoff: datetime) -> float:
+        """Flag unpaid installments past the cutoff as overdue; returns the late fees charged"""
+        fees_charged = 0.0
+        for installment in schedule:
+            due_date = to_naive_utc(installment.get('due_date'))
+            if not due_date or due_date >= cutoff:
+                break
+            if installment.get('status') in [RepaymentStatus.PENDING, RepaymentStatus.PARTIAL]:
+                late_fee = DelinquencyService.calculate_late_fee(installment.get('amount_due', 0))
+                installment['status'] = RepaymentStatus.OVERDUE.value
+                installment['late_fee'] = installment.get('late_fee', 0) + late_fee
+                fees_charged += late_fee
+        return fees_charged
+
+    @staticmethod
+    def _sweep_loan(transaction, loan_ref, now: datetime, cutoff: datetime) -> Optional[Dict]:
+        """
+        Sweep one loan inside `transaction`, re-read so that concurrent sweeps
+        and repayments are serialized. None if the loan is no longer overdue.
+        """
+        loan_data = loan_ref.get(transaction=transaction).to_dict()
+        if not loan_data or loan_data.get('status') not in OPEN_STATUSES:
+            return None
+        next_payment_date = to_naive_utc(loan_data.get('next_payment_date'))
+        if not next_payment_date or next_payment_date >= cutoff:
+            return None
+
+        schedule = loan_data.get('payment_schedule') or []
+        loan_fees = DelinquencyService._mark_overdue_installments(schedule, cutoff)
+        days_past_due = DelinquencyService.days_past_due(next_payment_date, now)
+
+        updates = {"last_delinquency_sweep_at": now}
+        if days_past_due != loan_data.get('days_past_due'):
+            updates["days_past_due"] = days_past_due
+            updates["updated_at"] = now
+        if loan_fees:
+            updates["payment_schedule"] = schedule
+            updates["late_fees_outstanding"] = firestore.Increment(loan_fees)
+            updates["updated_at"] = now
+        newly_delinquent = not loan_data.get('is_delinquent')
+        if newly_delinquent:
+            updates["is_delinquent"] = True
+            updates["delinquent_since"] = now
+            updates["updated_at"] = now
+            if loan_data.get('bank_id'):
+                transaction.update(users_ref.document(loan_data['bank_id']), {
+                    "delinquent_loans": firestore.Increment(1)
+                })
+
+        transaction.update(loan_ref, updates)
+        return {"late_fees": loan_fees, "newly_delinquent": newly_delinquent}
+
+    @staticmethod
+    def run_sweep() -> Dict:
+        """
+        Mark installments overdue, charge late fees and update the per-bank counters.
+        Synchronous - run it off the event loop.
+        """
+        now = datetime.utcnow()
+        cutoff = DelinquencyService._cutoff(now)
+        query = loans_ref.where("status", "in", OPEN_STATUSES).where("next_payment_date", "<", cutoff)
+
+        swept = 0
+        newly_delinquent = 0
+        fees_charged = 0.0
+        for loan in query.select([]).stream():
+            result = run_transaction(DelinquencyService._sweep_loan, loan.reference, now, cutoff)
+            if result is None:
+                continue
+            swept += 1
+            newly_delinquent += result["newly_delinquent"]
+            fees_charged += result["late_fees"]
+
+        return {
+            "swept_loans": swept,
+            "newly_delinquent": newly_delinquent,
+            "late_fees_charged": fees_charged,
+            "swept_at": now
+        }
+
+    @staticmethod
+    def cure(loan_data: Dict, updates: Dict, batch):
+        """
+        Clear delinquency on a loan whose next payment is no longer past the cutoff.
+        `updates` is the pending loan update and is extended in place; the bank
+        counter is decremented in `batch`, which must also carry the loan update.
+        """
+        if not loan_data.get('is_delinquent'):
+            return
+
+        next_payment_date = to_naive_utc(updates.get('next_payment_date', loan_data.get('next_payment_date')))
+        paid_off = updates.get('status') == LoanStatus.PAID
+        if paid_off or not next_payment_date or next_payment_date >= DelinquencyService._cutoff():
+            updates["is_delinquent"] = False
+            updates["days_past_due"] = 0
+            updates["delinquent_since"] = None
+            if loan_data.get('bank_id'):
+                batch.update(users_ref.document(loan_data['bank_id']), {
+                    "delinquent_loans": firestore.Increment(-1)
+                })
+
+    @staticmethod
+    def release(loan_data: Dict, batch):
+        """Drop a loan that leaves the open book (e.g. defaulted) from the bank's delinquency counter, in `batch`"""
+        if loan_data.get('is_delinquent') and loan_data.get('bank_id'):
+            batch.update(users_ref.document(loan_data['bank_id']), {
+                "delinquent_loans": firestore.Increment(-1)
+            })
+
+    @staticmethod
+    def get_delinquent_count(bank_id: str) -> int:
+        bank_doc = users_ref.document(bank_id).get()
+        if not bank_doc.exists:
+            return 0
+        return max(0, bank_doc.to_dict().get('delinquent_loans', 0))
@@ -0,0 +1,87 @@
+"""
+Live feeds pushed to bank officers and admins over Server-Sent Events.
+
+The pending queue comes from one Firestore listener per process, opened
+while anyone is subscribed, instead of every client re-reading the queue:
+subscribers get it as a "snapshot" event, then "loan.added",
+"loan.updated" and "loan.removed" (approved or rejected by some bank) as
+the listener reports changes. System metrics samples are published as
+"sample" events when the sampler takes them.
+"""
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from google.cloud.firestore_v1.watch import ChangeType
+
+from app.models.response_models import LOAN_SUMMARY_FIELDS, project
+from app.services.loan_service import LoanService
+from app.utils.live_feed import LiveFeed
+from app.utils.metrics_buffer import metrics_buffer
+
+logger = logging.getLogger(__name__)
+
+class PendingLoansFeed(LiveFeed):
+
+    def __init__(self):
+        super().__init__("pending_loans", snapshot=self._current)
+        self._loans: Optional[Dict[str, Dict]] = None  # None until the listener's first snapshot
+        self._watch = None
+        self._generation = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def on_active(self):
+        self._loop = asyncio.get_running_loop()
+        self._generation += 1
+        generation = self._generation
+        # Listeners cannot project, so the full documents are summarized here
+        self._watch = LoanService.pending_loans_query().on_snapshot(
+            lambda docs, changes, read_time: self._on_snapshot(generation, changes)
+        )
+        logger.info("Pending loans listener started")
+
+    def on_idle(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+        self._loans = None
+        logger.info("Pending loans listener stopped")
+
+    def _on_snapshot(self, generation: int, changes):
+        """Runs on the listener's thread"""
+        summaries = [
+            (change.type, change.document.id, project(change.document.to_dict() or {}, LOAN_SUMMARY_FIELDS))
+            for change in changes
+        ]
+        try:
+            self._loop.call_soon_threadsafe(self._apply, generation, summaries)
+        except RuntimeError:
+            pass  # the loop closed during shutdown
+
+    def _apply(self, generation: int, changes):
+        if generation != self._generation or self._watch is None:
+            return  # from a listener that has been stopped
+        if self._loans is None:
+            self._loans = {loan_id: loan for change_type, loan_id, loan in changes if change_type != ChangeType.REMOVED}
+            self.publish(*self._current())
+            return
+        for change_type, loan_id, loan in changes:
+            if change_type == ChangeType.REMOVED:
+                self._loans.pop(loan_id, None)
+                self.publish("loan.removed", {"loan_id": loan_id})
+            else:
+                self._loans[loan_id] = loan
+                self.publish("loan.added" if change_type == ChangeType.ADDED else "loan.updated", loan)
+
+    def _current(self) -> Optional[Tuple[str, Dict]]:
+        if self._loans is None:
+            return None
+        return "snapshot", {"pending_loans": list(self._loans.values())}
+
+pending_loans_feed = PendingLoansFeed()
+
+def _latest_sample() -> Optional[Tuple[str, Dict]]:
+    sample = metrics_buffer.latest()
+    return ("sample", sample) if sample is not None else None
+
+system_metrics_feed = LiveFeed("system_metrics", snapshot=_latest_sample)
@@ -0,0 +1,69 @@
+from app.firebase_admin import users_ref
+from app.models.loan_models import LoanEventType
+from app.services.user_service import UserService
+from app.services.model_performance_service import ModelPerformanceService
+from app.utils.event_bus import event_bus
+from datetime import datetime
+from firebase_admin import firestore
+
+class LoanEventHandlers:
+    """
+    Secondary effects of the loan lifecycle, run by the event bus after the
+    loan write has committed. Each handler reads and writes through
+    `transaction`; the bus commits it together with the handler's done marker.
+    """
+
+    @staticmethod
+    def update_loan_history(event: dict, transaction):
+        """Add the loan to the applicant's history, with the re-scored credit score for package loans"""
+        payload = event['payload']
+        updates = {"loan_history": firestore.ArrayUnion([event['loan_id']])}
+        if payload.get('updated_credit_score') is not None:
+            updates["current_credit_score"] = payload['updated_credit_score']
+            updates["updated_at"] = datetime.utcnow()
+        transaction.update(users_ref.document(payload['user_id']), updates)
+
+    @staticmethod
+    def update_user_debt(event: dict, transaction):
+        """Approval adds the loan amount to the customer's debt, a repayment takes the payment off"""
+        payload = event['payload']
+        user_ref = users_ref.document(payload['user_id'])
+        user_doc = user_ref.get(transaction=transaction).to_dict()
+        if not user_doc:
+            return
+
+        delta = payload['loan_amount'] if event['type'] == LoanEventType.APPROVED else -payload['amount']
+        new_debt, new_dti = UserService.debt_after(user_doc, delta)
+        updates = {'total_debt': new_debt, 'current_dti': new_dti}
+        if event['type'] == LoanEventType.REPAID:
+            updates['updated_at'] = datetime.utcnow()
+        transaction.update(user_ref, updates)
+
+    @staticmethod
+    def update_bank_counters(event: dict, transaction):
+        if event['type'] == LoanEventType.APPROVED:
+            counters = {
+                'total_loans_approved': firestore.Increment(1),
+                'total_loans_under_management': firestore.Increment(1)
+            }
+        else:
+            counters = {'total_loans_rejected': firestore.Increment(1)}
+        transaction.update(users_ref.document(event['payload']['bank_id']), counters)
+
+    @staticmethod
+    def record_model_outcome(event: dict, transaction):
+        payload = event['payload']
+        ModelPerformanceService.add_outcome(
+            transaction,
+            {"default_probability": payload.get('default_probability'), "model_version": payload.get('model_version')},
+            defaulted=event['type'] == LoanEventType.DEFAULTED,
+            outcome_date=payload['outcome_date']
+        )
+
+event_bus.subscribe(LoanEventType.APPLIED, "loan_history", LoanEventHandlers.update_loan_history)
+event_bus.subscribe(LoanEventType.APPROVED, "user_debt", LoanEventHandlers.update_user_debt)
+event_bus.subscribe(LoanEventType.APPROVED, "bank_counters", LoanEventHandlers.update_bank_counters)
+event_bus.subscribe(LoanEventType.REJECTED, "bank_counters", LoanEventHandlers.update_bank_counters)
+event_bus.subscribe(LoanEventType.REPAID, "user_debt", LoanEventHandlers.update_user_debt)
+event_bus.subscribe(LoanEventType.PAID_OFF, "model_outcome", LoanEventHandlers.record_model_outcome)
+event_bus.subscribe(LoanEventType.DEFAULTED, "model_outcome", LoanEventHandlers.record_model_outcome)
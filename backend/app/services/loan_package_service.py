@@ -11,6 +11,7 @@ class LoanPackageService:
     @staticmethod
     async def create_loan_package(package_data: LoanPackageCreate, bank_id: str):
         package_id = str(uuid.uuid4())
+        now = datetime.utcnow()
         package_doc = {
             "package_id": package_id,
             "bank_id": bank_id,
@@ -20,7 +21,8 @@ class LoanPackageService:
             "loan_term_months": package_data.loan_term_months,
             "minimum_credit_score": package_data.minimum_credit_score,
             "description": package_data.description,
-            "created_at": datetime.utcnow(),
+            "created_at": now,
+            "updated_at": now,
             "is_active": True
         }
         
@@ -34,14 +36,15 @@ class LoanPackageService:
         
         return package_doc
     
+    @staticmethod
+    def packages_query(bank_id: str = None, active_only: bool = True):
+        """Query for all packages or a bank's; inactive (deleted) ones only if asked for"""
+        query = loan_packages_ref.where("bank_id", "==", bank_id) if bank_id else loan_packages_ref
+        return query.where("is_active", "==", True) if active_only else query
+    
     @staticmethod
     async def get_loan_packages(bank_id: str = None):
-        if bank_id:
-            query = loan_packages_ref.where("bank_id", "==", bank_id).where("is_active", "==", True)
-        else:
-            query = loan_packages_ref.where("is_active", "==", True)
-        
-        packages = query.stream()
+        packages = LoanPackageService.packages_query(bank_id).stream()
         return [package.to_dict() for package in packages]
     
     @staticmethod
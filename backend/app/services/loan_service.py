@@ -1,13 +1,24 @@
-from app.firebase_admin import loans_ref, repayments_ref, users_ref, db
-from app.models.loan_models import LoanApplication, RepaymentRequest, LoanStatus, LoanApplicationWithPackage
+from app.firebase_admin import loans_ref, repayments_ref, db
+from app.models.loan_models import LoanApplication, RepaymentRequest, LoanStatus, LoanApplicationWithPackage, LoanEventType
+from app.models.user_models import RepaymentStatus
 from app.services.scoring_service import ScoringService
 from app.services.loan_package_service import LoanPackageService
 from app.services.user_service import UserService
+from app.services.delinquency_service import DelinquencyService
+from app.services import loan_event_handlers  # noqa: F401 - registers the loan event handlers
+from app.utils.event_bus import event_bus
+from app.utils.firestore_utils import run_transaction
+from app.config import settings
 from app.utils.model_utils import predict_default_probability
-from datetime import datetime, timedelta
+from app.utils.tracing import span
+from datetime import datetime, timedelta, timezone
+import asyncio
 import uuid
-from typing import List
+from typing import List, Optional
 from firebase_admin import firestore
+import logging
+
+logger = logging.getLogger(__name__)
 
 class LoanService:
     
@@ -30,11 +41,19 @@ class LoanService:
             }
             
             # Predict default probability using the model utils
-            default_probability = predict_default_probability(input_data)
+            with span("loan.predict"):
+                default_probability = await predict_default_probability(input_data)
             
             # Calculate credit score and decision
             scoring_result = ScoringService.calculate_loan_decision(default_probability, application.credit_score)
             
+            with span("loan.schedule", term_months=application.loan_term_months):
+                payment_schedule = LoanService._generate_payment_schedule(
+                    application.loan_amount, 
+                    application.interest_rate, 
+                    application.loan_term_months
+                )
+            
             # Create loan document
             loan_id = str(uuid.uuid4())
             loan_data = {
@@ -42,6 +61,7 @@ class LoanService:
                 "user_id": user_id,
                 "application_data": application_dict,
                 "default_probability": default_probability,
+                "model_version": settings.MODEL_VERSION,
                 "credit_score_at_application": application.credit_score,
                 "credit_grade": scoring_result["credit_grade"],
                 "decision": scoring_result["decision"],
@@ -52,20 +72,16 @@ class LoanService:
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow(),
                 "next_payment_date": None,  # Will be set when activated
-                "payment_schedule": LoanService._generate_payment_schedule(
-                    application.loan_amount, 
-                    application.interest_rate, 
-                    application.loan_term_months
-                )
+                "payment_schedule": payment_schedule
             }
             
-            loans_ref.document(loan_id).set(loan_data)
-            
-            # Add to user's loan history
-            user_ref = users_ref.document(user_id)
-            user_ref.update({
-                "loan_history": firestore.ArrayUnion([loan_id])
-            })
+            # The loan and its event commit together; the loan history is updated by the event handler
+            with span("loan.write_loan"):
+                batch = db.batch()
+                batch.set(loans_ref.document(loan_id), loan_data)
+                event = event_bus.record(batch, LoanEventType.APPLIED, loan_id, user_id, {"user_id": user_id})
+                batch.commit()
+            event_bus.publish(event)
             
             return {**loan_data, "loan_id": loan_id}
             
@@ -77,12 +93,14 @@ class LoanService:
         """Apply for a loan using a pre-defined package"""
         try:
             # Get the loan package
-            package = await LoanPackageService.get_loan_package(application.package_id)
+            with span("loan.package_read", package_id=application.package_id):
+                package = await LoanPackageService.get_loan_package(application.package_id)
             if not package:
                 raise ValueError("Loan package not found")
             
             # Get user profile for verification
-            user_profile = await UserService.get_user_profile(user_id)
+            with span("loan.user_read"):
+                user_profile = await UserService.get_user_profile(user_id)
             if not user_profile:
                 raise ValueError("User profile not found")
             
@@ -102,7 +120,8 @@ class LoanService:
             }
             
             # Predict default probability
-            default_probability = predict_default_probability(input_data)
+            with span("loan.predict"):
+                default_probability = await predict_default_probability(input_data)
             
             # Calculate NEW credit score based on default probability
             current_credit_score = user_profile.get('current_credit_score', 650)
@@ -114,6 +133,13 @@ class LoanService:
                 new_credit_score  # Use the NEW credit score for decision
             )
             
+            with span("loan.schedule", term_months=package['loan_term_months']):
+                payment_schedule = LoanService._generate_payment_schedule(
+                    package['amount'], 
+                    package['interest_rate'], 
+                    package['loan_term_months']
+                )
+            
             # Create loan document
             loan_id = str(uuid.uuid4())
             loan_data = {
@@ -132,6 +158,7 @@ class LoanService:
                     "purpose": application.purpose
                 },
                 "default_probability": default_probability,
+                "model_version": settings.MODEL_VERSION,
                 "credit_score_at_application": current_credit_score,  # Store the OLD score
                 "updated_credit_score": new_credit_score,  # Store the NEW calculated score
                 "credit_grade": scoring_result["credit_grade"],
@@ -143,22 +170,19 @@ class LoanService:
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow(),
                 "next_payment_date": None,
-                "payment_schedule": LoanService._generate_payment_schedule(
-                    package['amount'], 
-                    package['interest_rate'], 
-                    package['loan_term_months']
-                )
+                "payment_schedule": payment_schedule
             }
             
-            loans_ref.document(loan_id).set(loan_data)
-            
-            # Update user's credit score in the database
-            user_ref = users_ref.document(user_id)
-            user_ref.update({
-                "current_credit_score": new_credit_score,  # Update the actual credit score
-                "loan_history": firestore.ArrayUnion([loan_id]),
-                "updated_at": datetime.utcnow()
-            })
+            # The user's new credit score and loan history are written by the event handler
+            with span("loan.write_loan"):
+                batch = db.batch()
+                batch.set(loans_ref.document(loan_id), loan_data)
+                event = event_bus.record(batch, LoanEventType.APPLIED, loan_id, user_id, {
+                    "user_id": user_id,
+                    "updated_credit_score": new_credit_score
+                })
+                batch.commit()
+            event_bus.publish(event)
             
             return {**loan_data, "loan_id": loan_id}
             
@@ -193,6 +217,60 @@ class LoanService:
         
         return schedule
     
+    @staticmethod
+    def _rebase_payment_schedule(schedule: List[dict], first_payment_date: datetime) -> List[dict]:
+        """Shift the schedule so the first installment falls due on first_payment_date"""
+        for index, installment in enumerate(schedule or []):
+            installment['due_date'] = first_payment_date + timedelta(days=30 * index)
+        return schedule
+    
+    @staticmethod
+    def _apply_payment_to_schedule(schedule: List[dict], amount: float, payment_date: datetime) -> dict:
+        """
+        Allocate a payment to the oldest unpaid installments, late fees first.
+        Mutates the schedule and returns the allocation summary.
+        """
+        remaining = amount
+        late_fee_paid = 0.0
+        first_due_date = None
+        
+        for installment in schedule:
+            if remaining <= 0:
+                break
+            if installment.get('status') == RepaymentStatus.PAID:
+                continue
+            
+            if first_due_date is None:
+                first_due_date = installment.get('due_date')
+            
+            fee_owed = installment.get('late_fee', 0) - installment.get('late_fee_paid', 0)
+            fee_payment = min(remaining, max(fee_owed, 0))
+            installment['late_fee_paid'] = installment.get('late_fee_paid', 0) + fee_payment
+            late_fee_paid += fee_payment
+            remaining -= fee_payment
+            
+            principal_owed = installment.get('amount_due', 0) - installment.get('amount_paid', 0)
+            principal_payment = min(remaining, max(principal_owed, 0))
+            installment['amount_paid'] = installment.get('amount_paid', 0) + principal_payment
+            remaining -= principal_payment
+            
+            if principal_owed - principal_payment <= 0.01 and fee_owed - fee_payment <= 0.01:
+                installment['status'] = RepaymentStatus.PAID.value
+                installment['paid_date'] = payment_date
+            elif installment.get('status') != RepaymentStatus.OVERDUE:
+                installment['status'] = RepaymentStatus.PARTIAL.value
+        
+        next_due_date = next(
+            (installment.get('due_date') for installment in schedule if installment.get('status') != RepaymentStatus.PAID),
+            None
+        )
+        
+        return {
+            "late_fee_paid": late_fee_paid,
+            "due_date": first_due_date,
+            "next_due_date": next_due_date
+        }
+    
     @staticmethod
     async def process_loan_application(loan_id: str, bank_id: str, approve: bool):
         """Process a loan application (approve or reject)"""
@@ -207,54 +285,41 @@ class LoanService:
         if loan_data['status'] != LoanStatus.PENDING:
             raise ValueError("Loan application has already been processed")
         
+        # The customer's debt/DTI and the bank counters are updated by the event handlers
+        batch = db.batch()
         if approve:
             new_status = LoanStatus.APPROVED
             
-            # Update user's debt and DTI
-            user_id = loan_data['user_id']
-            user_ref = users_ref.document(user_id)
-            user_doc = user_ref.get().to_dict()
-            
-            if user_doc:
-                new_debt = user_doc.get('total_debt', 0) + loan_data['application_data']['loan_amount']
-                new_dti = new_debt / user_doc.get('income', 1) if user_doc.get('income', 0) > 0 else 0
-                
-                user_ref.update({
-                    'total_debt': new_debt,
-                    'current_dti': new_dti
-                })
-            
-            # Update bank stats
-            bank_ref = users_ref.document(bank_id)
-            bank_ref.update({
-                'total_loans_approved': firestore.Increment(1),
-                'total_loans_under_management': firestore.Increment(1)
-            })
-            
             # Set first payment date
             first_payment_date = datetime.utcnow() + timedelta(days=30)
-            loan_ref.update({
+            batch.update(loan_ref, {
                 'status': new_status,
                 'bank_id': bank_id,
                 'next_payment_date': first_payment_date,
+                'payment_schedule': LoanService._rebase_payment_schedule(loan_data.get('payment_schedule'), first_payment_date),
                 'activated_at': datetime.utcnow(),
                 'updated_at': datetime.utcnow()
             })
+            event = event_bus.record(batch, LoanEventType.APPROVED, loan_id, loan_data['user_id'], {
+                "user_id": loan_data['user_id'],
+                "bank_id": bank_id,
+                "loan_amount": loan_data['application_data']['loan_amount']
+            })
             
         else:
             new_status = LoanStatus.REJECTED
-            # Update bank stats
-            bank_ref = users_ref.document(bank_id)
-            bank_ref.update({
-                'total_loans_rejected': firestore.Increment(1)
-            })
-            
-            loan_ref.update({
+            batch.update(loan_ref, {
                 'status': new_status,
                 'bank_id': bank_id,
                 'updated_at': datetime.utcnow()
             })
+            event = event_bus.record(batch, LoanEventType.REJECTED, loan_id, loan_data['user_id'], {
+                "user_id": loan_data['user_id'],
+                "bank_id": bank_id
+            })
         
+        batch.commit()
+        event_bus.publish(event)
         return {"status": new_status, "loan_id": loan_id}
     
     @staticmethod
@@ -280,66 +345,156 @@ class LoanService:
             'status': LoanStatus.ACTIVE,
             'updated_at': datetime.utcnow(),
             'activated_at': datetime.utcnow(),
-            'next_payment_date': first_payment_date
+            'next_payment_date': first_payment_date,
+            'payment_schedule': LoanService._rebase_payment_schedule(loan_data.get('payment_schedule'), first_payment_date)
         })
         
         return {"status": LoanStatus.ACTIVE, "loan_id": loan_id}
     
     @staticmethod
-    async def make_repayment(loan_id: str, repayment: RepaymentRequest):
-        """Process a loan repayment - simplified version"""
-        loan_ref = loans_ref.document(loan_id)
-        loan_data = loan_ref.get().to_dict()
+    async def mark_loan_defaulted(loan_id: str, bank_id: str):
+        """Mark an approved or active loan as defaulted"""
+        # One transaction, so a concurrent sweep or payoff cannot slip in between
+        # the status check and the write
+        event = run_transaction(LoanService._record_default, loans_ref.document(loan_id), bank_id)
+        event_bus.publish(event)
+        
+        return {"status": LoanStatus.DEFAULTED, "loan_id": loan_id}
+    
+    @staticmethod
+    def _record_default(transaction, loan_ref, bank_id: str) -> dict:
+        """Mark the loan defaulted inside `transaction`; returns the event to publish"""
+        loan_doc = loan_ref.get(transaction=transaction)
+        
+        if not loan_doc.exists:
+            raise ValueError("Loan not found")
+        
+        loan_data = loan_doc.to_dict()
+        
+        if loan_data['status'] not in [LoanStatus.APPROVED, LoanStatus.ACTIVE]:
+            raise ValueError("Only approved or active loans can be marked as defaulted")
+        
+        if loan_data.get('bank_id') != bank_id:
+            raise ValueError("Only the approving bank can mark this loan as defaulted")
+        
+        defaulted_at = datetime.utcnow()
+        transaction.update(loan_ref, {
+            'status': LoanStatus.DEFAULTED,
+            'defaulted_at': defaulted_at,
+            'updated_at': defaulted_at,
+            'is_delinquent': False
+        })
+        DelinquencyService.release(loan_data, transaction)
+        return event_bus.record(
+            transaction, LoanEventType.DEFAULTED, loan_ref.id, loan_data['user_id'],
+            LoanService._outcome_payload(loan_data, defaulted_at)
+        )
+    
+    @staticmethod
+    def _outcome_payload(loan_data: dict, outcome_date: datetime) -> dict:
+        """What the model tracker needs from a loan that reached a terminal state"""
+        return {
+            "user_id": loan_data['user_id'],
+            "default_probability": loan_data.get('default_probability'),
+            "model_version": loan_data.get('model_version', settings.MODEL_VERSION),
+            "outcome_date": outcome_date
+        }
+    
+    @staticmethod
+    async def make_repayment(loan_id: str, repayment: RepaymentRequest, user_profile: Optional[dict] = None):
+        """
+        Process a loan repayment - simplified version.
+        `user_profile`, when the caller has it, gives the projected DTI in the response.
+        """
+        # One transaction, so a concurrent repayment or delinquency sweep cannot
+        # overwrite the payment schedule this repayment reads and rewrites
+        result, principal_paid, events = run_transaction(
+            LoanService._record_repayment, loans_ref.document(loan_id), repayment
+        )
+        event_bus.publish(*events)
+        
+        result["new_dti"] = UserService.debt_after(user_profile, -principal_paid)[1] if user_profile else None
+        return result
+    
+    @staticmethod
+    def _record_repayment(transaction, loan_ref, repayment: RepaymentRequest):
+        """Apply a repayment inside `transaction`; returns (response, principal paid, events to publish)"""
+        loan_doc = loan_ref.get(transaction=transaction)
+        if not loan_doc.exists:
+            raise ValueError("Loan not found")
+        
+        loan_data = loan_doc.to_dict()
+        
+        # Checked in the transaction, so a paid-off or defaulted loan cannot take
+        # another payment (and record a second outcome)
+        if loan_data['status'] not in [LoanStatus.APPROVED, LoanStatus.ACTIVE]:
+            raise ValueError("Only approved or active loans can be repaid")
+        
+        # Allocate the payment to the schedule, settling late fees first
+        payment_date = datetime.utcnow()
+        payment_schedule = loan_data.get('payment_schedule') or []
+        allocation = LoanService._apply_payment_to_schedule(payment_schedule, repayment.amount, payment_date)
+        # Late fees are not part of the loan balance or the customer's debt;
+        # anything beyond the balance is not taken
+        principal_paid = min(repayment.amount - allocation["late_fee_paid"], max(0, loan_data['amount_remaining']))
         
         # Create repayment record
         payment_id = str(uuid.uuid4())
         repayment_data = {
             "payment_id": payment_id,
-            "loan_id": loan_id,
-            "amount": repayment.amount,
-            "payment_date": datetime.utcnow(),
+            "loan_id": loan_ref.id,
+            "amount": principal_paid + allocation["late_fee_paid"],
+            "payment_date": payment_date,
+            "due_date": allocation["due_date"] or payment_date,
             "status": "paid",
-            "created_at": datetime.utcnow()
+            "late_fee": allocation["late_fee_paid"],
+            "created_at": payment_date
         }
-        
-        repayments_ref.document(payment_id).set(repayment_data)
+        transaction.set(repayments_ref.document(payment_id), repayment_data)
         
         # Update loan remaining amount
-        new_remaining = loan_data['amount_remaining'] - repayment.amount
+        new_remaining = loan_data['amount_remaining'] - principal_paid
         
         updates = {
             "amount_remaining": new_remaining,
-            "updated_at": datetime.utcnow(),
+            "payment_schedule": payment_schedule,
+            "updated_at": payment_date,
         }
         
-        # Check if loan is paid off
+        if loan_data.get('next_payment_date') is not None:
+            updates["next_payment_date"] = allocation["next_due_date"]
+        if allocation["late_fee_paid"]:
+            updates["late_fees_outstanding"] = firestore.Increment(-allocation["late_fee_paid"])
+        
+        # Check if loan is paid off - an approved or active loan, so this is the one transition to PAID
         if new_remaining <= 0:
             updates["status"] = LoanStatus.PAID
-            updates["paid_at"] = datetime.utcnow()
-        
-        loan_ref.update(updates)
+            updates["paid_at"] = payment_date
+            updates["next_payment_date"] = None
         
-        # Update user's debt and calculate DTI
-        user_ref = users_ref.document(loan_data['user_id'])
-        user_doc = user_ref.get().to_dict()
+        DelinquencyService.cure(loan_data, updates, transaction)
+        transaction.update(loan_ref, updates)
         
-        new_dti = 0
-        if user_doc:
-            new_debt = max(0, user_doc.get('total_debt', 0) - repayment.amount)
-            new_dti = new_debt / user_doc.get('income', 1) if user_doc.get('income', 0) > 0 else 0
-            
-            user_ref.update({
-                'total_debt': new_debt,
-                'current_dti': new_dti,
-                'updated_at': datetime.utcnow()
-            })
+        # The customer's debt/DTI and the model tracker are updated by the event handlers
+        user_id = loan_data['user_id']
+        events = [event_bus.record(transaction, LoanEventType.REPAID, loan_ref.id, user_id, {
+            "user_id": user_id,
+            "payment_id": payment_id,
+            "amount": principal_paid
+        })]
+        if updates.get("status") == LoanStatus.PAID:
+            events.append(event_bus.record(
+                transaction, LoanEventType.PAID_OFF, loan_ref.id, user_id, LoanService._outcome_payload(loan_data, updates["paid_at"])
+            ))
         
-        return {
+        result = {
             "payment_id": payment_id,
             "amount_remaining": new_remaining,
             "loan_status": updates.get("status", loan_data['status']),
-            "new_dti": new_dti
+            "late_fee_paid": allocation["late_fee_paid"],
+            "next_payment_date": updates.get("next_payment_date", loan_data.get('next_payment_date'))
         }
+        return result, principal_paid, events
     
     @staticmethod
     def _get_current_due_amount(loan_data: dict) -> float:
@@ -392,12 +547,18 @@ class LoanService:
             'updated_at': datetime.utcnow()
         })
     
+    @staticmethod
+    def user_loans_query(user_id: str, fields: Optional[List[str]] = None):
+        """Query for a user's loans, optionally projected onto `fields`"""
+        query = loans_ref.where("user_id", "==", user_id)
+        return query.select(fields) if fields else query
+    
     @staticmethod
     async def get_user_loans(user_id: str):
         """Get all loans for a specific user"""
         try:
             # Option 2a: Remove ordering temporarily
-            loans = loans_ref.where("user_id", "==", user_id).stream()
+            loans = LoanService.user_loans_query(user_id).stream()
             
             # Option 2b: Or order by a different field that doesn't require composite index
             # loans = loans_ref.where("user_id", "==", user_id).order_by("loan_id").stream()
@@ -409,19 +570,69 @@ class LoanService:
             
             return loan_list
         except Exception as e:
-            print(f"Error in get_user_loans: {str(e)}")
+            logger.exception("Error in get_user_loans", extra={"user_id": user_id})
             raise e
     
+    @staticmethod
+    def pending_loans_query(fields: Optional[List[str]] = None):
+        """Query for pending loan applications, optionally projected onto `fields`"""
+        query = loans_ref.where("status", "==", LoanStatus.PENDING)
+        return query.select(fields) if fields else query
+    
     @staticmethod
     async def get_pending_loans():
         """Get all pending loan applications"""
-        loans = loans_ref.where("status", "==", LoanStatus.PENDING).stream()
+        loans = LoanService.pending_loans_query().stream()
         return [loan.to_dict() for loan in loans]
     
+    @staticmethod
+    def bank_active_loans_query(bank_id: str, fields: Optional[List[str]] = None):
+        """Query for the active and approved loans a bank manages, optionally projected onto `fields`"""
+        query = loans_ref.where("bank_id", "==", bank_id).where("status", "in", [LoanStatus.ACTIVE, LoanStatus.APPROVED])
+        return query.select(fields) if fields else query
+    
+    @staticmethod
+    def bank_loans_query(bank_id: str):
+        """Query for all loans processed by a bank"""
+        return loans_ref.where("bank_id", "==", bank_id)
+    
+    @staticmethod
+    def loans_query():
+        """Query for every loan"""
+        return loans_ref
+    
+    @staticmethod
+    async def get_loan_changes(query, since: Optional[datetime], statuses: Optional[List[str]] = None,
+                               fields: Optional[List[str]] = None) -> dict:
+        """
+        Delta sync over a loan query (a customer's or a bank's loans): the loans
+        updated after `since`, the ids of those whose status is no longer in
+        `statuses` (removed from the client's list - loans are never deleted)
+        and the watermark to pass as `since` next time. Without `since`, every loan.
+        """
+        # Writers stamp updated_at before they commit and the processes' clocks
+        # differ, so the watermark trails the clock; changes in that window are sent twice
+        watermark = datetime.utcnow() - timedelta(seconds=settings.DELTA_SYNC_WINDOW_SECONDS)
+        if since is not None:
+            if since.tzinfo is not None:
+                since = since.astimezone(timezone.utc).replace(tzinfo=None)
+            query = query.where("updated_at", ">", since)
+            watermark = max(watermark, since)
+        if fields:
+            query = query.select(fields)
+        
+        changed, removed = [], []
+        for loan in await asyncio.to_thread(lambda: [snapshot.to_dict() for snapshot in query.stream()]):
+            if statuses is None or loan.get('status') in statuses:
+                changed.append(loan)
+            else:
+                removed.append(loan['loan_id'])
+        return {"loans": changed, "removed": removed, "watermark": watermark}
+    
     @staticmethod
     async def get_loans_by_bank(bank_id: str):
         """Get all loans processed by a specific bank"""
-        loans = loans_ref.where("bank_id", "==", bank_id).stream()
+        loans = LoanService.bank_loans_query(bank_id).stream()
         return [loan.to_dict() for loan in loans]
     
     @staticmethod
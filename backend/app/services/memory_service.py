@@ -0,0 +1,72 @@
+import gc
+import os
+import sys
+import numpy as np
+import psutil
+from typing import Dict
+from app.utils import memory_tracking
+from app.utils.memory_tracking import deep_sizeof
+from app.utils.metrics_buffer import metrics_buffer
+from app.utils.loop_monitor import loop_monitor
+from app.utils.profiler import continuous_profiler
+from app.utils.tracing import exporter as trace_exporter
+from app.middleware.metrics_middleware import request_metrics
+from app.services import cohort_service
+
+class MemoryReportService:
+
+    @staticmethod
+    def _model_memory() -> Dict:
+        """Parameter bytes of the loaded model - without importing TensorFlow if it is not loaded yet"""
+        model_utils = sys.modules.get("app.utils.model_utils")
+        model = getattr(model_utils, "model", None) if model_utils else None
+        if model is None:
+            return {"loaded": False}
+
+        parameter_bytes = 0
+        parameters = 0
+        for weight in model.weights:
+            count = int(np.prod(weight.shape))
+            dtype = getattr(weight.dtype, "name", weight.dtype)
+            parameters += count
+            parameter_bytes += count * np.dtype(dtype).itemsize
+        return {
+            "loaded": True,
+            "name": getattr(model, "name", None),
+            "parameters": parameters,
+            "parameter_bytes": parameter_bytes
+        }
+
+    @staticmethod
+    def _cache_sizes() -> Dict:
+        caches = {
+            "cohort_cache": (len(cohort_service._cohort_cache), cohort_service._cohort_cache),
+            "request_metrics_routes": (len(request_metrics.routes), request_metrics.routes),
+            "metrics_buffer": (sum(metrics_buffer.size().values()), metrics_buffer),
+            "loop_stall_offenders": (len(loop_monitor.offenders), loop_monitor.offenders),
+            "route_profiles": (len(continuous_profiler.profiles), continuous_profiler.profiles),
+            "trace_export_queue": (trace_exporter.stats()["queued"], None),
+            "tracked_call_peaks": (len(memory_tracking.call_peaks), memory_tracking.call_peaks)
+        }
+        return {
+            name: {
+                "entries": entries,
+                "approx_bytes": deep_sizeof(container) if container is not None else None
+            }
+            for name, (entries, container) in caches.items()
+        }
+
+    @staticmethod
+    def get_memory_report(top: int = 20) -> Dict:
+        """Blocking (walks caches, takes a tracemalloc snapshot) - run it off the event loop"""
+        memory_info = psutil.Process().memory_info()
+        return {
+            "worker_pid": os.getpid(),
+            "rss_bytes": memory_info.rss,
+            "vms_bytes": memory_info.vms,
+            "gc_counts": gc.get_count(),
+            "model": MemoryReportService._model_memory(),
+            "caches": MemoryReportService._cache_sizes(),
+            "tracemalloc": memory_tracking.snapshot_diff(top),
+            "analytics_calls": memory_tracking.recent_calls()
+        }
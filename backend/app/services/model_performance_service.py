@@ -0,0 +1,209 @@
+from app.firebase_admin import loans_ref, model_performance_ref, db
+from app.config import settings
+from app.models.user_models import LoanStatus
+from datetime import datetime
+from typing import Dict, List, Optional
+from firebase_admin import firestore
+
+class ModelPerformanceService:
+    """
+    Outcome tracker for the default model.
+
+    Every time a loan reaches a terminal state (PAID or DEFAULTED) the running
+    confusion matrix, calibration histogram and score bins of the
+    (model_version, month) bucket are incremented. Reads only touch the bucket
+    documents, never the loans themselves.
+    """
+
+    @staticmethod
+    def _bucket_id(model_version: str, month: str) -> str:
+        return f"{model_version}_{month}"
+
+    @staticmethod
+    def _bin_index(probability: float, bins: int) -> int:
+        probability = min(max(probability, 0.0), 1.0)
+        return min(int(probability * bins), bins - 1)
+
+    @staticmethod
+    def _outcome_increments(predicted_prob: float, defaulted: bool) -> Dict:
+        """Build the nested Increment payload for a single outcome"""
+        predicted_default = predicted_prob > settings.MODEL_DECISION_THRESHOLD
+        if predicted_default and defaulted:
+            cell = "tp"
+        elif predicted_default:
+            cell = "fp"
+        elif defaulted:
+            cell = "fn"
+        else:
+            cell = "tn"
+
+        calibration_bin = str(ModelPerformanceService._bin_index(predicted_prob, settings.CALIBRATION_BINS))
+        score_bin = str(ModelPerformanceService._bin_index(predicted_prob, settings.SCORE_BINS))
+
+        return {
+            "confusion": {cell: firestore.Increment(1)},
+            "calibration": {
+                calibration_bin: {
+                    "count": firestore.Increment(1),
+                    "sum_predicted": firestore.Increment(predicted_prob),
+                    "defaults": firestore.Increment(1 if defaulted else 0)
+                }
+            },
+            "score_bins": {
+                "defaulted" if defaulted else "paid": {score_bin: firestore.Increment(1)}
+            },
+            "total": firestore.Increment(1)
+        }
+
+    @staticmethod
+    def add_outcome(batch, loan_data: dict, defaulted: bool, outcome_date: Optional[datetime] = None) -> bool:
+        """Add the bucket increments for one outcome to a write batch; False if the loan has no prediction"""
+        predicted_prob = loan_data.get('default_probability')
+        if predicted_prob is None:
+            return False
+
+        model_version = loan_data.get('model_version', settings.MODEL_VERSION)
+        month = (outcome_date or datetime.utcnow()).strftime("%Y-%m")
+
+        batch.set(model_performance_ref.document(ModelPerformanceService._bucket_id(model_version, month)), {
+            "model_version": model_version,
+            "month": month,
+            "threshold": settings.MODEL_DECISION_THRESHOLD,
+            "updated_at": datetime.utcnow(),
+            **ModelPerformanceService._outcome_increments(float(predicted_prob), defaulted)
+        }, merge=True)
+        return True
+
+    @staticmethod
+    async def record_outcome(loan_data: dict, defaulted: bool, outcome_date: Optional[datetime] = None):
+        """Record the outcome of a loan that just transitioned to PAID or DEFAULTED"""
+        batch = db.batch()
+        if ModelPerformanceService.add_outcome(batch, loan_data, defaulted, outcome_date):
+            batch.commit()
+
+    @staticmethod
+    async def rebuild():
+        """
+        Rebuild every bucket from the completed loans.
+        One-off backfill for loans that completed before tracking existed.
+        """
+        for bucket in model_performance_ref.stream():
+            bucket.reference.delete()
+
+        completed_loans = loans_ref.where("status", "in", [LoanStatus.PAID, LoanStatus.DEFAULTED]).stream()
+        recorded = 0
+        for loan in completed_loans:
+            loan_data = loan.to_dict()
+            defaulted = loan_data.get('status') == LoanStatus.DEFAULTED
+            outcome_date = loan_data.get('defaulted_at') if defaulted else loan_data.get('paid_at')
+            await ModelPerformanceService.record_outcome(
+                loan_data, defaulted, outcome_date or loan_data.get('updated_at')
+            )
+            recorded += 1
+
+        return {"recorded_outcomes": recorded}
+
+    @staticmethod
+    def _merge_buckets(buckets: List[Dict]) -> Dict:
+        merged = {
+            "confusion": {"tp": 0, "fp": 0, "tn": 0, "fn": 0},
+            "calibration": {},
+            "score_bins": {"defaulted": {}, "paid": {}},
+            "total": 0
+        }
+        for bucket in buckets:
+            merged["total"] += bucket.get("total", 0)
+            for cell, count in bucket.get("confusion", {}).items():
+                merged["confusion"][cell] = merged["confusion"].get(cell, 0) + count
+            for bin_key, stats in bucket.get("calibration", {}).items():
+                target = merged["calibration"].setdefault(bin_key, {"count": 0, "sum_predicted": 0.0, "defaults": 0})
+                for field in target:
+                    target[field] += stats.get(field, 0)
+            for outcome in ("defaulted", "paid"):
+                for bin_key, count in bucket.get("score_bins", {}).get(outcome, {}).items():
+                    target = merged["score_bins"][outcome]
+                    target[bin_key] = target.get(bin_key, 0) + count
+        return merged
+
+    @staticmethod
+    def _calculate_auc(score_bins: Dict) -> Optional[float]:
+        """
+        AUC from binned scores: probability that a defaulted loan scores higher
+        than a paid one, counting ties within a bin as one half.
+        """
+        positives = [score_bins["defaulted"].get(str(i), 0) for i in range(settings.SCORE_BINS)]
+        negatives = [score_bins["paid"].get(str(i), 0) for i in range(settings.SCORE_BINS)]
+        total_pos = sum(positives)
+        total_neg = sum(negatives)
+        if total_pos == 0 or total_neg == 0:
+            return None
+
+        wins = 0.0
+        negatives_below = 0
+        for pos, neg in zip(positives, negatives):
+            wins += pos * (negatives_below + 0.5 * neg)
+            negatives_below += neg
+
+        return wins / (total_pos * total_neg)
+
+    @staticmethod
+    def _summarize(merged: Dict) -> Dict:
+        confusion = merged["confusion"]
+        total = merged["total"]
+        tp, fp, tn, fn = confusion["tp"], confusion["fp"], confusion["tn"], confusion["fn"]
+
+        calibration = []
+        expected_calibration_error = 0.0
+        for i in range(settings.CALIBRATION_BINS):
+            stats = merged["calibration"].get(str(i))
+            if not stats or not stats["count"]:
+                continue
+            mean_predicted = stats["sum_predicted"] / stats["count"]
+            observed_rate = stats["defaults"] / stats["count"]
+            expected_calibration_error += (stats["count"] / total) * abs(mean_predicted - observed_rate) if total else 0
+            calibration.append({
+                "bin": i,
+                "lower": i / settings.CALIBRATION_BINS,
+                "upper": (i + 1) / settings.CALIBRATION_BINS,
+                "count": stats["count"],
+                "mean_predicted": mean_predicted,
+                "observed_default_rate": observed_rate
+            })
+
+        return {
+            "completed_loans": total,
+            "threshold": settings.MODEL_DECISION_THRESHOLD,
+            "confusion_matrix": confusion,
+            "accuracy": ((tp + tn) / total) * 100 if total else None,
+            "precision": (tp / (tp + fp)) * 100 if (tp + fp) else None,
+            "recall": (tp / (tp + fn)) * 100 if (tp + fn) else None,
+            "auc": ModelPerformanceService._calculate_auc(merged["score_bins"]),
+            "expected_calibration_error": expected_calibration_error if total else None,
+            "calibration": calibration
+        }
+
+    @staticmethod
+    async def get_model_performance(model_version: Optional[str] = None, month: Optional[str] = None) -> Dict:
+        """
+        Get tracked performance, overall and per (model_version, month) bucket.
+        """
+        query = model_performance_ref
+        if model_version:
+            query = query.where("model_version", "==", model_version)
+        if month:
+            query = query.where("month", "==", month)
+
+        buckets = [bucket.to_dict() for bucket in query.stream()]
+        buckets.sort(key=lambda b: (b.get("model_version", ""), b.get("month", "")))
+
+        return {
+            **ModelPerformanceService._summarize(ModelPerformanceService._merge_buckets(buckets)),
+            "buckets": [
+                {
+                    "model_version": bucket.get("model_version"),
+                    "month": bucket.get("month"),
+                    **ModelPerformanceService._summarize(ModelPerformanceService._merge_buckets([bucket]))
+                }
+                for bucket in buckets
+            ]
+        }
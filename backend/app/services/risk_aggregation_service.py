@@ -0,0 +1,167 @@
+from app.firebase_admin import loans_ref
+from app.config import settings
+from app.utils.quantile_sketch import QuantileSketch
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Only the fields the aggregator reads are fetched from Firestore
+RISK_FIELDS = [
+    "bank_id",
+    "credit_grade",
+    "default_probability",
+    "amount_remaining",
+    "application_data.loan_amount"
+]
+
+class RiskAggregator:
+    """
+    Single-pass risk aggregation over a stream of loans.
+
+    Keeps band counts/volumes overall and per credit grade, plus quantile
+    sketches of default probability and exposure. Memory does not grow with
+    the number of loans, and aggregators can be merged (per-bank into
+    system-wide).
+    """
+
+    def __init__(self, bands: Optional[List[Tuple[str, float]]] = None):
+        self.bands = sorted(bands or settings.RISK_BANDS.items(), key=lambda band: band[1])
+        self._band_limits = [limit for _, limit in self.bands]
+        self.count = 0
+        self.total_risk = 0.0
+        self.total_volume = 0.0
+        self.band_stats = {name: {"count": 0, "volume": 0.0} for name, _ in self.bands}
+        self.grade_stats: Dict[str, Dict] = {}
+        self.pd_sketch = QuantileSketch()
+        self.exposure_sketch = QuantileSketch()
+
+    def band_for(self, default_probability: float) -> str:
+        index = bisect_left(self._band_limits, default_probability)
+        return self.bands[min(index, len(self.bands) - 1)][0]
+
+    def add(self, loan: Dict):
+        default_probability = loan.get('default_probability', 0) or 0
+        volume = (loan.get('application_data') or {}).get('loan_amount', 0) or 0
+        exposure = loan.get('amount_remaining', volume)
+        grade = loan.get('credit_grade', 'unknown')
+        band = self.band_for(default_probability)
+
+        self.count += 1
+        self.total_risk += default_probability
+        self.total_volume += volume
+        self.band_stats[band]["count"] += 1
+        self.band_stats[band]["volume"] += volume
+
+        if grade not in self.grade_stats:
+            self.grade_stats[grade] = {
+                "count": 0,
+                "total_risk": 0.0,
+                "total_volume": 0.0,
+                "bands": {name: 0 for name, _ in self.bands}
+            }
+        grade_stats = self.grade_stats[grade]
+        grade_stats["count"] += 1
+        grade_stats["total_risk"] += default_probability
+        grade_stats["total_volume"] += volume
+        grade_stats["bands"][band] += 1
+
+        self.pd_sketch.add(default_probability)
+        self.exposure_sketch.add(max(exposure or 0, 0))
+
+    def consume(self, loans: Iterable[Dict]) -> "RiskAggregator":
+        for loan in loans:
+            self.add(loan)
+        return self
+
+    def merge(self, other: "RiskAggregator") -> "RiskAggregator":
+        if other.bands != self.bands:
+            raise ValueError("Cannot merge aggregators with different risk bands")
+
+        self.count += other.count
+        self.total_risk += other.total_risk
+        self.total_volume += other.total_volume
+        for name, stats in other.band_stats.items():
+            self.band_stats[name]["count"] += stats["count"]
+            self.band_stats[name]["volume"] += stats["volume"]
+        for grade, stats in other.grade_stats.items():
+            if grade not in self.grade_stats:
+                self.grade_stats[grade] = {
+                    "count": 0,
+                    "total_risk": 0.0,
+                    "total_volume": 0.0,
+                    "bands": {name: 0 for name, _ in self.bands}
+                }
+            target = self.grade_stats[grade]
+            target["count"] += stats["count"]
+            target["total_risk"] += stats["total_risk"]
+            target["total_volume"] += stats["total_volume"]
+            for name, count in stats["bands"].items():
+                target["bands"][name] += count
+
+        self.pd_sketch.merge(other.pd_sketch)
+        self.exposure_sketch.merge(other.exposure_sketch)
+        return self
+
+    def summary(self) -> Dict:
+        risk_by_grade = {
+            grade: {
+                "count": stats["count"],
+                "avg_risk": stats["total_risk"] / stats["count"],
+                "total_volume": stats["total_volume"],
+                "bands": stats["bands"]
+            }
+            for grade, stats in self.grade_stats.items()
+        }
+
+        result = {
+            f"{name}_risk_loans": stats["count"] for name, stats in self.band_stats.items()
+        }
+        result.update({
+            "average_risk_score": self.total_risk / self.count if self.count else 0,
+            "risk_by_grade": risk_by_grade,
+            "bands": {
+                name: {"upper_bound": limit, **self.band_stats[name]} for name, limit in self.bands
+            },
+            "quantiles": {
+                "default_probability": self.pd_sketch.quantiles(),
+                "exposure": self.exposure_sketch.quantiles()
+            },
+            "total_volume": self.total_volume,
+            "total_analyzed_loans": self.count
+        })
+        # Kept for existing dashboard consumers of the default bands
+        if "high" in self.band_stats:
+            result["high_risk_volume"] = self.band_stats["high"]["volume"]
+        return result
+
+class RiskAggregationService:
+
+    @staticmethod
+    def stream_loans(bank_id: Optional[str] = None) -> Iterator[Dict]:
+        """Yield loan dicts straight off the Firestore stream"""
+        query = loans_ref.where("bank_id", "==", bank_id) if bank_id else loans_ref
+        for loan in query.select(RISK_FIELDS).stream():
+            yield loan.to_dict()
+
+    @staticmethod
+    async def get_bank_risk(bank_id: str) -> RiskAggregator:
+        return RiskAggregator().consume(RiskAggregationService.stream_loans(bank_id))
+
+    @staticmethod
+    async def get_per_bank_risk() -> Dict[str, RiskAggregator]:
+        """One pass over all loans, split into per-bank aggregators"""
+        aggregators: Dict[str, RiskAggregator] = {}
+        for loan in RiskAggregationService.stream_loans():
+            bank_id = loan.get('bank_id') or 'unassigned'
+            if bank_id not in aggregators:
+                aggregators[bank_id] = RiskAggregator()
+            aggregators[bank_id].add(loan)
+        return aggregators
+
+    @staticmethod
+    async def get_system_risk() -> Tuple[RiskAggregator, Dict[str, RiskAggregator]]:
+        """System-wide aggregate built by merging the per-bank aggregators"""
+        per_bank = await RiskAggregationService.get_per_bank_risk()
+        system = RiskAggregator()
+        for aggregator in per_bank.values():
+            system.merge(aggregator)
+        return system, per_bank
@@ -1,134 +1,251 @@
+import asyncio
 import psutil
 import GPUtil
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from app.config import settings
 from app.firebase_admin import system_metrics_ref
 from app.models.analytics_models import SystemMetrics
+from app.middleware.metrics_middleware import request_metrics
+from app.utils.metrics_buffer import metrics_buffer, Rollup
+from app.utils.firestore_utils import to_naive_utc
+import logging
+
+logger = logging.getLogger(__name__)
 
 class SystemMonitoringService:
     
+    # Sampler state, kept between samples so each reading is a delta against the previous one
+    _process = psutil.Process()
+    _primed = False
+    _gpu_probe_enabled = None  # None until the one-off GPU discovery has run
+    _sampler_stats = {
+        "samples": 0,
+        "last_loop_ms": 0.0,
+        "max_loop_ms": 0.0,
+        "total_loop_ms": 0.0,
+        "last_thread_ms": 0.0,
+        "last_thread_cpu_ms": 0.0
+    }
+    
     @staticmethod
-    async def collect_system_metrics():
+    def prime():
+        """
+        Establish the CPU baseline and discover the GPU once.
+        Blocking (GPUtil shells out to nvidia-smi) - run it off the event loop.
+        """
+        psutil.cpu_percent(interval=None)
+        
         try:
-            # CPU usage
-            cpu_usage = psutil.cpu_percent(interval=1)
-            
-            # Memory usage
-            memory = psutil.virtual_memory()
-            memory_usage = memory.percent
-            
-            # Disk usage
-            disk = psutil.disk_usage('/')
-            disk_usage = disk.percent
-            
-            # Enhanced GPU monitoring for CUDA
-            gpu_usage = None
-            gpu_memory_usage = None
-            gpu_temperature = None
-            gpu_power_usage = None
-            
-            try:
-                gpus = GPUtil.getGPUs()
-                if gpus:
-                    # Get the first GPU (you can modify this to handle multiple GPUs)
-                    gpu = gpus[0]
-                    gpu_usage = gpu.load * 100  # GPU utilization %
-                    gpu_memory_usage = (gpu.memoryUsed / gpu.memoryTotal) * 100  # GPU memory %
-                    gpu_temperature = gpu.temperature
-                    
-                    # Try to get power consumption if available
-                    try:
-                        if hasattr(gpu, 'powerDraw') and gpu.powerDraw is not None:
-                            gpu_power_usage = gpu.powerDraw
-                        elif hasattr(gpu, 'power_load') and gpu.power_load is not None:
-                            gpu_power_usage = gpu.power_load
-                    except:
-                        gpu_power_usage = None
-                        
-                    print(f"GPU: {gpu_usage:.1f}% usage, {gpu_memory_usage:.1f}% memory, {gpu_temperature}°C, {gpu_power_usage}W power")
-                    
-            except Exception as e:
-                print(f"GPU monitoring error: {e}")
-                gpu_usage = None
-                gpu_memory_usage = None
-                gpu_temperature = None
-                gpu_power_usage = None
+            SystemMonitoringService._gpu_probe_enabled = bool(GPUtil.getGPUs())
+        except Exception as e:
+            logger.warning("GPU discovery failed, disabling GPU probe: %s", e)
+            SystemMonitoringService._gpu_probe_enabled = False
+        
+        SystemMonitoringService._primed = True
+    
+    @staticmethod
+    def _count_own_connections() -> int:
+        """Count only this server process's sockets instead of walking the whole socket table"""
+        process = SystemMonitoringService._process
+        connections = getattr(process, "net_connections", None) or process.connections
+        return len(connections(kind="inet"))
+    
+    @staticmethod
+    def _read_gpu():
+        if not SystemMonitoringService._gpu_probe_enabled:
+            return None, None, None, None
+        
+        try:
+            gpus = GPUtil.getGPUs()
+            if not gpus:
+                SystemMonitoringService._gpu_probe_enabled = False
+                return None, None, None, None
             
-            # Enhanced Power consumption estimation
-            total_power_consumption = None
-            try:
-                # Base system power (idle power ~50-100W depending on system)
-                base_power = 80  # watts - adjust based on your system
-                
-                # CPU power scaling (0-100% usage adds 0-100W typically)
-                cpu_power_contribution = cpu_usage * 1.0  # 1W per % usage
-                
-                # GPU power scaling
-                gpu_power_contribution = 0
-                if gpu_power_usage is not None:
-                    gpu_power_contribution = gpu_power_usage
-                elif gpu_usage is not None:
-                    # Estimate GPU power if not directly available
-                    # High-end GPUs can draw 200-400W at full load
-                    gpu_power_contribution = gpu_usage * 3.0  # 3W per % usage for high-end GPU
-                
-                total_power_consumption = base_power + cpu_power_contribution + gpu_power_contribution
-                
-                print(f"Power estimate: Base={base_power}W, CPU={cpu_power_contribution:.1f}W, GPU={gpu_power_contribution:.1f}W, Total={total_power_consumption:.1f}W")
-                
-            except Exception as e:
-                print(f"Power estimation error: {e}")
-                total_power_consumption = None
+            # Get the first GPU (you can modify this to handle multiple GPUs)
+            gpu = gpus[0]
+            gpu_usage = gpu.load * 100  # GPU utilization %
+            gpu_memory_usage = (gpu.memoryUsed / gpu.memoryTotal) * 100  # GPU memory %
+            gpu_temperature = gpu.temperature
+            gpu_power_usage = getattr(gpu, 'powerDraw', None) or getattr(gpu, 'power_load', None)
+            return gpu_usage, gpu_memory_usage, gpu_temperature, gpu_power_usage
+        except Exception as e:
+            logger.warning("GPU monitoring error: %s", e)
+            return None, None, None, None
+    
+    @staticmethod
+    def sample_system_metrics(request_rate: float = 0) -> SystemMetrics:
+        """Take one sample. Blocking - called from a worker thread"""
+        if not SystemMonitoringService._primed:
+            SystemMonitoringService.prime()
+        
+        # CPU usage since the previous sample, no sleep
+        cpu_usage = psutil.cpu_percent(interval=None)
+        
+        # Memory usage
+        memory_usage = psutil.virtual_memory().percent
+        
+        # Disk usage
+        disk_usage = psutil.disk_usage('/').percent
+        
+        gpu_usage, gpu_memory_usage, gpu_temperature, gpu_power_usage = SystemMonitoringService._read_gpu()
+        
+        # Power consumption estimation
+        # Base system power (idle power ~50-100W depending on system)
+        base_power = 80  # watts - adjust based on your system
+        
+        # CPU power scaling (0-100% usage adds 0-100W typically)
+        cpu_power_contribution = cpu_usage * 1.0  # 1W per % usage
+        
+        # GPU power scaling
+        gpu_power_contribution = 0
+        if gpu_power_usage is not None:
+            gpu_power_contribution = gpu_power_usage
+        elif gpu_usage is not None:
+            # Estimate GPU power if not directly available
+            # High-end GPUs can draw 200-400W at full load
+            gpu_power_contribution = gpu_usage * 3.0  # 3W per % usage for high-end GPU
+        
+        total_power_consumption = base_power + cpu_power_contribution + gpu_power_contribution
+        
+        # Connections held by this server process
+        try:
+            active_connections = SystemMonitoringService._count_own_connections()
+        except Exception as e:
+            logger.warning("Connection count error: %s", e)
+            active_connections = 0
+        
+        return SystemMetrics(
+            timestamp=datetime.utcnow(),
+            cpu_usage=cpu_usage,
+            memory_usage=memory_usage,
+            disk_usage=disk_usage,
+            gpu_usage=gpu_usage,
+            gpu_memory_usage=gpu_memory_usage,
+            gpu_temperature=gpu_temperature,
+            gpu_power_usage=gpu_power_usage,
+            power_consumption=total_power_consumption,
+            active_connections=active_connections,
+            request_rate=request_rate
+        )
+    
+    @staticmethod
+    def _sample(request_rate: float):
+        thread_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        
+        metrics = SystemMonitoringService.sample_system_metrics(request_rate)
+        
+        stats = SystemMonitoringService._sampler_stats
+        stats["last_thread_ms"] = (time.perf_counter() - thread_started) * 1000
+        stats["last_thread_cpu_ms"] = (time.thread_time() - cpu_started) * 1000
+        return metrics
+    
+    @staticmethod
+    def persist_rollup(rollup: Rollup):
+        """Store one hourly rollup. Blocking - called from a worker thread"""
+        try:
+            system_metrics_ref.add(rollup.to_dict())
+        except Exception as e:
+            logger.error("Failed to store metrics rollup: %s", e)
+    
+    @staticmethod
+    async def collect_system_metrics():
+        """
+        Sample system metrics without blocking the event loop and add them to the
+        in-memory buffer. Only completed hourly rollups are written to Firestore.
+        The hand-off to the worker thread and the bookkeeping run on the loop;
+        that time is reported as the sampler's loop overhead.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            loop_started = time.perf_counter()
+            sample = loop.run_in_executor(None, SystemMonitoringService._sample, request_metrics.sample_rate())
+            loop_ms = (time.perf_counter() - loop_started) * 1000
             
-            # Network and connections
-            active_connections = len(psutil.net_connections())
+            metrics = await sample
             
-            metrics = SystemMetrics(
-                timestamp=datetime.utcnow(),
-                cpu_usage=cpu_usage,
-                memory_usage=memory_usage,
-                disk_usage=disk_usage,
-                gpu_usage=gpu_usage,
-                gpu_memory_usage=gpu_memory_usage,
-                gpu_temperature=gpu_temperature,
-                gpu_power_usage=gpu_power_usage,
-                power_consumption=total_power_consumption,
-                active_connections=active_connections,
-                request_rate=0
-            )
+            resumed = time.perf_counter()
+            completed_hour = metrics_buffer.add(metrics.dict())
+            if completed_hour is not None and settings.SINGLETON_JOBS_ENABLED:
+                loop.run_in_executor(None, SystemMonitoringService.persist_rollup, completed_hour)
             
-            # Store in Firestore with error handling
-            try:
-                system_metrics_ref.add(metrics.dict())
-                print(f"Stored metrics: CPU={cpu_usage}%, Memory={memory_usage}%, GPU={gpu_usage}%")
-            except Exception as e:
-                print(f"Firestore storage error: {e}")
+            stats = SystemMonitoringService._sampler_stats
+            stats["samples"] += 1
+            loop_ms += (time.perf_counter() - resumed) * 1000
+            stats["last_loop_ms"] = loop_ms
+            stats["max_loop_ms"] = max(stats["max_loop_ms"], loop_ms)
+            stats["total_loop_ms"] += loop_ms
             
             return metrics
             
-        except Exception as e:
-            print(f"System metrics collection error: {e}")
+        except Exception:
+            logger.exception("System metrics collection error")
             return None
     
     @staticmethod
-    async def get_system_analytics():
-        # Get recent metrics (last 24 hours)
-        from datetime import datetime, timedelta
-        
-        yesterday = datetime.utcnow() - timedelta(hours=24)
+    def flush():
+        """Persist the partial hour on shutdown so it is not lost"""
+        rollup = metrics_buffer.flush()
+        if rollup is not None and settings.SINGLETON_JOBS_ENABLED:
+            SystemMonitoringService.persist_rollup(rollup)
+    
+    @staticmethod
+    def get_sampler_stats():
+        stats = SystemMonitoringService._sampler_stats
+        return {
+            "samples": stats["samples"],
+            "last_loop_ms": round(stats["last_loop_ms"], 4),
+            "max_loop_ms": round(stats["max_loop_ms"], 4),
+            "avg_loop_ms": round(stats["total_loop_ms"] / stats["samples"], 4) if stats["samples"] else 0,
+            "last_thread_ms": round(stats["last_thread_ms"], 3),
+            "last_thread_cpu_ms": round(stats["last_thread_cpu_ms"], 3),
+            "gpu_probe_enabled": SystemMonitoringService._gpu_probe_enabled,
+            "buffer": metrics_buffer.size()
+        }
+    
+    @staticmethod
+    def _load_persisted(since: datetime, until: Optional[datetime] = None) -> List[Dict]:
+        """Rollups (and legacy per-sample documents) from Firestore stamped after `since`, up to `until`"""
+        query = system_metrics_ref.where("timestamp", ">", since)
+        if until is not None:
+            query = query.where("timestamp", "<=", until)
+        return [metric.to_dict() for metric in query.stream()]
+    
+    @staticmethod
+    def _window(hours: int = 24) -> Optional[Rollup]:
+        """
+        One rollup covering the last `hours`: the in-memory buffer, plus the
+        persisted hourly rollups that end by its oldest minute (e.g. after a
+        restart). The hour the buffer starts in comes from the buffer alone,
+        since its rollup also holds minutes the buffer has.
+        """
+        since = datetime.utcnow() - timedelta(hours=hours)
+        oldest = metrics_buffer.oldest()
+        window = Rollup(since, "window")
         
-        # Query using datetime object directly
-        metrics_query = system_metrics_ref.where("timestamp", ">", yesterday).stream()
+        if oldest is None or oldest > since:
+            until = oldest - timedelta(hours=1) if oldest is not None else None
+            documents = SystemMonitoringService._load_persisted(since, until)
+            for document in sorted(documents, key=lambda d: to_naive_utc(d.get('timestamp')) or since):
+                window.add_document(document)
         
-        metrics_list = []
-        for metric in metrics_query:
-            data = metric.to_dict()
-            # Convert Firestore timestamp to datetime if needed
-            if 'timestamp' in data and hasattr(data['timestamp'], 'timestamp'):
-                data['timestamp'] = data['timestamp'].timestamp()
-            metrics_list.append(data)
+        buffered = metrics_buffer.aggregate(since)
+        if buffered.sample_count:
+            window.add_rollup(buffered)
+        return window if window.sample_count else None
+    
+    @staticmethod
+    def get_history(resolution: str = "1m", hours: int = 24) -> List[Dict]:
+        return metrics_buffer.history(datetime.utcnow() - timedelta(hours=hours), resolution)
+    
+    @staticmethod
+    async def get_system_analytics():
+        window = SystemMonitoringService._window()
         
-        if not metrics_list:
-            print("No metrics found in the last 24 hours")
+        if window is None or window.sample_count == 0:
+            logger.debug("No metrics found in the last 24 hours")
             return {
                 "cpu_usage": 0,
                 "memory_usage": 0,
@@ -141,68 +258,40 @@ class SystemMonitoringService:
                 "active_connections": 0
             }
         
-        # Debug: print what we found
-        print(f"Found {len(metrics_list)} metrics records")
-        
-        # Calculate averages for all metrics
-        def safe_avg(values):
-            valid_values = [v for v in values if v is not None]
-            return sum(valid_values) / len(valid_values) if valid_values else 0
-        
-        avg_cpu = safe_avg([m.get('cpu_usage', 0) for m in metrics_list])
-        avg_memory = safe_avg([m.get('memory_usage', 0) for m in metrics_list])
-        avg_disk = safe_avg([m.get('disk_usage', 0) for m in metrics_list])
-        avg_gpu = safe_avg([m.get('gpu_usage', 0) for m in metrics_list])
-        avg_gpu_memory = safe_avg([m.get('gpu_memory_usage', 0) for m in metrics_list])
-        avg_gpu_temp = safe_avg([m.get('gpu_temperature', 0) for m in metrics_list])
-        avg_power = safe_avg([m.get('power_consumption', 0) for m in metrics_list])
-        
+        averages = window.averages()
         return {
-            "cpu_usage": round(avg_cpu, 2),
-            "memory_usage": round(avg_memory, 2),
-            "disk_usage": round(avg_disk, 2),
-            "gpu_usage": round(avg_gpu, 2),
-            "gpu_memory_usage": round(avg_gpu_memory, 2),
-            "gpu_temperature": round(avg_gpu_temp, 1),
-            "power_consumption": round(avg_power, 1),
+            "cpu_usage": round(averages["cpu_usage"] or 0, 2),
+            "memory_usage": round(averages["memory_usage"] or 0, 2),
+            "disk_usage": round(averages["disk_usage"] or 0, 2),
+            "gpu_usage": round(averages["gpu_usage"] or 0, 2),
+            "gpu_memory_usage": round(averages["gpu_memory_usage"] or 0, 2),
+            "gpu_temperature": round(averages["gpu_temperature"] or 0, 1),
+            "power_consumption": round(averages["power_consumption"] or 0, 1),
             "system_uptime": psutil.boot_time(),
-            "active_connections": metrics_list[-1].get('active_connections', 0)
+            "active_connections": window.last.get('active_connections', 0),
+            "request_rate": round(averages["request_rate"] or 0, 3),
+            "avg_response_time": request_metrics.average_response_time(),
+            "sample_count": window.sample_count
         }
     
     @staticmethod
     async def get_gpu_analytics():
         """Get detailed GPU analytics"""
-        from datetime import datetime, timedelta
-        
-        yesterday = datetime.utcnow() - timedelta(hours=24)
-        metrics_query = system_metrics_ref.where("timestamp", ">", yesterday).stream()
-        
-        metrics_list = []
-        for metric in metrics_query:
-            data = metric.to_dict()
-            metrics_list.append(data)
-        
-        if not metrics_list:
-            return {"gpu_available": False}
-        
-        # Filter metrics that have GPU data
-        gpu_metrics = [m for m in metrics_list if m.get('gpu_usage') is not None]
+        window = SystemMonitoringService._window()
         
-        if not gpu_metrics:
+        # Only samples that carried GPU data count towards the GPU figures
+        if window is None or window.counts["gpu_usage"] == 0:
             return {"gpu_available": False}
         
-        def safe_avg(values):
-            valid_values = [v for v in values if v is not None]
-            return sum(valid_values) / len(valid_values) if valid_values else 0
-        
+        averages = window.averages()
         return {
             "gpu_available": True,
-            "gpu_usage_avg": safe_avg([m.get('gpu_usage', 0) for m in gpu_metrics]),
-            "gpu_usage_max": max([m.get('gpu_usage', 0) for m in gpu_metrics]),
-            "gpu_memory_avg": safe_avg([m.get('gpu_memory_usage', 0) for m in gpu_metrics]),
-            "gpu_temperature_avg": safe_avg([m.get('gpu_temperature', 0) for m in gpu_metrics]),
-            "gpu_temperature_max": max([m.get('gpu_temperature', 0) for m in gpu_metrics]),
-            "gpu_power_avg": safe_avg([m.get('gpu_power_usage', 0) for m in gpu_metrics]),
-            "total_power_avg": safe_avg([m.get('power_consumption', 0) for m in gpu_metrics]),
-            "sample_count": len(gpu_metrics)
-        }
\ No newline at end of file
+            "gpu_usage_avg": averages["gpu_usage"],
+            "gpu_usage_max": window.maxima["gpu_usage"],
+            "gpu_memory_avg": averages["gpu_memory_usage"] or 0,
+            "gpu_temperature_avg": averages["gpu_temperature"] or 0,
+            "gpu_temperature_max": window.maxima["gpu_temperature"] or 0,
+            "gpu_power_avg": averages["gpu_power_usage"] or 0,
+            "total_power_avg": averages["power_consumption"] or 0,
+            "sample_count": window.counts["gpu_usage"]
+        }
@@ -2,6 +2,7 @@ from app.firebase_admin import users_ref, db
 from app.models.user_models import UserCreate, UserUpdate, CustomerProfile, BankProfile
 from datetime import date, datetime
 import uuid
+from typing import List, Optional
 
 class UserService:
     
@@ -11,6 +12,13 @@ class UserService:
         today = date.today()
         return today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
     
+    @staticmethod
+    def debt_after(user_doc: dict, delta: float) -> tuple:
+        """(total_debt, current_dti) once `delta` is added to the user's debt"""
+        new_debt = max(0, user_doc.get('total_debt', 0) + delta)
+        new_dti = new_debt / user_doc.get('income', 1) if user_doc.get('income', 0) > 0 else 0
+        return new_debt, new_dti
+    
     @staticmethod
     def calculate_months_employed(employment_start_date: date) -> int:
         """Calculate months employed from start date"""
@@ -108,12 +116,13 @@ class UserService:
             "updated_at": datetime.utcnow()
         })
     
+    @staticmethod
+    def users_query(role: str = None, fields: Optional[List[str]] = None):
+        """Query for all users or those with `role`, optionally projected onto `fields`"""
+        query = users_ref.where("role", "==", role) if role else users_ref
+        return query.select(fields) if fields else query
+    
     @staticmethod
     async def get_all_users(role: str = None):
-        if role:
-            query = users_ref.where("role", "==", role)
-        else:
-            query = users_ref
-        
-        users = query.stream()
+        users = UserService.users_query(role).stream()
         return [user.to_dict() for user in users]
\ No newline at end of file
@@ -0,0 +1,172 @@
+"""
+Admission control: per-class concurrency limits with bounded, prioritised
+queues in front of the request handlers.
+
+Every request falls into a traffic class. A request runs when both the
+worker-wide limit (ADMISSION_MAX_CONCURRENCY) and its class limit have room;
+otherwise it waits in its class queue. Freed slots go to the waiting
+request of the highest-priority class first, so scoring bursts - which
+hold a slot for the whole model call - cannot starve bank officers and
+dashboards.
+
+Waiting is bounded. A request is shed with 503 and Retry-After when its
+class queue is full, when the wait predicted from the class's recent
+service time already exceeds the queue timeout (fail fast, instead of
+timing out later), or when it actually waits that long.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+
+# Weight of the newest observation in the service-time average
+EWMA_ALPHA = 0.2
+
+class AdmissionRejected(Exception):
+
+    def __init__(self, traffic_class: str, reason: str, retry_after: float):
+        super().__init__(f"{traffic_class} request shed: {reason}")
+        self.traffic_class = traffic_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TrafficClass:
+
+    def __init__(self, name: str, priority: int, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.priority = priority  # lower is served first
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "deadline": 0, "timeout": 0}
+        self.wait_seconds_total = 0.0
+        self.service_seconds: Optional[float] = None  # EWMA
+
+    def predicted_wait(self) -> float:
+        """Seconds until a request joining the queue now would start"""
+        if self.service_seconds is None:
+            return 0.0
+        return (self.waiting + 1) * self.service_seconds / self.max_concurrency
+
+class AdmissionController:
+    """Single event-loop use: counters are plain ints, no locks"""
+
+    def __init__(self, max_concurrency: int, classes: List[TrafficClass]):
+        self.max_concurrency = max_concurrency
+        self.classes = {traffic_class.name: traffic_class for traffic_class in classes}
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future, TrafficClass]] = []
+        self._order = itertools.count()
+
+    def _has_room(self, traffic_class: TrafficClass) -> bool:
+        return self.active < self.max_concurrency and traffic_class.active < traffic_class.max_concurrency
+
+    def _start(self, traffic_class: TrafficClass):
+        self.active += 1
+        traffic_class.active += 1
+        traffic_class.admitted += 1
+
+    def _reject(self, traffic_class: TrafficClass, reason: str, retry_after: float):
+        traffic_class.rejected[reason] += 1
+        raise AdmissionRejected(traffic_class.name, reason, retry_after)
+
+    async def acquire(self, name: str):
+        traffic_class = self.classes[name]
+        # Jump the queue only if nobody of the same or higher priority is waiting
+        if self._has_room(traffic_class) and not any(
+            waiter[0] <= traffic_class.priority for waiter in self._waiters if not waiter[2].done()
+        ):
+            self._start(traffic_class)
+            return
+
+        retry_after = max(1.0, traffic_class.predicted_wait())
+        if traffic_class.waiting >= traffic_class.max_queue:
+            self._reject(traffic_class, "queue_full", retry_after)
+        if traffic_class.predicted_wait() > traffic_class.queue_timeout:
+            self._reject(traffic_class, "deadline", retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (traffic_class.priority, next(self._order), future, traffic_class))
+        traffic_class.waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), traffic_class.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._reject(traffic_class, "timeout", retry_after)
+        except asyncio.CancelledError:
+            # The client went away; hand the slot on if it was already granted
+            if future.done() and not future.cancelled():
+                self.release(name, None)
+            future.cancel()
+            raise
+        finally:
+            traffic_class.waiting -= 1
+            traffic_class.wait_seconds_total += time.perf_counter() - queued_at
+
+    def release(self, name: str, service_seconds: Optional[float]):
+        traffic_class = self.classes[name]
+        self.active -= 1
+        traffic_class.active -= 1
+        if service_seconds is not None:
+            if traffic_class.service_seconds is None:
+                traffic_class.service_seconds = service_seconds
+            else:
+                traffic_class.service_seconds += EWMA_ALPHA * (service_seconds - traffic_class.service_seconds)
+        self._wake()
+
+    def _wake(self):
+        """Grant freed slots to the best waiters that fit their class limit"""
+        skipped = []
+        while self._waiters and self.active < self.max_concurrency:
+            waiter = heapq.heappop(self._waiters)
+            future, traffic_class = waiter[2], waiter[3]
+            if future.done():
+                continue
+            if traffic_class.active >= traffic_class.max_concurrency:
+                skipped.append(waiter)
+                continue
+            self._start(traffic_class)
+            future.set_result(None)
+        for waiter in skipped:
+            heapq.heappush(self._waiters, waiter)
+
+    def prometheus_text(self) -> str:
+        worker = f'worker="{os.getpid()}"'
+        lines = [
+            "# HELP admission_in_flight Requests running, by traffic class.",
+            "# TYPE admission_in_flight gauge"
+        ]
+        lines += [f'admission_in_flight{{{worker},class="{c.name}"}} {c.active}' for c in self.classes.values()]
+        lines += ["# HELP admission_queue_depth Requests waiting for a slot.", "# TYPE admission_queue_depth gauge"]
+        lines += [f'admission_queue_depth{{{worker},class="{c.name}"}} {c.waiting}' for c in self.classes.values()]
+        lines += ["# HELP admission_admitted_total Requests admitted.", "# TYPE admission_admitted_total counter"]
+        lines += [f'admission_admitted_total{{{worker},class="{c.name}"}} {c.admitted}' for c in self.classes.values()]
+        lines += ["# HELP admission_rejected_total Requests shed with 503.", "# TYPE admission_rejected_total counter"]
+        for c in self.classes.values():
+            lines += [
+                f'admission_rejected_total{{{worker},class="{c.name}",reason="{reason}"}} {count}'
+                for reason, count in c.rejected.items()
+            ]
+        lines += ["# HELP admission_queue_wait_seconds_total Time spent queued.", "# TYPE admission_queue_wait_seconds_total counter"]
+        lines += [f'admission_queue_wait_seconds_total{{{worker},class="{c.name}"}} {c.wait_seconds_total}' for c in self.classes.values()]
+        return "\n".join(lines) + "\n"
+
+admission = AdmissionController(settings.ADMISSION_MAX_CONCURRENCY, [
+    # Read-only bank and admin views: officers and dashboards stay responsive under load
+    TrafficClass("interactive", 0, settings.ADMISSION_MAX_CONCURRENCY, settings.ADMISSION_QUEUE_SIZE,
+                 settings.ADMISSION_QUEUE_TIMEOUT_SECONDS),
+    TrafficClass("default", 1, settings.ADMISSION_MAX_CONCURRENCY, settings.ADMISSION_QUEUE_SIZE,
+                 settings.ADMISSION_QUEUE_TIMEOUT_SECONDS),
+    # Loan applications: every one runs the model
+    TrafficClass("scoring", 2, settings.ADMISSION_SCORING_CONCURRENCY, settings.ADMISSION_SCORING_QUEUE_SIZE,
+                 settings.ADMISSION_SCORING_QUEUE_TIMEOUT_SECONDS)
+])
@@ -0,0 +1,95 @@
+"""
+Conditional GET (ETag / If-None-Match, Last-Modified / If-Modified-Since)
+for list endpoints that change rarely.
+
+A list's version is the newest `updated_at` in its owner scope - all of a
+customer's loans, all loans of a bank, the whole package catalog - read
+with one limit(1) query on the (owner, updated_at) index instead of
+streaming the list. Every write to these collections sets updated_at and
+documents are never hard-deleted, so anything entering, changing in or
+leaving the filtered list moves the watermark of its (unfiltered) scope.
+
+A matching request gets 304 before the list is read or serialized.
+Responses carry `Cache-Control: private, no-cache`, so browsers keep the
+body and revalidate it on every navigation.
+
+Writers stamp updated_at before they commit, on clocks that differ, so a
+write stamped earlier can commit after a later one has been served without
+moving the watermark. While the watermark is younger than
+CONDITIONAL_GET_SETTLE_SECONDS no ETag or Last-Modified is sent and no 304
+is answered; the list is served in full until it has settled.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Response
+from firebase_admin import firestore
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from app.config import settings
+from app.utils.firestore_utils import to_naive_utc
+
+CACHE_CONTROL = "private, no-cache"
+
+def watermark(query) -> Optional[datetime]:
+    """Newest updated_at among the query's documents. Synchronous."""
+    newest = query.order_by("updated_at", direction=firestore.Query.DESCENDING).limit(1).select(["updated_at"]).stream()
+    for snapshot in newest:
+        return to_naive_utc(snapshot.get("updated_at"))
+    return None
+
+class ListVersion:
+
+    def __init__(self, updated_at: Optional[datetime], *variant):
+        self.updated_at = updated_at
+        # Whole-second HTTP dates also need the watermark to be at least a second old
+        settle = timedelta(seconds=max(1.0, settings.CONDITIONAL_GET_SETTLE_SECONDS))
+        self.settled = updated_at is None or datetime.utcnow() - updated_at >= settle
+        # The variant (owner, query parameters, media type) keeps different bodies apart
+        key = "\x00".join(str(part) for part in (*variant, updated_at.isoformat() if updated_at else ""))
+        self.etag = f'W/"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+    def matches(self, request: Request) -> bool:
+        """True if the client's copy is current"""
+        if not self.settled:
+            return False
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # Weak comparison: the W/ prefix is ignored
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or self.etag.removeprefix("W/") in tags
+
+        if_modified_since = request.headers.get("if-modified-since")
+        last_modified = self._last_modified()
+        if if_modified_since is None or last_modified is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified <= since
+
+    def _last_modified(self) -> Optional[datetime]:
+        if self.updated_at is None or not self.settled:
+            return None
+        return self.updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+
+    def apply(self, response: Response) -> Response:
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        if not self.settled:
+            return response
+        response.headers["ETag"] = self.etag
+        last_modified = self._last_modified()
+        if last_modified is not None:
+            response.headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+        return response
+
+    def not_modified(self) -> Response:
+        return self.apply(Response(status_code=304))
+
+async def list_version(query, *variant) -> ListVersion:
+    """Version of the list whose owner scope is `query`"""
+    return ListVersion(await run_in_threadpool(watermark, query), *variant)
@@ -0,0 +1,242 @@
+"""
+In-process event bus with a durable outbox.
+
+A request records its domain events in the `loan_events` collection in the
+same write batch as the primary change, so an event exists exactly when the
+change does, and hands them to this process's dispatcher once the batch has
+committed. Handlers then run in the background:
+
+  * each handler runs in a transaction that re-reads the event and sets the
+    handler's done marker on it, so a handler whose marker is already set -
+    by an earlier attempt or by another process delivering the same event -
+    is skipped rather than applied twice
+  * a failing event is retried with exponential backoff, up to
+    EVENT_MAX_ATTEMPTS, then parked with status "failed"
+  * the recording process holds a lease on the event (next_attempt_at);
+    a periodic sweep claims pending events whose lease ran out - left
+    behind by a crash, a restart or a full queue - with a precondition on
+    the event's update time, so only one sweep takes each
+
+Delivery is at-least-once, but each handler's writes are applied once.
+Events of one partition (the customer) are dispatched in order by the same
+task, so handlers reading and rewriting a user document rarely contend.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import FailedPrecondition
+
+from app.config import settings
+from app.firebase_admin import db, loan_events_ref
+from app.utils.firestore_utils import run_transaction
+
+logger = logging.getLogger(__name__)
+
+class EventStatus:
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+
+class EventBus:
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Tuple[str, Callable]]] = {}
+        self.dispatched = 0
+        self.retries = 0
+        self.failed = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def subscribe(self, event_type: str, name: str, handler: Callable):
+        """
+        Register handler(event, transaction) for event_type. The handler reads
+        and writes through `transaction`; `name` keys its done marker, so keep
+        it stable.
+        """
+        self.handlers.setdefault(event_type, []).append((name, handler))
+
+    def record(self, batch, event_type: str, loan_id: str, partition_key: str, payload: Dict) -> Dict:
+        """Add an event to the outbox as part of `batch`; publish() it after the commit"""
+        now = datetime.utcnow()
+        event = {
+            "event_id": str(uuid.uuid4()),
+            "type": event_type,
+            "loan_id": loan_id,
+            "partition_key": partition_key,
+            "payload": payload,
+            "status": EventStatus.PENDING,
+            "attempts": 0,
+            "handlers_done": {},
+            "created_at": now,
+            "next_attempt_at": now + timedelta(seconds=settings.EVENT_LEASE_SECONDS)
+        }
+        batch.set(loan_events_ref.document(event["event_id"]), event)
+        return event
+
+    def publish(self, *events: Dict):
+        """Queue committed events for dispatch; without a running dispatcher the sweep delivers them"""
+        if self._loop is None:
+            return
+        for event in events:
+            self._loop.call_soon_threadsafe(self._enqueue, event)
+
+    def _enqueue(self, event: Dict):
+        queue = self._queues[zlib.crc32(event["partition_key"].encode()) % len(self._queues)]
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Still leased; the sweep takes it once the lease runs out
+            logger.warning("Event queue full", extra={"event_id": event["event_id"]})
+
+    def start(self, sweep: bool = True):
+        """Start the dispatch tasks and, with `sweep`, the outbox sweep; call from the event loop"""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queues = [asyncio.Queue(maxsize=settings.EVENT_QUEUE_SIZE) for _ in range(settings.EVENT_DISPATCH_WORKERS)]
+        self._tasks = [self._loop.create_task(self._consume(queue)) for queue in self._queues]
+        if sweep:
+            self._tasks.append(self._loop.create_task(self._sweep_periodically()))
+
+    def stop(self):
+        """Events still queued stay pending in the outbox and are swept up later"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._loop = None
+
+    async def _consume(self, queue: asyncio.Queue):
+        while True:
+            event = await queue.get()
+            try:
+                await asyncio.to_thread(self.dispatch, event)
+            except Exception:
+                logger.exception("Error dispatching event", extra={"event_id": event["event_id"]})
+
+    @staticmethod
+    def _run_handler(transaction, event_ref, name: str, handler: Callable) -> bool:
+        """
+        Run one handler in `transaction` unless the stored event shows it already
+        ran. False once the event is no longer pending.
+        """
+        stored = event_ref.get(transaction=transaction).to_dict()
+        if not stored or stored.get("status") != EventStatus.PENDING:
+            return False
+        if not (stored.get("handlers_done") or {}).get(name):
+            handler(stored, transaction)
+            transaction.update(event_ref, {f"handlers_done.{name}": True})
+        return True
+
+    def dispatch(self, event: Dict) -> bool:
+        """
+        Run the handlers that have not succeeded yet; returns True once all have.
+        Synchronous - run it off the event loop.
+        """
+        event_ref = loan_events_ref.document(event["event_id"])
+        # The queued copy may be stale: another process can have delivered it since
+        stored = event_ref.get().to_dict()
+        if not stored or stored.get("status") != EventStatus.PENDING:
+            return bool(stored) and stored.get("status") == EventStatus.DONE
+        event = stored
+        done = dict(event.get("handlers_done") or {})
+        error = None
+        for name, handler in self.handlers.get(event["type"], []):
+            if done.get(name):
+                continue
+            try:
+                if not run_transaction(self._run_handler, event_ref, name, handler):
+                    return False  # finished or parked elsewhere meanwhile
+                done[name] = True
+            except Exception as e:
+                logger.exception("Event handler failed", extra={"event_id": event["event_id"], "handler": name})
+                error = f"{name}: {e}"
+                break
+
+        now = datetime.utcnow()
+        if error is None:
+            event_ref.update({
+                "status": EventStatus.DONE,
+                "processed_at": now,
+                # Firestore TTL policy on expire_at removes delivered events
+                "expire_at": now + timedelta(days=settings.EVENT_RETENTION_DAYS)
+            })
+            self.dispatched += 1
+            return True
+
+        attempts = event.get("attempts", 0) + 1
+        if attempts >= settings.EVENT_MAX_ATTEMPTS:
+            event_ref.update({"status": EventStatus.FAILED, "attempts": attempts, "last_error": error, "failed_at": now})
+            logger.error("Event failed permanently", extra={"event_id": event["event_id"], "attempts": attempts})
+            self.failed += 1
+            return False
+
+        delay = settings.EVENT_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+        # Keep the lease past the retry, so the sweep does not pick the event up meanwhile
+        event_ref.update({
+            "attempts": attempts,
+            "last_error": error,
+            "next_attempt_at": now + timedelta(seconds=delay + settings.EVENT_LEASE_SECONDS)
+        })
+        self.retries += 1
+        if self._loop is not None:
+            retry = {**event, "attempts": attempts, "handlers_done": done}
+            self._loop.call_soon_threadsafe(self._loop.call_later, delay, self._enqueue, retry)
+        return False
+
+    def claim_expired(self, limit: int = 100) -> List[Dict]:
+        """Pending events whose lease ran out, re-leased to this process. Synchronous."""
+        now = datetime.utcnow()
+        query = loan_events_ref.where("status", "==", EventStatus.PENDING) \
+            .where("next_attempt_at", "<=", now) \
+            .order_by("next_attempt_at") \
+            .limit(limit)
+        lease_until = now + timedelta(seconds=settings.EVENT_LEASE_SECONDS)
+        claimed = []
+        for snapshot in query.stream():
+            try:
+                # Fails if another sweep or a dispatcher wrote the event since it was read
+                snapshot.reference.update(
+                    {"next_attempt_at": lease_until}, option=db.write_option(last_update_time=snapshot.update_time)
+                )
+            except FailedPrecondition:
+                continue
+            claimed.append(snapshot.to_dict())
+        return claimed
+
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(settings.EVENT_SWEEP_INTERVAL_SECONDS)
+            try:
+                started = time.perf_counter()
+                claimed = await asyncio.to_thread(self.claim_expired)
+                for event in claimed:
+                    self._enqueue(event)
+                if claimed:
+                    logger.info("Swept up expired events", extra={
+                        "events": len(claimed), "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+                    })
+            except Exception:
+                logger.exception("Error sweeping events")
+
+    def prometheus_text(self) -> str:
+        worker = f'worker="{os.getpid()}"'
+        lines = []
+        for name, help_text, value in (
+            ("loan_events_dispatched_total", "Events whose handlers all succeeded.", self.dispatched),
+            ("loan_events_retries_total", "Event dispatches that failed and were rescheduled.", self.retries),
+            ("loan_events_failed_total", "Events parked after EVENT_MAX_ATTEMPTS.", self.failed)
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name}{{{worker}}} {value}"]
+        queued = sum(queue.qsize() for queue in self._queues)
+        lines += ["# HELP loan_events_queued Events waiting for this process's dispatcher.",
+                  "# TYPE loan_events_queued gauge", f"loan_events_queued{{{worker}}} {queued}"]
+        return "\n".join(lines) + "\n"
+
+event_bus = EventBus()
@@ -0,0 +1,22 @@
+"""
+Token verifier for load tests and local development, selected with
+AUTH_BACKEND=fake. Tokens are not signed: "fake:<uid>:<email>" authenticates as
+<uid>. Never enable it on a deployment reachable by real users.
+"""
+from typing import Dict
+
+TOKEN_PREFIX = "fake:"
+
+def make_token(uid: str, email: str = "") -> str:
+    return f"{TOKEN_PREFIX}{uid}:{email}"
+
+class FakeAuth:
+
+    @staticmethod
+    def verify_id_token(id_token: str, check_revoked: bool = False) -> Dict:
+        if not id_token.startswith(TOKEN_PREFIX):
+            raise ValueError("Not a fake token")
+        uid, _, email = id_token[len(TOKEN_PREFIX):].partition(":")
+        if not uid:
+            raise ValueError("Fake token has no uid")
+        return {"uid": uid, "email": email or None, "email_verified": True}
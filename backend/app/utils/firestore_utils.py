@@ -1,4 +1,6 @@
-from app.firebase_admin import users_ref
+from app.firebase_admin import db, users_ref
+from datetime import datetime
+from firebase_admin import firestore
 
 def get_user_by_uid(uid: str):
     doc = users_ref.document(uid).get()
@@ -8,4 +10,19 @@ def get_user_by_uid(uid: str):
 
 def user_exists(uid: str) -> bool:
     doc = users_ref.document(uid).get()
-    return doc.exists
\ No newline at end of file
+    return doc.exists
+
+def to_naive_utc(value):
+    """Firestore returns tz-aware UTC timestamps while the services write naive UTC"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+def run_transaction(func, *args):
+    """
+    Run func(transaction, *args) in a new transaction, retried when it loses
+    a race on a document it read. Synchronous.
+    """
+    return firestore.transactional(func)(db.transaction(), *args)
@@ -0,0 +1,171 @@
+"""
+Idempotency-Key support for the write endpoints that clients retry.
+
+The first request with a key claims it by creating its record in
+`idempotency_keys` (create() fails if the document exists, so exactly one
+request wins across processes), runs, and stores the encoded response. A
+repeat of the key then gets that response back without touching the model
+or the database again:
+
+  * a repeat in the same process while the first is still running waits for
+    it and shares its result
+  * a repeat in another process gets 409 with Retry-After until the record
+    is completed (or goes stale after IDEMPOTENCY_LOCK_SECONDS, e.g. when the
+    first process died, and is taken over - with a precondition on the
+    record's update time, so only one request takes it)
+  * the same key with a different request body is rejected with 422
+
+Failed requests release their key, so the client can retry them. If the
+operation succeeded but its record cannot be completed, the result is still
+returned and the failure logged; the operation is never rolled back. Records
+carry expire_at for a Firestore TTL policy (IDEMPOTENCY_TTL_HOURS).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+
+from app.config import settings
+from app.firebase_admin import db, idempotency_keys_ref
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+COMPLETE_ATTEMPTS = 3
+
+class KeyStatus:
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+
+# record id -> (request fingerprint, future) of the request holding the key in this process
+_in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+def _record_id(user_id: str, scope: str, key: str) -> str:
+    return hashlib.sha256(f"{user_id}\x00{scope}\x00{key}".encode()).hexdigest()
+
+def _fingerprint(payload) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode()).hexdigest()
+
+def _mismatch() -> HTTPException:
+    return HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+
+def _in_progress() -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail="A request with this Idempotency-Key is still in progress",
+        headers={"Retry-After": "1"}
+    )
+
+def _claim(record_ref, user_id: str, scope: str, fingerprint: str) -> Optional[Dict]:
+    """Claim the key; returns the stored response if the key was already used"""
+    now = datetime.utcnow()
+    record = {
+        "user_id": user_id,
+        "scope": scope,
+        "fingerprint": fingerprint,
+        "status": KeyStatus.IN_PROGRESS,
+        "created_at": now,
+        "expire_at": now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+    }
+    try:
+        record_ref.create(record)
+        return None
+    except AlreadyExists:
+        pass
+
+    snapshot = record_ref.get()
+    existing = snapshot.to_dict()
+    if existing is None:
+        # Released between the create and the read; another request may claim it first
+        try:
+            record_ref.create(record)
+            return None
+        except AlreadyExists:
+            raise _in_progress()
+    if existing.get("fingerprint") != fingerprint:
+        raise _mismatch()
+    if existing.get("status") == KeyStatus.COMPLETED:
+        return existing["response"]
+
+    started = existing.get("created_at")
+    if started is not None and started.tzinfo is not None:
+        started = started.replace(tzinfo=None)
+    if started is None or now - started > timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS):
+        try:
+            # Fails if the owner completed it, or another request took it over, since the read
+            record_ref.update(record, option=db.write_option(last_update_time=snapshot.update_time))
+        except FailedPrecondition:
+            raise _in_progress()
+        logger.warning("Took over a stale idempotency key", extra={"scope": scope})
+        return None
+    raise _in_progress()
+
+async def _complete(record_ref, scope: str, result) -> None:
+    """Store the response on the claimed record, retrying transient failures"""
+    for attempt in range(1, COMPLETE_ATTEMPTS + 1):
+        try:
+            record_ref.update({"status": KeyStatus.COMPLETED, "response": result, "completed_at": datetime.utcnow()})
+            return
+        except Exception:
+            if attempt == COMPLETE_ATTEMPTS:
+                # The operation already ran; a stale takeover may repeat it, but failing the request would too
+                logger.exception("Could not complete idempotency key", extra={"scope": scope})
+                return
+            await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+
+async def run_idempotent(key: Optional[str], user_id: str, scope: str, payload,
+                         operation: Callable[[], Awaitable]) -> Tuple[object, bool]:
+    """
+    Run `operation` at most once per (user, scope, key). Returns the
+    JSON-encoded result and whether it was replayed. Without a key the
+    operation simply runs.
+    """
+    if key is None:
+        return jsonable_encoder(await operation()), False
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    record_id = _record_id(user_id, scope, key)
+    fingerprint = _fingerprint(payload)
+    running = _in_flight.get(record_id)
+    if running is not None:
+        running_fingerprint, running_future = running
+        if running_fingerprint != fingerprint:
+            raise _mismatch()
+        return await asyncio.shield(running_future), True
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[record_id] = (fingerprint, future)
+    record_ref = idempotency_keys_ref.document(record_id)
+    try:
+        stored = _claim(record_ref, user_id, scope, fingerprint)
+        if stored is not None:
+            future.set_result(stored)
+            return stored, True
+
+        try:
+            result = jsonable_encoder(await operation())
+        except BaseException:
+            record_ref.delete()
+            raise
+        future.set_result(result)
+        await _complete(record_ref, scope, result)
+        return result, False
+    except BaseException as e:
+        if future.done():
+            pass
+        elif isinstance(e, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(e)
+            # Retrieved here so an unawaited future does not log the error again
+            future.exception()
+        raise
+    finally:
+        del _in_flight[record_id]
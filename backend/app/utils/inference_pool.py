@@ -0,0 +1,283 @@
+"""
+Model inference in dedicated worker processes.
+
+Feature rows and results live in two shared-memory float32 arrays divided
+into slots; only small fixed-size records travel over OS pipes, so a
+prediction costs no pickling. Each API process owns a contiguous range of
+slots and its own response pipe:
+
+    API process                               inference worker (spawned)
+    write features[slot]     --(slot, tag)-->     read up to INFERENCE_MAX_BATCH records
+    await the slot's future                       results[slots] = model(features[slots])
+    read results[slot]     <--(slot, tag, ok)--   reply on each owner's pipe
+
+Records are written with a single write() below PIPE_BUF, which the kernel
+keeps atomic, and read in whole multiples of the record size, so any number
+of processes share a pipe without a lock - and a worker killed mid-read
+cannot leave one held, as it would with a multiprocessing.Queue.
+
+Workers are spawned, not forked, so TensorFlow is only ever imported there.
+The tag echoes back with the reply; a reply for a slot that has since been
+reused is ignored.
+"""
+import asyncio
+import fcntl
+import itertools
+import logging
+import multiprocessing
+import os
+import select
+import struct
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+N_FEATURES = 7
+
+REQUEST = struct.Struct("<iq")  # slot, tag
+RESPONSE = struct.Struct("<iqi")  # slot, tag, ok
+STOP_SLOT = -1
+
+# The client of this process, once attached to a pool
+client: Optional["InferenceClient"] = None
+
+def _reserve_pipe_capacity(connection, size: int):
+    """Grow the pipe so every outstanding record fits and writers never block"""
+    if hasattr(fcntl, "F_SETPIPE_SZ") and size > fcntl.fcntl(connection.fileno(), fcntl.F_GETPIPE_SZ):
+        fcntl.fcntl(connection.fileno(), fcntl.F_SETPIPE_SZ, size)
+
+def _worker_main(index: int, feature_name: str, result_name: str, total_slots: int, slots_per_process: int,
+                 request_reader, request_writer, response_writers: List, max_batch: int):
+    """Entry point of an inference worker process"""
+    from app.utils.logging_config import configure_logging
+    configure_logging()
+
+    # The segments stay registered with the pool owner's resource tracker,
+    # which spawned children share; the owner unlinks them
+    features_memory = shared_memory.SharedMemory(name=feature_name)
+    results_memory = shared_memory.SharedMemory(name=result_name)
+    features = np.ndarray((total_slots, N_FEATURES), dtype=np.float32, buffer=features_memory.buf)
+    results = np.ndarray((total_slots,), dtype=np.float32, buffer=results_memory.buf)
+
+    from app.utils import model_utils
+    model_utils.configure_threads(settings.TF_INTRA_OP_THREADS, settings.TF_INTER_OP_THREADS)
+    model_utils.load_model()
+    model_utils.load_scaler()
+    # Build the forward function before taking traffic
+    model_utils.predict_batch(np.zeros((1, N_FEATURES), dtype=np.float32))
+    logger.info("Inference worker %d ready", index)
+
+    response_fds = [connection.fileno() for connection in response_writers]
+    stopping = False
+    while not stopping:
+        batch = []
+        for slot, tag in REQUEST.iter_unpack(os.read(request_reader.fileno(), REQUEST.size * max_batch)):
+            if slot != STOP_SLOT:
+                batch.append((slot, tag))
+            elif stopping:
+                os.write(request_writer.fileno(), REQUEST.pack(STOP_SLOT, 0))  # another worker's
+            else:
+                stopping = True
+        if not batch:
+            continue
+
+        slots = np.fromiter((slot for slot, _ in batch), dtype=np.int64, count=len(batch))
+        try:
+            results[slots] = model_utils.predict_batch(features[slots])
+            ok = 1
+        except Exception:
+            logger.exception("Inference batch failed", extra={"batch_size": len(batch)})
+            ok = 0
+        replies = {}
+        for slot, tag in batch:
+            replies.setdefault(slot // slots_per_process, []).append(RESPONSE.pack(slot, tag, ok))
+        for owner, records in replies.items():
+            os.write(response_fds[owner], b"".join(records))
+
+    features_memory.close()
+    results_memory.close()
+
+class InferencePool:
+    """
+    Owns the shared memory, the pipes and the worker processes. Create and
+    start it before forking API processes so they inherit all of them.
+    """
+
+    def __init__(self, workers: int, api_processes: int = 1, slots_per_process: int = 256, max_batch: int = 64):
+        if RESPONSE.size * max_batch > select.PIPE_BUF:
+            raise ValueError(f"INFERENCE_MAX_BATCH {max_batch} makes replies too large for an atomic pipe write")
+        self.workers = workers
+        self.api_processes = api_processes
+        self.slots_per_process = slots_per_process
+        self.max_batch = max_batch
+        self.total_slots = api_processes * slots_per_process
+
+        self._features_memory = shared_memory.SharedMemory(create=True, size=self.total_slots * N_FEATURES * 4)
+        self._results_memory = shared_memory.SharedMemory(create=True, size=self.total_slots * 4)
+        self.features = np.ndarray((self.total_slots, N_FEATURES), dtype=np.float32, buffer=self._features_memory.buf)
+        self.results = np.ndarray((self.total_slots,), dtype=np.float32, buffer=self._results_memory.buf)
+
+        self._context = multiprocessing.get_context("spawn")
+        # A slot has at most one record outstanding in each direction
+        self.request_reader, self.request_writer = self._context.Pipe(duplex=False)
+        _reserve_pipe_capacity(self.request_writer, (self.total_slots + workers) * REQUEST.size)
+        self.responses = [self._context.Pipe(duplex=False) for _ in range(api_processes)]
+        for _, writer in self.responses:
+            _reserve_pipe_capacity(writer, slots_per_process * RESPONSE.size)
+        self.processes: List = [None] * workers
+        self.restarts = 0
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                index, self._features_memory.name, self._results_memory.name, self.total_slots,
+                self.slots_per_process, self.request_reader, self.request_writer,
+                [writer for _, writer in self.responses], self.max_batch
+            ),
+            name=f"inference-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self._start_worker(index)
+        logger.info("Started %d inference workers, %d slots", self.workers, self.total_slots)
+
+    def check_workers(self):
+        """Restart workers that died; call periodically from the process that started the pool"""
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.error("Inference worker %d exited with status %s, restarting", index, process.exitcode)
+                self.restarts += 1
+                self._start_worker(index)
+
+    def stop(self, timeout: float = 10.0):
+        for _ in self.processes:
+            os.write(self.request_writer.fileno(), REQUEST.pack(STOP_SLOT, 0))
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is not None:
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.terminate()
+        self._features_memory.close()
+        self._results_memory.close()
+        self._features_memory.unlink()
+        self._results_memory.unlink()
+
+class InferenceClient:
+    """The API-process side: slot allocation, request writes and reply dispatch"""
+
+    def __init__(self, pool: InferencePool, index: int, timeout: float):
+        self.pool = pool
+        self.index = index
+        self.timeout = timeout
+        first = index * pool.slots_per_process
+        self.free = deque(range(first, first + pool.slots_per_process))
+        self.pending = {}  # slot -> (tag, future)
+        # Unique per process, so replies meant for a dead predecessor never match
+        self.tags = itertools.count(os.getpid() << 32)
+        self.request_fd = pool.request_writer.fileno()
+        self.response_fd = pool.responses[index][0].fileno()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.available: Optional[asyncio.Semaphore] = None
+        self.completed = 0
+        self.timeouts = 0
+        self.failures = 0
+        self._reader: Optional[threading.Thread] = None
+
+    def _start(self):
+        self.loop = asyncio.get_running_loop()
+        self.available = asyncio.Semaphore(len(self.free))
+        self._reader = threading.Thread(target=self._read_responses, name="inference-replies", daemon=True)
+        self._reader.start()
+
+    def _read_responses(self):
+        # Replies left over from this slot range's previous owner fail the tag check
+        while True:
+            data = os.read(self.response_fd, RESPONSE.size * self.pool.slots_per_process)
+            self.loop.call_soon_threadsafe(self._complete, list(RESPONSE.iter_unpack(data)))
+
+    def _complete(self, replies: list):
+        for slot, tag, ok in replies:
+            entry = self.pending.get(slot)
+            if entry is None or entry[0] != tag:
+                continue
+            future = entry[1]
+            if not future.done():
+                if ok:
+                    future.set_result(float(self.pool.results[slot]))
+                else:
+                    future.set_exception(RuntimeError("Inference failed in the worker pool"))
+            self._release(slot)
+            self.completed += 1
+
+    def _release(self, slot: int):
+        del self.pending[slot]
+        self.free.append(slot)
+        self.available.release()
+
+    def _reclaim(self, slot: int, tag: int):
+        """Free a timed-out or cancelled slot whose reply never came (its worker died)"""
+        entry = self.pending.get(slot)
+        if entry is not None and entry[0] == tag:
+            self._release(slot)
+
+    async def predict(self, row) -> float:
+        if self.loop is None:
+            self._start()
+        await self.available.acquire()
+        slot = self.free.popleft()
+        tag = next(self.tags)
+        self.pool.features[slot] = row
+        future = self.loop.create_future()
+        self.pending[slot] = (tag, future)
+        os.write(self.request_fd, REQUEST.pack(slot, tag))
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            # A late reply still frees the slot; reusing it sooner could let
+            # a slow batch overwrite the next request's result
+            self.loop.call_later(self.timeout, self._reclaim, slot, tag)
+            raise
+        except asyncio.CancelledError:
+            # Client disconnect or shutdown: same as a timeout, the reply may never come
+            self.loop.call_later(self.timeout, self._reclaim, slot, tag)
+            raise
+        except RuntimeError:
+            self.failures += 1
+            raise
+
+    def prometheus_text(self) -> str:
+        worker = f'worker="{os.getpid()}"'
+        lines = []
+        for name, kind, help_text, value in (
+            ("inference_pool_in_flight", "gauge", "Predictions waiting on the inference workers.", len(self.pending)),
+            ("inference_pool_completed_total", "counter", "Predictions answered by the inference workers.", self.completed),
+            ("inference_pool_timeouts_total", "counter", "Predictions that timed out.", self.timeouts),
+            ("inference_pool_failures_total", "counter", "Predictions that failed in a worker.", self.failures)
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name}{{{worker}}} {value}"]
+        return "\n".join(lines) + "\n"
+
+def attach(pool: InferencePool, index: int = 0):
+    """Route this process's predictions through the pool, using slot range `index`"""
+    global client
+    client = InferenceClient(pool, index, settings.INFERENCE_TIMEOUT_SECONDS)
+
+def create_pool(api_processes: int = 1) -> InferencePool:
+    return InferencePool(
+        settings.INFERENCE_WORKERS, api_processes, settings.INFERENCE_SLOTS_PER_PROCESS, settings.INFERENCE_MAX_BATCH
+    )
@@ -0,0 +1,122 @@
+"""
+Server-Sent Events fan-out.
+
+A LiveFeed holds this process's subscribers to one stream of events. An
+event is encoded once and queued to every subscriber. A subscriber more than
+LIVE_FEED_QUEUE_SIZE events behind has its backlog replaced by a fresh
+snapshot (feeds without one drop the backlog), so a slow client neither
+blocks the others nor grows memory. Subscribers also get the snapshot when
+they connect, so a reconnecting client simply starts over from it; streams
+end after LIVE_FEED_MAX_CONNECTION_SECONDS and clients reconnect.
+"""
+import asyncio
+import os
+from typing import AsyncIterator, Callable, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.utils.json_responses import dumps
+
+KEEP_ALIVE = b": keep-alive\n\n"
+
+def encode_event(event: str, data) -> bytes:
+    # orjson output has no newlines, so the payload is a single data line
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+class LiveFeed:
+    """Single event-loop use: publish() from the loop, call_soon_threadsafe from threads"""
+
+    def __init__(self, name: str, snapshot: Optional[Callable[[], Optional[Tuple[str, object]]]] = None):
+        self.name = name
+        self._snapshot = snapshot  # () -> (event, data), or None while there is nothing to send
+        self._subscribers: Set[asyncio.Queue] = set()
+        self.published = 0
+        self.resyncs = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def on_active(self):
+        """First subscriber joined"""
+
+    def on_idle(self):
+        """Last subscriber left"""
+
+    def subscribe(self) -> asyncio.Queue:
+        subscriber = asyncio.Queue(maxsize=settings.LIVE_FEED_QUEUE_SIZE)
+        self._subscribers.add(subscriber)
+        if len(self._subscribers) == 1:
+            self.on_active()
+        snapshot = self._encode_snapshot()
+        if snapshot is not None:
+            subscriber.put_nowait(snapshot)
+        return subscriber
+
+    def unsubscribe(self, subscriber: asyncio.Queue):
+        self._subscribers.discard(subscriber)
+        if not self._subscribers:
+            self.on_idle()
+
+    def publish(self, event: str, data):
+        if not self._subscribers:
+            return
+        message = encode_event(event, data)
+        self.published += 1
+        for subscriber in self._subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except asyncio.QueueFull:
+                self._resync(subscriber, message)
+
+    def _resync(self, subscriber: asyncio.Queue, message: bytes):
+        self.resyncs += 1
+        while not subscriber.empty():
+            subscriber.get_nowait()
+        snapshot = self._encode_snapshot()
+        subscriber.put_nowait(snapshot if snapshot is not None else message)
+
+    def _encode_snapshot(self) -> Optional[bytes]:
+        snapshot = self._snapshot() if self._snapshot is not None else None
+        return encode_event(*snapshot) if snapshot is not None else None
+
+    async def _stream(self) -> AsyncIterator[bytes]:
+        subscriber = self.subscribe()
+        loop = asyncio.get_running_loop()
+        # Ending the stream after a while lets reconnects spread over the workers
+        # and keeps long-lived streams from holding up a graceful shutdown
+        closes_at = loop.time() + settings.LIVE_FEED_MAX_CONNECTION_SECONDS
+        try:
+            yield f"retry: {settings.LIVE_FEED_RETRY_MS}\n\n".encode()
+            while loop.time() < closes_at:
+                timeout = min(settings.LIVE_FEED_KEEP_ALIVE_SECONDS, closes_at - loop.time())
+                try:
+                    yield await asyncio.wait_for(subscriber.get(), timeout)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield KEEP_ALIVE
+        finally:
+            self.unsubscribe(subscriber)
+
+    def response(self) -> StreamingResponse:
+        """An event-stream response subscribed to this feed until the client disconnects"""
+        if self.subscribers >= settings.LIVE_FEED_MAX_SUBSCRIBERS:
+            raise HTTPException(status_code=503, detail="Too many live feed subscribers", headers={"Retry-After": "5"})
+        return StreamingResponse(
+            self._stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+def prometheus_text(*feeds: LiveFeed) -> str:
+    lines = []
+    for name, kind, help_text, value in (
+        ("live_feed_subscribers", "gauge", "Connected event-stream clients.", lambda feed: feed.subscribers),
+        ("live_feed_events_total", "counter", "Events published to the feed's subscribers.", lambda feed: feed.published),
+        ("live_feed_resyncs_total", "counter", "Subscribers that fell behind and were sent a fresh snapshot.", lambda feed: feed.resyncs)
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{worker="{os.getpid()}",feed="{feed.name}"}} {value(feed)}' for feed in feeds]
+    return "\n".join(lines) + "\n"
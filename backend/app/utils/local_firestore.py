@@ -0,0 +1,625 @@
+"""
+In-memory stand-in for the Firestore client, selected with
+STORAGE_BACKEND=local. It implements the subset of the google-cloud-firestore
+API the services use - collections, documents, where/order_by/limit/select
+queries, query listeners (on_snapshot), batched writes, transactions
+(firestore.transactional), last_update_time/exists write options and the
+Increment/ArrayUnion/ArrayRemove/DELETE_FIELD/SERVER_TIMESTAMP transforms -
+so the app can run for load tests and local development without a Firebase
+project.
+
+Calls are synchronous and take a process-wide lock, like the real client's
+blocking RPCs; LOCAL_FIRESTORE_LATENCY_MS adds a sleep per RPC to emulate the
+network round trip. Timestamps come back exactly as written (naive UTC),
+whereas Firestore returns tz-aware values. Data lives in the process only, so
+each worker of a multi-process server has its own copy; LOCAL_FIRESTORE_SEED_PATH
+loads an initial dataset written by `dump_json`.
+"""
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from enum import Enum
+from typing import Dict, Iterator, List, Optional
+
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+try:
+    from google.api_core.exceptions import Aborted, AlreadyExists, FailedPrecondition, NotFound
+except ImportError:  # pragma: no cover - google-api-core ships with firebase-admin
+    class Aborted(Exception):
+        pass
+
+    class AlreadyExists(Exception):
+        pass
+
+    class FailedPrecondition(Exception):
+        pass
+
+    class NotFound(Exception):
+        pass
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+def _encode(value):
+    """Normalise a value the way the Firestore client would serialise it"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+def _project(data: Dict, projection: Optional[List[str]]) -> Dict:
+    if projection is None:
+        return data
+    projected = {}
+    for field in projection:
+        value = _get_path(data, field)
+        if value is not _MISSING:
+            _set_path(projected, field, value)
+    return projected
+
+def _split(field_path: str) -> List[str]:
+    return field_path.split(".")
+
+def _get_path(data: Dict, field_path: str):
+    current = data
+    for part in _split(field_path):
+        if not isinstance(current, dict) or part not in current:
+            return _MISSING
+        current = current[part]
+    return current
+
+def _apply_value(container: Dict, key: str, value):
+    """Set container[key], resolving transforms against the current value"""
+    current = container.get(key, _MISSING)
+    if value is transforms.DELETE_FIELD:
+        container.pop(key, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        container[key] = datetime.utcnow()
+    elif isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        container[key] = base + value.value
+    elif isinstance(value, transforms.Maximum):
+        container[key] = value.value if current is _MISSING else max(current, value.value)
+    elif isinstance(value, transforms.Minimum):
+        container[key] = value.value if current is _MISSING else min(current, value.value)
+    elif isinstance(value, transforms.ArrayUnion):
+        items = list(current) if isinstance(current, list) else []
+        for item in _encode(list(value.values)):
+            if item not in items:
+                items.append(item)
+        container[key] = items
+    elif isinstance(value, transforms.ArrayRemove):
+        removed = _encode(list(value.values))
+        container[key] = [item for item in current if item not in removed] if isinstance(current, list) else []
+    elif isinstance(value, dict):
+        # A map value replaces the field; set(merge=True) merges maps in _merge instead
+        nested = container[key] = {}
+        for nested_key, nested_value in value.items():
+            _apply_value(nested, nested_key, nested_value)
+    else:
+        container[key] = copy.deepcopy(_encode(value))
+
+def _set_path(data: Dict, field_path: str, value):
+    parts = _split(field_path)
+    current = data
+    for part in parts[:-1]:
+        if not isinstance(current.get(part), dict):
+            current[part] = {}
+        current = current[part]
+    _apply_value(current, parts[-1], value)
+
+def _merge(target: Dict, data: Dict):
+    """set(merge=True): nested maps are merged key by key instead of replaced"""
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            _apply_value(target, key, value)
+
+def _naive(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _sort_key(value):
+    """Firestore cross-type ordering: null < bool < number < timestamp < string < bytes < array < map"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, _naive(value))
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, bytes):
+        return (5, value)
+    if isinstance(value, list):
+        return (7, [_sort_key(item) for item in value])
+    return (8, str(value))
+
+def _matches(data: Dict, field_path: str, op: str, expected) -> bool:
+    actual = _get_path(data, field_path)
+    if actual is _MISSING:
+        return False
+    if op == "==":
+        return actual == expected
+    if op == "in":
+        return actual in expected
+    if op == "array-contains":
+        return isinstance(actual, list) and expected in actual
+    if op == "array-contains-any":
+        return isinstance(actual, list) and any(item in actual for item in expected)
+    if actual is None:
+        return False
+    if op == "!=":
+        return actual != expected
+    if op == "not-in":
+        return actual not in expected
+    # Range filters only match values of the same type class
+    actual_key, expected_key = _sort_key(actual), _sort_key(expected)
+    if actual_key[0] != expected_key[0]:
+        return False
+    if op == "<":
+        return actual_key < expected_key
+    if op == "<=":
+        return actual_key <= expected_key
+    if op == ">":
+        return actual_key > expected_key
+    if op == ">=":
+        return actual_key >= expected_key
+    raise ValueError(f"Unsupported operator {op!r}")
+
+class LocalDocumentSnapshot:
+
+    def __init__(self, reference: "LocalDocumentReference", data: Optional[Dict], update_time: Optional[datetime] = None):
+        self.reference = reference
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        if self._data is None:
+            return None
+        value = _get_path(self._data, field_path)
+        return None if value is _MISSING else copy.deepcopy(value)
+
+class LocalDocumentReference:
+
+    def __init__(self, client: "LocalFirestoreClient", collection_path: str, document_id: str):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = document_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection_path}/{self.id}"
+
+    def collection(self, name: str) -> "LocalCollectionReference":
+        return self._client.collection(f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None) -> LocalDocumentSnapshot:
+        if transaction is not None:
+            return transaction._read(self)
+        return self._client._get(self)
+
+    def set(self, document_data: Dict, merge: bool = False):
+        return self._client._commit([("set", self, document_data, merge, None)])
+
+    def create(self, document_data: Dict):
+        return self._client._commit([("create", self, document_data, False, None)])
+
+    def update(self, field_updates: Dict, option: Optional["LocalWriteOption"] = None):
+        return self._client._commit([("update", self, field_updates, False, option)])
+
+    def delete(self, option: Optional["LocalWriteOption"] = None):
+        return self._client._commit([("delete", self, None, False, option)])
+
+class LocalQuery:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, client: "LocalFirestoreClient", collection_path: str, filters=(), orders=(), limit=None, offset=0, projection=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._offset = offset
+        self._projection = projection
+
+    def _copy(self, **changes) -> "LocalQuery":
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "offset": self._offset,
+            "projection": self._projection
+        }
+        state.update(changes)
+        return LocalQuery(self._client, self._collection_path, **state)
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value=None, *, filter=None) -> "LocalQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, _encode(value)),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "LocalQuery":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "LocalQuery":
+        return self._copy(limit=count)
+
+    def offset(self, num_to_skip: int) -> "LocalQuery":
+        return self._copy(offset=num_to_skip)
+
+    def select(self, field_paths) -> "LocalQuery":
+        return self._copy(projection=list(field_paths))
+
+    def stream(self, transaction=None) -> Iterator[LocalDocumentSnapshot]:
+        return iter(self._client._run_query(self))
+
+    def get(self, transaction=None) -> List[LocalDocumentSnapshot]:
+        return self._client._run_query(self)
+
+    def on_snapshot(self, callback) -> "LocalWatch":
+        return self._client._watch(self, callback)
+
+class LocalCollectionReference(LocalQuery):
+
+    def __init__(self, client: "LocalFirestoreClient", collection_path: str):
+        super().__init__(client, collection_path)
+
+    @property
+    def id(self) -> str:
+        return self._collection_path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: Optional[str] = None) -> LocalDocumentReference:
+        return LocalDocumentReference(self._client, self._collection_path, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data: Dict, document_id: Optional[str] = None):
+        reference = self.document(document_id)
+        results = self._client._commit([("create", reference, document_data, False, None)])
+        return results[0], reference
+
+class LocalWatch:
+    """
+    Query listener. Like the real client's Watch, it calls
+    callback(docs, changes, read_time) from its own thread: first with every
+    matching document as ADDED, then once per commit that changed the results.
+    """
+
+    def __init__(self, client: "LocalFirestoreClient", query: LocalQuery, callback):
+        self._client = client
+        self._query = query
+        self._callback = callback
+        self._documents: Dict[str, LocalDocumentSnapshot] = {}
+        self._changes: List[DocumentChange] = []
+        self._deliveries = queue.Queue()
+        self._thread = threading.Thread(target=self._deliver, name="local-firestore-watch", daemon=True)
+        self._thread.start()
+
+    def _observe(self, document_id: str, data: Optional[Dict], update_time: datetime):
+        """Record one written document; called under the client lock"""
+        matches = data is not None and all(_matches(data, field, op, value) for field, op, value in self._query._filters)
+        known = document_id in self._documents
+        if matches:
+            reference = LocalDocumentReference(self._client, self._query._collection_path, document_id)
+            snapshot = LocalDocumentSnapshot(reference, _project(data, self._query._projection), update_time)
+            self._documents[document_id] = snapshot
+            self._changes.append(DocumentChange(ChangeType.MODIFIED if known else ChangeType.ADDED, snapshot, -1, -1))
+        elif known:
+            self._changes.append(DocumentChange(ChangeType.REMOVED, self._documents.pop(document_id), -1, -1))
+
+    def _flush(self, read_time: datetime, initial: bool = False):
+        if not self._changes and not initial:
+            return
+        changes, self._changes = self._changes, []
+        self._deliveries.put((list(self._documents.values()), changes, read_time.replace(tzinfo=timezone.utc)))
+
+    def _deliver(self):
+        while True:
+            delivery = self._deliveries.get()
+            if delivery is None:
+                return
+            try:
+                self._callback(*delivery)
+            except Exception:
+                logger.exception("Error in snapshot listener")
+
+    def unsubscribe(self):
+        self._client._unwatch(self)
+        self._deliveries.put(None)
+
+class LocalWriteOption:
+    """Precondition of a write, from client.write_option(last_update_time=...) or (exists=...)"""
+
+    def __init__(self, last_update_time: Optional[datetime] = None, exists: Optional[bool] = None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+    def allows(self, entry: Optional[tuple]) -> bool:
+        if self.exists is not None:
+            return (entry is not None) == self.exists
+        return entry is not None and entry[1] == self.last_update_time
+
+class LocalWriteBatch:
+
+    def __init__(self, client: "LocalFirestoreClient"):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference: LocalDocumentReference, document_data: Dict, merge: bool = False):
+        self._writes.append(("set", reference, document_data, merge, None))
+
+    def create(self, reference: LocalDocumentReference, document_data: Dict):
+        self._writes.append(("create", reference, document_data, False, None))
+
+    def update(self, reference: LocalDocumentReference, field_updates: Dict, option: Optional[LocalWriteOption] = None):
+        self._writes.append(("update", reference, field_updates, False, option))
+
+    def delete(self, reference: LocalDocumentReference, option: Optional[LocalWriteOption] = None):
+        self._writes.append(("delete", reference, None, False, option))
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        writes, self._writes = self._writes, []
+        return self._client._commit(writes)
+
+class LocalTransaction(LocalWriteBatch):
+    """
+    Optimistic transaction driven by firestore.transactional: documents read
+    through it are checked again at commit, which raises Aborted (and the
+    decorator retries) if any of them changed in the meantime.
+    """
+
+    def __init__(self, client: "LocalFirestoreClient", max_attempts: int = 5, read_only: bool = False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+        self._reads: Dict[str, tuple] = {}
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    def _begin(self, retry_id=None):
+        self._id = uuid.uuid4().bytes
+
+    def _clean_up(self):
+        self._writes = []
+        self._reads = {}
+        self._id = None
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        writes, reads = self._writes, self._reads
+        self._clean_up()
+        return self._client._commit(writes, reads)
+
+    def _read(self, reference: LocalDocumentReference) -> LocalDocumentSnapshot:
+        snapshot = self._client._get(reference)
+        self._reads.setdefault(reference.path, (reference, snapshot.update_time))
+        return snapshot
+
+    def get(self, reference: LocalDocumentReference) -> LocalDocumentSnapshot:
+        return self._read(reference)
+
+class LocalFirestoreClient:
+
+    def __init__(self, seed_path: Optional[str] = None, latency_ms: float = 0.0):
+        # collection path -> document id -> (data, update_time)
+        self._collections: Dict[str, Dict[str, tuple]] = {}
+        self._lock = threading.RLock()
+        self._latency = latency_ms / 1000.0
+        self._watches: List["LocalWatch"] = []
+        self._last_commit = datetime.min
+        if seed_path:
+            self.load_json(seed_path)
+
+    def _rpc(self):
+        if self._latency:
+            time.sleep(self._latency)
+
+    def collection(self, collection_path: str) -> LocalCollectionReference:
+        return LocalCollectionReference(self, collection_path)
+
+    def document(self, document_path: str) -> LocalDocumentReference:
+        collection_path, document_id = document_path.rsplit("/", 1)
+        return LocalDocumentReference(self, collection_path, document_id)
+
+    def batch(self) -> LocalWriteBatch:
+        return LocalWriteBatch(self)
+
+    def transaction(self, max_attempts: int = 5, read_only: bool = False) -> LocalTransaction:
+        return LocalTransaction(self, max_attempts, read_only)
+
+    @staticmethod
+    def write_option(**kwargs) -> LocalWriteOption:
+        return LocalWriteOption(**kwargs)
+
+    def collections(self) -> List[LocalCollectionReference]:
+        with self._lock:
+            return [self.collection(path) for path in self._collections if "/" not in path]
+
+    def _get(self, reference: LocalDocumentReference) -> LocalDocumentSnapshot:
+        self._rpc()
+        with self._lock:
+            entry = self._collections.get(reference._collection_path, {}).get(reference.id)
+            if entry is None:
+                return LocalDocumentSnapshot(reference, None)
+            # Stored dicts are never mutated in place (writes build new ones), so
+            # snapshots can share them; to_dict() hands out copies
+            data, update_time = entry
+            return LocalDocumentSnapshot(reference, data, update_time)
+
+    def _commit(self, writes, reads: Optional[Dict[str, tuple]] = None) -> List[datetime]:
+        """
+        Apply writes atomically: preconditions, and for a transaction the
+        update times of the documents it read, are checked before anything changes
+        """
+        self._rpc()
+        with self._lock:
+            for path, (reference, update_time) in (reads or {}).items():
+                entry = self._collections.get(reference._collection_path, {}).get(reference.id)
+                if (entry[1] if entry else None) != update_time:
+                    raise Aborted(f"Transaction lost a race on {path}")
+            for kind, reference, _, _, option in writes:
+                entry = self._collections.get(reference._collection_path, {}).get(reference.id)
+                if kind == "create" and entry is not None:
+                    raise AlreadyExists(f"Document already exists: {reference.path}")
+                if option is not None and not option.allows(entry):
+                    raise FailedPrecondition(f"Write precondition failed: {reference.path}")
+                if kind == "update" and entry is None:
+                    raise NotFound(f"No document to update: {reference.path}")
+
+            # Strictly increasing, so update times can serve as preconditions
+            now = max(datetime.utcnow(), self._last_commit + timedelta(microseconds=1))
+            self._last_commit = now
+            for kind, reference, payload, merge, _ in writes:
+                documents = self._collections.setdefault(reference._collection_path, {})
+                if kind == "delete":
+                    documents.pop(reference.id, None)
+                    self._notify(reference, None, now)
+                    continue
+
+                if kind == "update":
+                    data = copy.deepcopy(documents[reference.id][0])
+                    for field_path, value in payload.items():
+                        _set_path(data, field_path, value)
+                elif merge and reference.id in documents:
+                    data = copy.deepcopy(documents[reference.id][0])
+                    _merge(data, payload)
+                else:
+                    data = {}
+                    for key, value in payload.items():
+                        _apply_value(data, key, value)
+                documents[reference.id] = (data, now)
+                self._notify(reference, data, now)
+            for watch in self._watches:
+                watch._flush(now)
+            return [now for _ in writes]
+
+    def _notify(self, reference: LocalDocumentReference, data: Optional[Dict], update_time: datetime):
+        for watch in self._watches:
+            if watch._query._collection_path == reference._collection_path:
+                watch._observe(reference.id, data, update_time)
+
+    def _run_query(self, query: LocalQuery) -> List[LocalDocumentSnapshot]:
+        self._rpc()
+        with self._lock:
+            documents = self._collections.get(query._collection_path, {})
+            matched = [
+                (document_id, data, update_time)
+                for document_id, (data, update_time) in documents.items()
+                if all(_matches(data, field, op, value) for field, op, value in query._filters)
+            ]
+
+            # Documents without an order_by field are excluded, as in Firestore
+            for field, _ in query._orders:
+                matched = [row for row in matched if _get_path(row[1], field) is not _MISSING]
+            matched.sort(key=lambda row: row[0])
+            for field, direction in reversed(query._orders):
+                matched.sort(
+                    key=lambda row: _sort_key(_get_path(row[1], field)),
+                    reverse=direction == LocalQuery.DESCENDING
+                )
+
+            matched = matched[query._offset:]
+            if query._limit is not None:
+                matched = matched[:query._limit]
+
+            snapshots = []
+            for document_id, data, update_time in matched:
+                reference = LocalDocumentReference(self, query._collection_path, document_id)
+                snapshots.append(LocalDocumentSnapshot(reference, _project(data, query._projection), update_time))
+            return snapshots
+
+    def _watch(self, query: LocalQuery, callback) -> "LocalWatch":
+        if query._orders or query._limit is not None or query._offset:
+            raise ValueError("Local listeners support filters and select only")
+        watch = LocalWatch(self, query, callback)
+        with self._lock:
+            documents = self._collections.get(query._collection_path, {})
+            for document_id, (data, update_time) in documents.items():
+                watch._observe(document_id, data, update_time)
+            self._watches.append(watch)
+            watch._flush(datetime.utcnow(), initial=True)
+        return watch
+
+    def _unwatch(self, watch: "LocalWatch"):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def load_json(self, path: str):
+        with open(path) as f:
+            collections = json.load(f, object_hook=_decode_json)
+        with self._lock:
+            now = datetime.utcnow()
+            for collection_path, documents in collections.items():
+                target = self._collections.setdefault(collection_path, {})
+                for document_id, data in documents.items():
+                    target[document_id] = (data, now)
+
+    def dump_json(self, path: str):
+        with self._lock:
+            collections = {
+                collection_path: {document_id: data for document_id, (data, _) in documents.items()}
+                for collection_path, documents in self._collections.items()
+            }
+        with open(path, "w") as f:
+            json.dump(collections, f, default=_encode_json)
+
+def _encode_json(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$datetime": datetime(value.year, value.month, value.day).isoformat()}
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+def _decode_json(value: Dict):
+    if len(value) == 1 and "$datetime" in value:
+        return datetime.fromisoformat(value["$datetime"])
+    return value
+
+def write_seed_file(path: str, collections: Dict[str, Dict[str, Dict]]):
+    """Write {collection: {document_id: data}} in the format LOCAL_FIRESTORE_SEED_PATH loads"""
+    with open(path, "w") as f:
+        json.dump(_encode(collections), f, default=_encode_json)
+
+def create_client() -> LocalFirestoreClient:
+    return LocalFirestoreClient(settings.LOCAL_FIRESTORE_SEED_PATH or None, settings.LOCAL_FIRESTORE_LATENCY_MS)
@@ -0,0 +1,161 @@
+"""
+Structured, non-blocking logging.
+
+Every logger writes to a QueueHandler; a QueueListener thread formats the
+records as JSON lines and writes them to stdout, so a log call on the event
+loop only enqueues. When the queue is full the record is dropped and counted
+instead of blocking. Records carry the request (trace) id of the request that
+emitted them, DEBUG records are sampled, and extra fields whose names look
+like personal data are redacted.
+
+    logger = logging.getLogger(__name__)
+    logger.info("Loan approved", extra={"loan_id": loan_id})
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.config import settings
+from app.utils.tracing import current_trace_id
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_pid: Optional[int] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+
+def _redact(value, redact_fields):
+    if isinstance(value, dict):
+        return {
+            key: "[redacted]" if str(key).lower() in redact_fields else _redact(item, redact_fields)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_redact(item, redact_fields) for item in value]
+    return value
+
+class JsonFormatter(logging.Formatter):
+
+    def __init__(self, redact_fields=()):
+        super().__init__()
+        self.redact_fields = {field.lower() for field in redact_fields}
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "pid": record.process
+        }
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            document["exception"] = record.exc_text
+
+        for key, value in record.__dict__.items():
+            if key in _RESERVED or key.startswith("_"):
+                continue
+            document[key] = "[redacted]" if key.lower() in self.redact_fields else _redact(value, self.redact_fields)
+        return json.dumps(document, default=str)
+
+class DebugSamplingFilter(logging.Filter):
+    """Let through only a share of DEBUG records; other levels always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        if random.random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Runs on the calling thread: capture the request id from its context and
+        # render the message and traceback now, so the listener gets plain data
+        record.request_id = current_trace_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def configure_logging(force: bool = False):
+    """
+    Install the queue handler on the root logger and start the writer thread.
+    Safe to call again; after a fork the child gets its own writer thread.
+    """
+    global _listener, _listener_pid, _queue_handler
+    if _listener is not None and _listener_pid == os.getpid() and not force:
+        return
+
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(DebugSamplingFilter(settings.LOG_DEBUG_SAMPLE_RATE))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter(settings.LOG_REDACT_FIELDS))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(settings.LOG_LEVEL)
+
+    for name, level in settings.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    # uvicorn installs its own stdout handlers; route its records through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    _listener_pid = os.getpid()
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+
+def logging_stats() -> Dict:
+    return {
+        "level": settings.LOG_LEVEL,
+        "levels": settings.LOG_LEVELS,
+        "debug_sample_rate": settings.LOG_DEBUG_SAMPLE_RATE,
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0
+    }
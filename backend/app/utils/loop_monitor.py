@@ -0,0 +1,205 @@
+"""
+Event-loop lag monitor and blocking-call detector.
+
+A heartbeat task sleeps for a fixed interval and records how late it wakes
+up (the loop lag). A watchdog thread watches the heartbeat; when it has not
+beaten for longer than the stall threshold, the loop thread is stuck in a
+blocking call, so the watchdog grabs that thread's stack with
+sys._current_frames() and attributes the stall to the route handler and the
+innermost call site in app code.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES_DIR = os.path.join(APP_DIR, "routes")
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+def _frame_label(frame_summary: traceback.FrameSummary) -> str:
+    relative = os.path.relpath(frame_summary.filename, os.path.dirname(APP_DIR))
+    return f"{relative}:{frame_summary.lineno} {frame_summary.name}"
+
+def attribute_stack(stack: List[traceback.FrameSummary]) -> Tuple[str, str]:
+    """(handler, call_site) for a stack ordered outermost first"""
+    app_frames = [f for f in stack if f.filename.startswith(APP_DIR) and "site-packages" not in f.filename]
+    if not app_frames:
+        leaf = _frame_label(stack[-1]) if stack else "unknown"
+        return "unknown", leaf
+
+    route_frames = [f for f in app_frames if f.filename.startswith(ROUTES_DIR)]
+    # Stalls outside a request (e.g. background tasks) are attributed to the outermost app frame
+    handler = route_frames[-1] if route_frames else app_frames[0]
+    return _frame_label(handler), _frame_label(app_frames[-1])
+
+class LoopLagMonitor:
+
+    def __init__(self):
+        self.interval = settings.LOOP_MONITOR_INTERVAL_SECONDS
+        self.threshold = settings.LOOP_STALL_THRESHOLD_SECONDS
+        self.lag_buckets = [0] * len(LAG_BUCKETS)
+        self.lag_count = 0
+        self.lag_sum = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.unattributed_stalls = 0
+        self.offenders: Dict[Tuple[str, str], Dict] = {}
+        self._lock = threading.Lock()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._pending: Optional[Tuple[str, str]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start the heartbeat task and watchdog thread; call from the event loop"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            self._observe_lag(max(0.0, now - expected))
+
+    def _observe_lag(self, lag: float):
+        for index, upper in enumerate(LAG_BUCKETS):
+            if lag <= upper:
+                self.lag_buckets[index] += 1
+                break
+        self.lag_count += 1
+        self.lag_sum += lag
+        self.max_lag = max(self.max_lag, lag)
+
+        if lag < self.threshold:
+            return
+        with self._lock:
+            self.stalls += 1
+            key, self._pending = self._pending, None
+            offender = self.offenders.get(key)
+            if offender is None:
+                # Stall ended before the watchdog looked at it
+                self.unattributed_stalls += 1
+                return
+            offender["total_stall_seconds"] += lag
+            offender["max_stall_seconds"] = max(offender["max_stall_seconds"], lag)
+
+    def _watch(self):
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stopped.wait(poll):
+            stalled_for = time.monotonic() - self._last_beat - self.interval
+            if stalled_for < self.threshold or self._pending is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            del frame
+            # The heartbeat may have resumed while the stack was being captured
+            if time.monotonic() - self._last_beat - self.interval < self.threshold:
+                continue
+            self._record_stall(stack)
+
+    def _record_stall(self, stack: List[traceback.FrameSummary]):
+        handler, call_site = attribute_stack(stack)
+        key = (handler, call_site)
+        with self._lock:
+            offender = self.offenders.get(key)
+            if offender is None:
+                offender = self.offenders[key] = {
+                    "handler": handler,
+                    "call_site": call_site,
+                    "count": 0,
+                    "total_stall_seconds": 0.0,
+                    "max_stall_seconds": 0.0
+                }
+            offender["count"] += 1
+            offender["last_seen"] = time.time()
+            offender["stack"] = [_frame_label(f) for f in stack[-settings.LOOP_STALL_STACK_DEPTH:]]
+            self._pending = key
+
+    def lag_quantile(self, q: float) -> Optional[float]:
+        if self.lag_count == 0:
+            return None
+        rank = q * self.lag_count
+        seen = 0
+        lower = 0.0
+        for index, upper in enumerate(LAG_BUCKETS):
+            in_bucket = self.lag_buckets[index]
+            if in_bucket and seen + in_bucket >= rank:
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / in_bucket
+            seen += in_bucket
+            lower = upper
+        return lower
+
+    def summary(self, limit: int = 20) -> Dict:
+        with self._lock:
+            offenders = sorted(self.offenders.values(), key=lambda o: -o["total_stall_seconds"])[:limit]
+            offenders = [dict(offender) for offender in offenders]
+        return {
+            "worker_pid": os.getpid(),
+            "running": self._task is not None,
+            "interval_seconds": self.interval,
+            "stall_threshold_seconds": self.threshold,
+            "heartbeats": self.lag_count,
+            "avg_lag_seconds": self.lag_sum / self.lag_count if self.lag_count else 0,
+            "p99_lag_seconds": min(self.lag_quantile(0.99) or 0.0, self.max_lag),
+            "max_lag_seconds": self.max_lag,
+            "stalls": self.stalls,
+            "unattributed_stalls": self.unattributed_stalls,
+            "worst_offenders": offenders
+        }
+
+    def reset(self):
+        with self._lock:
+            self.offenders.clear()
+            self._pending = None
+            self.stalls = 0
+            self.unattributed_stalls = 0
+            self.max_lag = 0.0
+
+    def prometheus_text(self) -> str:
+        worker = f'worker="{os.getpid()}"'
+        lines = [
+            "# HELP event_loop_lag_seconds Event-loop heartbeat lag.",
+            "# TYPE event_loop_lag_seconds histogram"
+        ]
+        cumulative = 0
+        for upper, count in zip(LAG_BUCKETS, self.lag_buckets):
+            cumulative += count
+            bound = "+Inf" if upper == float("inf") else f"{upper:g}"
+            lines.append(f'event_loop_lag_seconds_bucket{{{worker},le="{bound}"}} {cumulative}')
+        lines.append(f"event_loop_lag_seconds_sum{{{worker}}} {self.lag_sum}")
+        lines.append(f"event_loop_lag_seconds_count{{{worker}}} {self.lag_count}")
+        lines += [
+            "# HELP event_loop_stalls_total Heartbeats later than the stall threshold.",
+            "# TYPE event_loop_stalls_total counter",
+            f"event_loop_stalls_total{{{worker}}} {self.stalls}"
+        ]
+        return "\n".join(lines) + "\n"
+
+loop_monitor = LoopLagMonitor()
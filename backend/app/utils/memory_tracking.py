@@ -0,0 +1,151 @@
+"""
+Helpers for the admin memory report: tracemalloc snapshot diffs, per-call
+peak allocation of analytics functions and approximate deep sizes of
+in-process caches.
+"""
+import functools
+import sys
+import time
+import tracemalloc
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+
+# Last N tracked calls, newest last
+call_peaks = deque(maxlen=settings.MEMORY_TRACKED_CALLS)
+_in_flight = 0
+_baseline: Optional[tracemalloc.Snapshot] = None
+
+def start_tracing(frames: int = 1):
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _baseline = None
+
+def stop_tracing():
+    global _baseline
+    tracemalloc.stop()
+    _baseline = None
+
+def snapshot_diff(limit: int = 20) -> Dict:
+    """Top allocation sites, as growth since the previous call (or absolute on the first)"""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+
+    current = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+    ))
+    traced, peak = tracemalloc.get_traced_memory()
+
+    if _baseline is None:
+        stats = current.statistics("lineno")[:limit]
+        sites = [
+            {"site": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+            for stat in stats
+        ]
+        mode = "absolute"
+    else:
+        stats = current.compare_to(_baseline, "lineno")[:limit]
+        sites = [
+            {
+                "site": str(stat.traceback),
+                "size_bytes": stat.size,
+                "size_diff_bytes": stat.size_diff,
+                "count": stat.count,
+                "count_diff": stat.count_diff
+            }
+            for stat in stats
+        ]
+        mode = "diff"
+    _baseline = current
+
+    return {
+        "tracing": True,
+        "mode": mode,
+        "traced_bytes": traced,
+        "peak_traced_bytes": peak,
+        "top_sites": sites
+    }
+
+def track_peak(name: str):
+    """
+    Record the peak traced allocation of each call of an async function.
+    Needs tracemalloc running; the peak counter is process-wide, so calls that
+    overlapped other tracked calls are flagged and their peak is an upper bound.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            global _in_flight
+            if not tracemalloc.is_tracing():
+                return await func(*args, **kwargs)
+
+            overlapped = _in_flight > 0
+            _in_flight += 1
+            start_bytes, _ = tracemalloc.get_traced_memory()
+            if not overlapped:
+                tracemalloc.reset_peak()
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                end_bytes, peak_bytes = tracemalloc.get_traced_memory()
+                _in_flight -= 1
+                call_peaks.append({
+                    "function": name,
+                    "finished_at": time.time(),
+                    "duration_seconds": round(time.perf_counter() - started, 4),
+                    "peak_bytes": max(0, peak_bytes - start_bytes),
+                    "retained_bytes": end_bytes - start_bytes,
+                    "overlapped": overlapped or _in_flight > 0
+                })
+        return wrapper
+    return decorator
+
+def _children(current) -> Tuple:
+    """
+    Snapshot of the objects a container refers to. Called off the event loop
+    while the loop keeps mutating the caches, so copy in one C-level call and
+    retry if the container changed size during the copy.
+    """
+    for _ in range(3):
+        try:
+            if isinstance(current, dict):
+                return tuple(current.items())
+            if isinstance(current, (list, tuple, set, frozenset, deque)):
+                return tuple(current)
+            if hasattr(current, "__slots__"):
+                return tuple(getattr(current, slot) for slot in current.__slots__ if hasattr(current, slot))
+            if hasattr(current, "__dict__"):
+                return (current.__dict__,)
+            return ()
+        except RuntimeError:
+            continue
+    return ()
+
+def deep_sizeof(obj, limit: int = 200000) -> int:
+    """Approximate deep size of containers; stops after `limit` objects"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < limit:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+        children = _children(current)
+        if isinstance(current, dict):
+            for key, value in children:
+                stack.append(key)
+                stack.append(value)
+        else:
+            stack.extend(children)
+    return total
+
+def recent_calls(limit: Optional[int] = None) -> List[Dict]:
+    calls = list(call_peaks)
+    return calls[-limit:] if limit else calls
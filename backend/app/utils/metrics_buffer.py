@@ -0,0 +1,188 @@
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+METRIC_FIELDS = (
+    "cpu_usage",
+    "memory_usage",
+    "disk_usage",
+    "gpu_usage",
+    "gpu_memory_usage",
+    "gpu_temperature",
+    "gpu_power_usage",
+    "power_consumption",
+    "active_connections",
+    "request_rate"
+)
+
+RESOLUTIONS = ("raw", "1m", "1h")
+
+class Rollup:
+    """Running sum/count/max of every metric field over one time bucket"""
+
+    __slots__ = ("start", "resolution", "sample_count", "sums", "counts", "maxima", "last")
+
+    def __init__(self, start: datetime, resolution: str):
+        self.start = start
+        self.resolution = resolution
+        self.sample_count = 0
+        self.sums = {field: 0.0 for field in METRIC_FIELDS}
+        self.counts = {field: 0 for field in METRIC_FIELDS}
+        self.maxima: Dict[str, Optional[float]] = {field: None for field in METRIC_FIELDS}
+        self.last: Dict = {}
+
+    def add_sample(self, sample: Dict):
+        self.sample_count += 1
+        self.last = sample
+        for field in METRIC_FIELDS:
+            value = sample.get(field)
+            if value is None:
+                continue
+            self.sums[field] += value
+            self.counts[field] += 1
+            if self.maxima[field] is None or value > self.maxima[field]:
+                self.maxima[field] = value
+
+    def add_rollup(self, other: "Rollup"):
+        self.sample_count += other.sample_count
+        self.last = other.last
+        for field in METRIC_FIELDS:
+            self.sums[field] += other.sums[field]
+            self.counts[field] += other.counts[field]
+            if other.maxima[field] is not None and (self.maxima[field] is None or other.maxima[field] > self.maxima[field]):
+                self.maxima[field] = other.maxima[field]
+
+    def add_document(self, document: Dict):
+        """Fold in a persisted document - an hourly rollup or a legacy raw sample"""
+        weight = document.get("sample_count") or 1
+        self.sample_count += weight
+        self.last = document
+        for field in METRIC_FIELDS:
+            value = document.get(field)
+            if value is None:
+                continue
+            self.sums[field] += value * weight
+            self.counts[field] += weight
+            maximum = document.get(f"max_{field}", value)
+            if maximum is not None and (self.maxima[field] is None or maximum > self.maxima[field]):
+                self.maxima[field] = maximum
+
+    def averages(self) -> Dict[str, Optional[float]]:
+        return {
+            field: self.sums[field] / self.counts[field] if self.counts[field] else None
+            for field in METRIC_FIELDS
+        }
+
+    def to_dict(self) -> Dict:
+        """Same field names as a raw sample (averaged), plus max_* and the sample count"""
+        document = {
+            "timestamp": self.start,
+            "resolution": self.resolution,
+            "sample_count": self.sample_count
+        }
+        for field, average in self.averages().items():
+            document[field] = average
+            document[f"max_{field}"] = self.maxima[field]
+        return document
+
+def _bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    if resolution == "1h":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+class MetricsRingBuffer:
+    """
+    Fixed-size in-memory history of system metric samples.
+
+    Three resolutions are kept: raw samples, 1-minute rollups and 1-hour
+    rollups, each in a bounded deque. Adding a sample is O(1); when an hour
+    bucket completes it is returned so the caller can persist it.
+    """
+
+    def __init__(self, raw_capacity: int = 240, minute_capacity: int = 1440, hour_capacity: int = 168):
+        self.raw = deque(maxlen=raw_capacity)
+        self.minutes = deque(maxlen=minute_capacity)
+        self.hours = deque(maxlen=hour_capacity)
+        self._current_minute: Optional[Rollup] = None
+        self._current_hour: Optional[Rollup] = None
+
+    def add(self, sample: Dict) -> Optional[Rollup]:
+        """Add a raw sample; returns the hour rollup it completed, if any"""
+        timestamp = sample["timestamp"]
+        self.raw.append(sample)
+
+        minute_start = _bucket_start(timestamp, "1m")
+        if self._current_minute is not None and self._current_minute.start != minute_start:
+            self._close_minute()
+
+        # The closed minute has been folded into its hour, so the hour can be closed now
+        completed_hour = None
+        hour_start = _bucket_start(timestamp, "1h")
+        if self._current_hour is not None and self._current_hour.start != hour_start:
+            completed_hour = self._close_hour()
+
+        if self._current_minute is None:
+            self._current_minute = Rollup(minute_start, "1m")
+        if self._current_hour is None:
+            self._current_hour = Rollup(hour_start, "1h")
+        self._current_minute.add_sample(sample)
+
+        return completed_hour
+
+    def _close_minute(self):
+        minute = self._current_minute
+        self._current_minute = None
+        self.minutes.append(minute)
+        if self._current_hour is None:
+            self._current_hour = Rollup(_bucket_start(minute.start, "1h"), "1h")
+        self._current_hour.add_rollup(minute)
+
+    def _close_hour(self) -> Optional[Rollup]:
+        hour = self._current_hour
+        self._current_hour = None
+        if hour is None or hour.sample_count == 0:
+            return None
+        self.hours.append(hour)
+        return hour
+
+    def flush(self) -> Optional[Rollup]:
+        """Close the open buckets (on shutdown) and return the partial hour"""
+        if self._current_minute is not None:
+            self._close_minute()
+        return self._close_hour()
+
+    def oldest(self) -> Optional[datetime]:
+        """Start of the oldest minute the buffer still holds"""
+        if self.minutes:
+            return self.minutes[0].start
+        if self._current_minute is not None:
+            return self._current_minute.start
+        return None
+
+    def latest(self) -> Optional[Dict]:
+        return self.raw[-1] if self.raw else None
+
+    def history(self, since: datetime, resolution: str = "1m") -> List[Dict]:
+        if resolution == "raw":
+            return [sample for sample in self.raw if sample["timestamp"] >= since]
+        rollups = self.hours if resolution == "1h" else self.minutes
+        current = self._current_hour if resolution == "1h" else self._current_minute
+        result = [rollup.to_dict() for rollup in rollups if rollup.start >= _bucket_start(since, resolution)]
+        if current is not None and current.sample_count:
+            result.append(current.to_dict())
+        return result
+
+    def aggregate(self, since: datetime) -> Rollup:
+        """Combine every minute rollup since `since` (plus the open minute) into one"""
+        total = Rollup(since, "window")
+        for minute in self.minutes:
+            if minute.start >= _bucket_start(since, "1m"):
+                total.add_rollup(minute)
+        if self._current_minute is not None:
+            total.add_rollup(self._current_minute)
+        return total
+
+    def size(self) -> Dict[str, int]:
+        return {"raw": len(self.raw), "1m": len(self.minutes), "1h": len(self.hours)}
+
+metrics_buffer = MetricsRingBuffer()
@@ -1,8 +1,31 @@
 import numpy as np
-from tensorflow import keras
 from app.config import settings
+from app.utils.tracing import span
 import os
 
+# TensorFlow is imported lazily, so processes that hand inference to the
+# worker pool (app.utils.inference_pool) never load it
+
+SELECTED_FEATURES = [
+    "Income",
+    "InterestRate",
+    "LoanAmount",
+    "Age",
+    "CreditScore",
+    "MonthsEmployed",
+    "DTIRatio"
+]
+
+DEFAULT_FEATURE_VALUES = {
+    "Income": 50000,
+    "InterestRate": 7.5,
+    "LoanAmount": 25000,
+    "Age": 35,
+    "CreditScore": 650,
+    "MonthsEmployed": 24,
+    "DTIRatio": 0.3
+}
+
 # Global variables for model and scaler
 model = None
 scaler = None
@@ -12,6 +35,7 @@ def load_model():
     global model
     if model is None:
         try:
+            from tensorflow import keras
             model_path = settings.MODEL_PATH
             model = keras.models.load_model(model_path)
         except Exception as e:
@@ -34,6 +58,7 @@ def load_scaler():
 
 def create_dummy_model():
     """Create a dummy model for development when real model is not available"""
+    from tensorflow import keras
     model = keras.Sequential([
         keras.layers.Dense(64, activation='relu', input_shape=(7,)),
         keras.layers.Dropout(0.3),
@@ -56,6 +81,13 @@ def create_dummy_scaler():
     scaler.fit(dummy_data)
     return scaler
 
+def feature_vector(input_data: dict, selected_features: list = SELECTED_FEATURES) -> list:
+    """Feature values in model order, with defaults for missing features"""
+    return [
+        input_data[feature] if feature in input_data else DEFAULT_FEATURE_VALUES.get(feature, 0)
+        for feature in selected_features
+    ]
+
 def preprocess_input(input_data: dict, selected_features: list) -> np.ndarray:
     """
     Preprocess input data for model prediction
@@ -64,55 +96,51 @@ def preprocess_input(input_data: dict, selected_features: list) -> np.ndarray:
     model = load_model()
     scaler = load_scaler()
     
-    # Extract features in the correct order
-    feature_values = []
-    for feature in selected_features:
-        if feature in input_data:
-            feature_values.append(input_data[feature])
-        else:
-            # If feature is missing, use a default value
-            default_values = {
-                "Income": 50000,
-                "InterestRate": 7.5,
-                "LoanAmount": 25000,
-                "Age": 35,
-                "CreditScore": 650,
-                "MonthsEmployed": 24,
-                "DTIRatio": 0.3
-            }
-            feature_values.append(default_values.get(feature, 0))
-    
     # Convert to numpy array and reshape for single sample
-    input_array = np.array(feature_values).reshape(1, -1)
+    input_array = np.array(feature_vector(input_data, selected_features)).reshape(1, -1)
     
     # Scale the input
     scaled_input = scaler.transform(input_array)
     
     return scaled_input
 
-def predict_default_probability(input_data: dict) -> float:
+def predict_batch(rows: np.ndarray) -> np.ndarray:
+    """
+    Default probabilities for a (n, features) array of raw feature rows.
+    Calls the model directly: model.predict() sets up a data pipeline per call,
+    which costs far more than the forward pass for small batches.
+    """
+    scaled = load_scaler().transform(rows)
+    return np.asarray(load_model()(scaled, training=False)).reshape(-1)
+
+async def predict_default_probability(input_data: dict) -> float:
     """
     Predict default probability for given input data
     """
-    SELECTED_FEATURES = [
-        "Income",
-        "InterestRate", 
-        "LoanAmount",
-        "Age",
-        "CreditScore",
-        "MonthsEmployed",
-        "DTIRatio"
-    ]
+    from app.utils import inference_pool
+    if inference_pool.client is not None:
+        with span("model.inference_pool"):
+            return await inference_pool.client.predict(feature_vector(input_data))
     
     # Preprocess input
-    X_input = preprocess_input(input_data, SELECTED_FEATURES)
+    with span("model.preprocess"):
+        X_input = preprocess_input(input_data, SELECTED_FEATURES)
     
     # Make prediction
     model = load_model()
-    prediction = model.predict(X_input, verbose=0)
+    with span("model.forward", model_version=settings.MODEL_VERSION):
+        prediction = model.predict(X_input, verbose=0)
     
     return float(prediction[0][0])
 
-# Initialize model and scaler on module import
-load_model()
-load_scaler()
\ No newline at end of file
+def configure_threads(intra_op_threads: int, inter_op_threads: int):
+    """Pin TensorFlow's thread pools; must run before the first op in this process"""
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+# Initialize model and scaler on module import, unless inference runs in the worker pool
+if settings.INFERENCE_WORKERS == 0:
+    if settings.MODEL_LOAD_ON_IMPORT:
+        load_model()
+    load_scaler()
\ No newline at end of file
@@ -0,0 +1,122 @@
+import numpy as np
+from concurrent.futures import Executor
+from scipy.special import ndtri
+from typing import Dict, List, Optional, Sequence
+
+# Upper bound on the (simulations x loans) cells held in memory at once per shard
+CHUNK_CELLS = 4_000_000
+
+def simulate_losses(
+    default_probabilities: np.ndarray,
+    exposures: np.ndarray,
+    num_simulations: int,
+    correlation: float = 0.0,
+    seed=None
+) -> np.ndarray:
+    """
+    Simulate portfolio losses with a one-factor Gaussian copula.
+
+    Loan i defaults when sqrt(rho) * M + sqrt(1 - rho) * e_i < N^-1(pd_i), with
+    one systemic draw M per simulation. With rho == 0 this reduces to independent
+    Bernoulli defaults. Simulations are processed in chunks so memory stays
+    bounded at CHUNK_CELLS cells regardless of portfolio size.
+    """
+    rng = np.random.default_rng(seed)
+    num_loans = len(default_probabilities)
+    losses = np.zeros(num_simulations, dtype=np.float64)
+    if num_loans == 0 or num_simulations == 0:
+        return losses
+
+    exposures = np.asarray(exposures, dtype=np.float32)
+    default_probabilities = np.clip(np.asarray(default_probabilities, dtype=np.float64), 0.0, 1.0)
+    chunk_size = max(1, CHUNK_CELLS // num_loans)
+
+    if correlation > 0:
+        thresholds = ndtri(np.clip(default_probabilities, 1e-12, 1 - 1e-12))
+        scaled_thresholds = (thresholds / np.sqrt(1 - correlation)).astype(np.float32)
+        factor_loading = np.float32(np.sqrt(correlation / (1 - correlation)))
+    else:
+        probabilities = default_probabilities.astype(np.float32)
+
+    for start in range(0, num_simulations, chunk_size):
+        size = min(chunk_size, num_simulations - start)
+        if correlation > 0:
+            systemic = rng.standard_normal(size, dtype=np.float32)
+            idiosyncratic = rng.standard_normal((size, num_loans), dtype=np.float32)
+            defaults = idiosyncratic < (scaled_thresholds[None, :] - factor_loading * systemic[:, None])
+        else:
+            defaults = rng.random((size, num_loans), dtype=np.float32) < probabilities[None, :]
+        losses[start:start + size] = defaults.astype(np.float32) @ exposures
+
+    return losses
+
+def shard_sizes(num_simulations: int, shards: int) -> List[int]:
+    base, remainder = divmod(num_simulations, shards)
+    return [base + (1 if i < remainder else 0) for i in range(shards) if base or i < remainder]
+
+def simulate_losses_sharded(
+    default_probabilities: np.ndarray,
+    exposures: np.ndarray,
+    num_simulations: int,
+    correlation: float = 0.0,
+    seed: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    shards: int = 1
+) -> np.ndarray:
+    """Split the simulations into independently seeded shards, optionally on an executor"""
+    sizes = shard_sizes(num_simulations, max(1, shards))
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if executor is None:
+        results = [
+            simulate_losses(default_probabilities, exposures, size, correlation, shard_seed)
+            for size, shard_seed in zip(sizes, seeds)
+        ]
+    else:
+        futures = [
+            executor.submit(simulate_losses, default_probabilities, exposures, size, correlation, shard_seed)
+            for size, shard_seed in zip(sizes, seeds)
+        ]
+        results = [future.result() for future in futures]
+
+    return np.concatenate(results) if results else np.zeros(0)
+
+def summarize_losses(
+    losses: np.ndarray,
+    total_exposure: float,
+    confidence_level: float = 0.99,
+    histogram_bins: int = 50,
+    percentiles: Sequence[float] = (50, 90, 95, 99, 99.9)
+) -> Dict:
+    """Expected loss, VaR, expected shortfall and the shape of the loss distribution"""
+    if len(losses) == 0:
+        return {
+            "expected_loss": 0,
+            "loss_std": 0,
+            "value_at_risk": 0,
+            "expected_shortfall": 0,
+            "confidence_level": confidence_level,
+            "loss_percentiles": {},
+            "loss_distribution": []
+        }
+
+    value_at_risk = float(np.quantile(losses, confidence_level))
+    tail = losses[losses >= value_at_risk]
+    counts, edges = np.histogram(losses, bins=histogram_bins)
+
+    return {
+        "expected_loss": float(losses.mean()),
+        "loss_std": float(losses.std()),
+        "value_at_risk": value_at_risk,
+        "expected_shortfall": float(tail.mean()) if len(tail) else value_at_risk,
+        "confidence_level": confidence_level,
+        "expected_loss_rate": float(losses.mean() / total_exposure) if total_exposure else 0,
+        "value_at_risk_rate": value_at_risk / total_exposure if total_exposure else 0,
+        "loss_percentiles": {
+            f"p{p:g}": float(value) for p, value in zip(percentiles, np.percentile(losses, percentiles))
+        },
+        "loss_distribution": [
+            {"lower": float(edges[i]), "upper": float(edges[i + 1]), "count": int(counts[i])}
+            for i in range(len(counts))
+        ]
+    }
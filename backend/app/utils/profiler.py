@@ -0,0 +1,236 @@
+"""
+In-process sampling profiler built on sys._current_frames().
+
+On-demand mode samples every thread for a fixed duration and returns
+collapsed stacks (flamegraph.pl / speedscope input) and the top functions by
+self time. "cpu" mode drops samples whose leaf frame is a known idle wait
+(selector poll, lock/condition wait, queue get), so only threads doing work
+are counted; "wall" mode keeps everything.
+
+The opt-in continuous mode samples at a low rate and attributes each stack
+to the route whose endpoint function is on it.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.config import settings
+
+# (file name, function) of leaf frames that mean the thread is waiting, not running
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+    ("thread.py", "_worker"),
+    ("loop_monitor.py", "_watch"),
+    ("tracing.py", "_run"),
+    ("profiler.py", "profile")
+}
+
+MAX_STACKS_PER_ROUTE = 2000
+
+def _label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+
+def _walk(frame):
+    """Frames from outermost to leaf"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+def iter_routes(routes: Iterable, prefix: str = "") -> Iterable[Tuple[str, str, object]]:
+    """(methods, path, endpoint) for every route, following included routers and mounts"""
+    for route in routes:
+        include_context = getattr(route, "include_context", None)
+        if include_context is not None and hasattr(route, "original_router"):
+            yield from iter_routes(route.original_router.routes, prefix + include_context.prefix)
+        elif getattr(route, "endpoint", None) is not None:
+            methods = ",".join(sorted(getattr(route, "methods", None) or []))
+            yield methods, prefix + route.path, route.endpoint
+        elif getattr(route, "routes", None):
+            yield from iter_routes(route.routes, prefix + getattr(route, "path", ""))
+
+def build_route_map(routes: Iterable) -> Dict[object, str]:
+    """Endpoint code object -> "METHODS /path" """
+    route_map = {}
+    for methods, path, endpoint in iter_routes(routes):
+        code = getattr(endpoint, "__code__", None)
+        if code is not None:
+            route_map[code] = f"{methods} {path}".strip()
+    return route_map
+
+class ProfileResult:
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.samples = 0
+        self.ticks = 0
+        self.stacks: Counter = Counter()
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+
+    def add(self, labels: Tuple[str, ...]):
+        self.samples += 1
+        self.stacks[";".join(labels)] += 1
+        self.self_counts[labels[-1]] += 1
+        for label in set(labels):
+            self.total_counts[label] += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top(self, counter: Counter, limit: int, interval: Optional[float] = None):
+        return [
+            {
+                "function": label,
+                "samples": count,
+                "percent": round(100.0 * count / self.samples, 2) if self.samples else 0,
+                "seconds": round(count * interval, 4) if interval else None
+            }
+            for label, count in counter.most_common(limit)
+        ]
+
+    def summary(self, limit: int = 30, interval: Optional[float] = None) -> Dict:
+        return {
+            "mode": self.mode,
+            "ticks": self.ticks,
+            "samples": self.samples,
+            "top_self": self.top(self.self_counts, limit, interval),
+            "top_total": self.top(self.total_counts, limit, interval),
+            "collapsed": self.collapsed()
+        }
+
+def sample_once(result: ProfileResult, skip_thread: int, thread_names: Dict[int, str]):
+    cpu_only = result.mode == "cpu"
+    for thread_id, frame in sys._current_frames().items():
+        if thread_id == skip_thread:
+            continue
+        if cpu_only and _is_idle(frame):
+            continue
+        thread_name = thread_names.get(thread_id, str(thread_id))
+        result.add((f"thread:{thread_name}",) + tuple(_label(f.f_code) for f in _walk(frame)))
+    result.ticks += 1
+
+# Only one on-demand profile at a time - sampling itself costs CPU
+_profile_lock = threading.Lock()
+
+def profile(seconds: float, interval: float, mode: str = "wall") -> ProfileResult:
+    """Sample all threads for `seconds`. Blocking - run it off the event loop"""
+    if mode not in ("wall", "cpu"):
+        raise ValueError("mode must be 'wall' or 'cpu'")
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        result = ProfileResult(mode)
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        next_tick = time.monotonic()
+        thread_names = {}
+        while time.monotonic() < deadline:
+            if result.ticks % 100 == 0:
+                thread_names = {t.ident: t.name for t in threading.enumerate()}
+            sample_once(result, me, thread_names)
+            next_tick += interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+        return result
+    finally:
+        _profile_lock.release()
+
+class ContinuousProfiler:
+    """
+    Low-rate background sampler aggregating CPU-mode stacks per route.
+    Stacks without an endpoint frame are kept under "(no route)".
+    """
+
+    def __init__(self):
+        self.interval = settings.PROFILER_CONTINUOUS_INTERVAL_SECONDS
+        self.route_map: Dict[object, str] = {}
+        self.profiles: Dict[str, ProfileResult] = {}
+        self.truncated = 0
+        self.started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, routes: Iterable, interval: Optional[float] = None):
+        if self.running:
+            return
+        self.route_map = build_route_map(routes)
+        self.interval = interval or settings.PROFILER_CONTINUOUS_INTERVAL_SECONDS
+        self.started_at = time.time()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="continuous-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def reset(self):
+        with self._lock:
+            self.profiles.clear()
+            self.truncated = 0
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me or _is_idle(frame):
+                    continue
+                frames = _walk(frame)
+                route = "(no route)"
+                for f in frames:
+                    matched = self.route_map.get(f.f_code)
+                    if matched:
+                        route = matched
+                labels = tuple(_label(f.f_code) for f in frames)
+                with self._lock:
+                    result = self.profiles.get(route)
+                    if result is None:
+                        result = self.profiles[route] = ProfileResult("cpu")
+                    if len(result.stacks) >= MAX_STACKS_PER_ROUTE and ";".join(labels) not in result.stacks:
+                        self.truncated += 1
+                        continue
+                    result.add(labels)
+
+    def summary(self, route: Optional[str] = None, limit: int = 20) -> Dict:
+        with self._lock:
+            if route is not None:
+                result = self.profiles.get(route)
+                return {
+                    "route": route,
+                    "profile": result.summary(limit, self.interval) if result else None
+                }
+            routes = sorted(self.profiles.items(), key=lambda item: -item[1].samples)
+            return {
+                "running": self.running,
+                "interval_seconds": self.interval,
+                "started_at": self.started_at,
+                "truncated_samples": self.truncated,
+                "routes": [
+                    {
+                        "route": name,
+                        "samples": result.samples,
+                        "estimated_cpu_seconds": round(result.samples * self.interval, 3),
+                        "top_self": result.top(result.self_counts, 5, self.interval)
+                    }
+                    for name, result in routes[:limit]
+                ]
+            }
+
+continuous_profiler = ContinuousProfiler()
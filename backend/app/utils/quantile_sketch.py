@@ -0,0 +1,97 @@
+import math
+from typing import Dict, Iterable, Optional
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees (DDSketch style).
+
+    Positive values are counted in logarithmic buckets so that any reported
+    quantile is within `relative_accuracy` of the true value. Memory is bounded
+    by `max_buckets`: when exceeded, the lowest buckets are collapsed, which
+    only affects accuracy of the smallest quantiles. Two sketches built with
+    the same accuracy can be merged by adding their bucket counts.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float):
+        if value is None:
+            return
+        value = float(value)
+        if value < 0:
+            raise ValueError("QuantileSketch only supports non-negative values")
+
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+        if value == 0:
+            self.zero_count += 1
+            return
+
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def update(self, values: Iterable[float]):
+        for value in values:
+            self.add(value)
+
+    def _collapse(self):
+        """Fold the lowest buckets together until the bucket limit holds"""
+        keys = sorted(self.buckets)
+        excess = len(keys) - self.max_buckets
+        target = keys[excess]
+        for key in keys[:excess]:
+            self.buckets[target] += self.buckets.pop(key)
+
+    def merge(self, other: "QuantileSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                estimate = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+
+        return self.max
+
+    def quantiles(self, qs: Iterable[float] = (0.5, 0.9, 0.99)) -> Dict[str, Optional[float]]:
+        return {f"p{round(q * 100):g}": self.quantile(q) for q in qs}
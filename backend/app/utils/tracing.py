@@ -0,0 +1,292 @@
+"""
+Lightweight span tracing.
+
+A trace is started per request by TracingMiddleware and carried in a
+contextvar, so any code running for that request can open spans with
+
+    with span("loan.predict"):
+        ...
+
+Only sampled requests (TRACE_SAMPLE_RATE) record spans; for the rest span()
+returns a shared no-op object, so instrumented code costs one contextvar
+lookup. Finished traces are handed to a background thread that exports them
+as JSON lines or as OTLP/HTTP JSON to a collector.
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List[Dict] = []
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "attributes", "start_ns", "_token")
+
+    def __init__(self, trace: Trace, name: str, attributes: Dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = _current_span_id.get()
+        self.attributes = attributes
+        self.start_ns = 0
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current_span_id.set(self.span_id)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.time_ns()
+        _current_span_id.reset(self._token)
+        self.trace.spans.append({
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": end_ns,
+            "duration_ms": (end_ns - self.start_ns) / 1e6,
+            "status": "error" if exc_type else "ok",
+            "error": repr(exc) if exc is not None else None,
+            "attributes": self.attributes
+        })
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span_id: ContextVar[Optional[str]] = ContextVar("current_span_id", default=None)
+
+def span(name: str, **attributes):
+    """Open a child span of the current trace (no-op when the request is not sampled)"""
+    trace = _current_trace.get()
+    if trace is None or not trace.sampled:
+        return _NOOP_SPAN
+    return Span(trace, name, attributes)
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+def start_trace(trace_id: Optional[str] = None, sampled: Optional[bool] = None):
+    """Start a trace in the current context; returns (trace, token) for finish_trace"""
+    if sampled is None:
+        sampled = settings.TRACE_SAMPLE_RATE > 0 and random.random() < settings.TRACE_SAMPLE_RATE
+    trace = Trace(trace_id or os.urandom(16).hex(), sampled)
+    return trace, _current_trace.set(trace)
+
+class ForcedSamplingBudget:
+    """
+    Token bucket for requests whose client asks for sampling (X-Trace-Id), so
+    that unauthenticated clients cannot have every request traced and exported.
+    Used from the event loop only.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self.granted = 0
+        self.refused = 0
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            self.granted += 1
+            return True
+        self.refused += 1
+        return False
+
+forced_sampling = ForcedSamplingBudget(settings.TRACE_FORCED_PER_SECOND, settings.TRACE_FORCED_BURST)
+
+def finish_trace(trace: Trace, token):
+    _current_trace.reset(token)
+    if trace.sampled and trace.spans:
+        exporter.submit(trace.spans)
+
+class JsonLinesExporter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Dict]):
+        with open(self.path, "a") as f:
+            for record in spans:
+                f.write(json.dumps(record, default=str) + "\n")
+
+class OtlpHttpExporter:
+    """Posts spans as OTLP/HTTP JSON (the /v1/traces payload)"""
+
+    def __init__(self, endpoint: str, service_name: str):
+        self.endpoint = endpoint
+        self.service_name = service_name
+
+    @staticmethod
+    def _attribute(key: str, value) -> Dict:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def export(self, spans: List[Dict]):
+        otlp_spans = []
+        for record in spans:
+            otlp_span = {
+                "traceId": record["trace_id"],
+                "spanId": record["span_id"],
+                "name": record["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(record["start_time_unix_nano"]),
+                "endTimeUnixNano": str(record["end_time_unix_nano"]),
+                "attributes": [self._attribute(k, v) for k, v in record["attributes"].items()],
+                "status": {"code": 2, "message": record["error"]} if record["status"] == "error" else {"code": 1}
+            }
+            if record["parent_span_id"]:
+                otlp_span["parentSpanId"] = record["parent_span_id"]
+            otlp_spans.append(otlp_span)
+
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [self._attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "app.utils.tracing"}, "spans": otlp_spans}]
+            }]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+class BackgroundExporter:
+    """
+    Batches finished spans on a bounded queue and exports them from a daemon
+    thread, so request handling never waits on file or network I/O. Spans are
+    dropped (and counted) when the queue is full.
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 512, flush_interval: float = 1.0):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._backend = None
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _build_backend(self):
+        if settings.TRACE_EXPORTER == "otlp":
+            return OtlpHttpExporter(settings.TRACE_OTLP_ENDPOINT, settings.PROJECT_NAME)
+        if settings.TRACE_EXPORTER == "jsonl":
+            return JsonLinesExporter(settings.TRACE_FILE_PATH)
+        return None
+
+    def _ensure_started(self):
+        # Started lazily so each (forked) worker process gets its own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._backend = self._build_backend()
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def submit(self, spans: List[Dict]):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def _export(self, batch: List[Dict]):
+        if not batch or self._backend is None:
+            return
+        try:
+            self._backend.export(batch)
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning("Trace export error: %s", e)
+
+    def _run(self):
+        batch: List[Dict] = []
+        deadline = time.monotonic() + self._flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                batch.extend(item)
+            if batch and (len(batch) >= self._batch_size or time.monotonic() >= deadline or item is None):
+                self._export(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self._flush_interval
+
+    def flush(self):
+        """Export whatever is queued (called on shutdown)"""
+        batch: List[Dict] = []
+        while True:
+            try:
+                batch.extend(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._export(batch)
+
+    def stats(self) -> Dict:
+        return {
+            "sample_rate": settings.TRACE_SAMPLE_RATE,
+            "exporter": settings.TRACE_EXPORTER,
+            "queued": self._queue.qsize(),
+            "exported_spans": self.exported,
+            "dropped_spans": self.dropped,
+            "failed_spans": self.failed,
+            "forced_sampled": forced_sampling.granted,
+            "forced_refused": forced_sampling.refused
+        }
+
+exporter = BackgroundExporter()
@@ -0,0 +1,239 @@
+"""
+Micro-benchmark for model inference.
+
+Measures, per backend (Keras CNN served by app.utils.model_utils, and the
+XGBoost and logistic regression pickles in model/):
+
+  * cold start: framework import plus model load time, and the RSS it adds
+  * forward pass latency (p50/p95) and throughput for batches of 1..4096 rows
+
+and the cost of preprocess_input (single row, as served) next to the
+equivalent vectorized scaling for batches. Every backend is measured in a
+fresh spawned process so cold start and RSS are not shared. Run from the
+backend directory:
+
+    python -m benchmarks.bench_inference
+    python -m benchmarks.bench_inference --output inference.json --update-csv
+
+--update-csv adds the serving columns to model/all_models_comparison.csv.
+The Keras row is only written when the real model file was loaded - numbers
+from the development dummy model would be misleading.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MODEL_DIR = os.path.join(REPO_ROOT, "model")
+COMPARISON_CSV = os.path.join(MODEL_DIR, "all_models_comparison.csv")
+
+FEATURES = ["Income", "InterestRate", "LoanAmount", "Age", "CreditScore", "MonthsEmployed", "DTIRatio"]
+BACKENDS = ("keras", "xgboost", "logistic_regression")
+CSV_NAMES = {"keras": "1D CNN", "xgboost": "XGBoost", "logistic_regression": "Logistic Regression"}
+CSV_COLUMNS = (
+    "Cold Start (s)",
+    "RSS Delta (MB)",
+    "Serving Latency 1-row p50 (ms)",
+    "Forward Latency 64-batch p50 (ms)",
+    "Throughput 4096-batch (rows/s)"
+)
+
+def synthetic_rows(count: int, seed: int = 3):
+    """Applicant feature dicts in the ranges of the training data"""
+    rng = np.random.default_rng(seed)
+    columns = {
+        "Income": rng.uniform(15000, 150000, count),
+        "InterestRate": rng.uniform(2, 25, count),
+        "LoanAmount": rng.uniform(5000, 250000, count),
+        "Age": rng.integers(18, 70, count),
+        "CreditScore": rng.integers(300, 850, count),
+        "MonthsEmployed": rng.integers(0, 120, count),
+        "DTIRatio": rng.uniform(0.1, 0.9, count)
+    }
+    return [{feature: float(columns[feature][index]) for feature in FEATURES} for index in range(count)]
+
+def time_calls(func, min_seconds: float, max_calls: int, min_calls: int = 5):
+    """Per-call durations in seconds, after two untimed warm-up calls"""
+    func()
+    func()
+    durations = []
+    deadline = time.perf_counter() + min_seconds
+    while len(durations) < min_calls or (time.perf_counter() < deadline and len(durations) < max_calls):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+def latency_stats(durations, rows: int):
+    milliseconds = np.asarray(durations) * 1000
+    p50 = float(np.percentile(milliseconds, 50))
+    return {
+        "calls": len(durations),
+        "p50_ms": round(p50, 4),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 4),
+        "rows_per_second": round(rows / (p50 / 1000), 1) if p50 else None
+    }
+
+def _rss() -> int:
+    import psutil
+    return psutil.Process().memory_info().rss
+
+def _load_backend(backend: str, model_dir: str):
+    """Import the framework and load the model; returns (predict, scale, import_seconds, extra)"""
+    started = time.perf_counter()
+    if backend == "keras":
+        import tensorflow  # noqa: F401
+        import_seconds = time.perf_counter() - started
+        from app.config import settings
+        from app.utils import model_utils
+        model = model_utils.load_model()
+        scaler = model_utils.load_scaler()
+        extra = {"model_path": settings.MODEL_PATH, "dummy_model": not os.path.exists(settings.MODEL_PATH)}
+        # The serving path: predict_default_probability calls model.predict
+        return (lambda X: model.predict(X, verbose=0)), scaler.transform, import_seconds, extra
+
+    import joblib
+    if backend == "xgboost":
+        import xgboost  # noqa: F401
+    else:
+        import sklearn.linear_model  # noqa: F401
+    import_seconds = time.perf_counter() - started
+    model_path = os.path.join(model_dir, f"{backend}_model.pkl")
+    model = joblib.load(model_path)
+    scaler = joblib.load(os.path.join(model_dir, "scaler.pkl"))
+    return (lambda X: model.predict_proba(X)[:, 1]), scaler.transform, import_seconds, {"model_path": model_path}
+
+def measure_backend(backend: str, batch_sizes, min_seconds: float, max_calls: int, model_dir: str):
+    """Runs in a fresh process"""
+    warnings.simplefilter("ignore")
+    rss_before = _rss()
+    started = time.perf_counter()
+    predict, scale, import_seconds, extra = _load_backend(backend, model_dir)
+    cold_start = time.perf_counter() - started
+    rss_after_load = _rss()
+
+    rows = synthetic_rows(max(batch_sizes))
+    matrix = np.array([[row[feature] for feature in FEATURES] for row in rows])
+    scaled = scale(matrix)
+
+    first_started = time.perf_counter()
+    predict(scaled[:1])
+    first_call = time.perf_counter() - first_started
+
+    forward = {}
+    for batch_size in batch_sizes:
+        batch = scaled[:batch_size]
+        forward[batch_size] = latency_stats(time_calls(lambda: predict(batch), min_seconds, max_calls), batch_size)
+
+    result = {
+        "backend": backend,
+        **extra,
+        "import_seconds": round(import_seconds, 4),
+        "cold_start_seconds": round(cold_start, 4),
+        "first_call_seconds": round(first_call, 4),
+        "rss_delta_mb": round((rss_after_load - rss_before) / 2**20, 1),
+        "rss_peak_delta_mb": round((_rss() - rss_before) / 2**20, 1),
+        "forward": forward
+    }
+
+    if backend == "keras":
+        from app.utils.model_utils import preprocess_input
+        single_row = lambda: preprocess_input(rows[0], FEATURES)
+    else:
+        # Same work as preprocess_input, with this backend's scaler
+        single_row = lambda: scale(np.array([rows[0][feature] for feature in FEATURES]).reshape(1, -1))
+    preprocess = {1: latency_stats(time_calls(single_row, min_seconds, max_calls), 1)}
+    for batch_size in batch_sizes:
+        if batch_size == 1:
+            continue
+        batch_rows = rows[:batch_size]
+        # What a batched preprocess would do: one array, one transform
+        preprocess[batch_size] = latency_stats(time_calls(
+            lambda: scale(np.array([[row[feature] for feature in FEATURES] for row in batch_rows])),
+            min_seconds, max_calls
+        ), batch_size)
+    result["preprocess"] = preprocess
+    return result
+
+def update_comparison_csv(results, path: str):
+    """Add or refresh the serving columns; rows that were not measured keep their values"""
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        fieldnames = list(reader.fieldnames)
+        table = list(reader)
+    fieldnames += [column for column in CSV_COLUMNS if column not in fieldnames]
+
+    by_name = {CSV_NAMES[r["backend"]]: r for r in results if not r.get("dummy_model")}
+    for row in table:
+        result = by_name.get(row["Model"])
+        if result is None:
+            continue
+        forward = result["forward"]
+        row["Cold Start (s)"] = f"{result['cold_start_seconds']:.3f}"
+        row["RSS Delta (MB)"] = f"{result['rss_delta_mb']:.1f}"
+        row["Serving Latency 1-row p50 (ms)"] = f"{forward[1]['p50_ms'] + result['preprocess'][1]['p50_ms']:.3f}" if 1 in forward else ""
+        row["Forward Latency 64-batch p50 (ms)"] = f"{forward[64]['p50_ms']:.3f}" if 64 in forward else ""
+        row["Throughput 4096-batch (rows/s)"] = f"{forward[4096]['rows_per_second']:.0f}" if 4096 in forward else ""
+
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, restval="")
+        writer.writeheader()
+        writer.writerows(table)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64, 512, 4096])
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="Timing budget per batch size")
+    parser.add_argument("--max-calls", type=int, default=2000)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--update-csv", action="store_true", help=f"Add serving columns to {COMPARISON_CSV}")
+    args = parser.parse_args()
+    batch_sizes = sorted(set(args.batch_sizes))
+
+    results = []
+    for backend in args.backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            future = executor.submit(measure_backend, backend, batch_sizes, args.min_seconds, args.max_calls, args.model_dir)
+            try:
+                result = future.result()
+            except ImportError as e:
+                print(f"[skip] {backend}: {e}")
+                continue
+        results.append(result)
+
+        dummy = " (dummy model)" if result.get("dummy_model") else ""
+        print(
+            f"\n{backend}{dummy}: cold start {result['cold_start_seconds']:.2f}s "
+            f"(import {result['import_seconds']:.2f}s), first call {result['first_call_seconds'] * 1000:.1f}ms, "
+            f"RSS +{result['rss_delta_mb']:.0f}MB"
+        )
+        print(f"  {'batch':>6s} {'fwd p50 ms':>11s} {'fwd p95 ms':>11s} {'rows/s':>12s} {'prep p50 ms':>12s}")
+        for batch_size in batch_sizes:
+            stats = result["forward"][batch_size]
+            print(
+                f"  {batch_size:6d} {stats['p50_ms']:11.3f} {stats['p95_ms']:11.3f} {stats['rows_per_second']:12,.0f} "
+                f"{result['preprocess'][batch_size]['p50_ms']:12.3f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"batch_sizes": batch_sizes, "backends": results}, f, indent=2)
+        print(f"\nresults written to {args.output}")
+
+    if args.update_csv:
+        if any(r.get("dummy_model") for r in results):
+            print(f"\n[note] keras ran the dummy model; its row in {COMPARISON_CSV} is left unchanged")
+        update_comparison_csv(results, COMPARISON_CSV)
+        print(f"serving columns written to {COMPARISON_CSV}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark for the Monte Carlo stress-testing engine.
+
+Run from the backend directory:
+    python -m benchmarks.bench_stress_test --loans 100000 --simulations 20000 --max-seconds 10
+
+Exits with status 1 when any scenario takes longer than --max-seconds, so it can
+guard the "seconds for 100k loans" budget in CI.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.utils.portfolio_simulation import simulate_losses_sharded, summarize_losses
+
+def build_portfolio(num_loans: int, seed: int = 42):
+    """Synthetic portfolio with a skewed PD distribution and log-normal exposures"""
+    rng = np.random.default_rng(seed)
+    default_probabilities = rng.beta(2, 18, num_loans)
+    exposures = rng.lognormal(mean=9.5, sigma=0.8, size=num_loans)
+    return default_probabilities, exposures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loans", type=int, default=100000)
+    parser.add_argument("--simulations", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--correlations", type=float, nargs="+", default=[0.0, 0.15])
+    parser.add_argument("--max-seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    default_probabilities, exposures = build_portfolio(args.loans)
+    print(f"portfolio: {args.loans} loans, exposure {exposures.sum():,.0f}, mean PD {default_probabilities.mean():.4f}")
+    print(f"simulations: {args.simulations}, workers: {args.workers}")
+
+    failed = False
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        # Warm the workers so process start-up is not counted
+        list(executor.map(abs, range(args.workers)))
+
+        for correlation in args.correlations:
+            started = time.perf_counter()
+            losses = simulate_losses_sharded(
+                default_probabilities, exposures, args.simulations, correlation,
+                seed=7, executor=executor, shards=args.workers
+            )
+            elapsed = time.perf_counter() - started
+            summary = summarize_losses(losses, float(exposures.sum()))
+
+            status = "ok" if elapsed <= args.max_seconds else "SLOW"
+            failed = failed or elapsed > args.max_seconds
+            print(
+                f"[{status}] correlation={correlation:.2f} time={elapsed:.2f}s "
+                f"sims/s={args.simulations / elapsed:,.0f} "
+                f"EL={summary['expected_loss']:,.0f} VaR99={summary['value_at_risk']:,.0f} "
+                f"ES99={summary['expected_shortfall']:,.0f}"
+            )
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
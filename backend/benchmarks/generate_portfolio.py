@@ -0,0 +1,504 @@
+"""
+Synthetic portfolio generator for scale testing.
+
+Draws customers, banks, loan packages, loans (with payment schedules and a
+realistic status mix) and repayment histories with numpy, and bulk-loads them
+through `app.firebase_admin.db` in chunked batched writes of at most 500
+documents, so it works against Firestore and the local stand-in alike.
+
+Feature distributions follow the Loan_default.csv training data used in
+model/notebook.ipynb (and the fitted scaler): uniform Age 18-69, Income
+15k-150k, LoanAmount 5k-250k, CreditScore 300-849, MonthsEmployed 0-119,
+InterestRate 2-25%, DTIRatio 0.1-0.9, terms of 12-60 months and a default
+rate around 11.6%. Run from the backend directory:
+
+    # In-memory backend, saved as a seed file for LOCAL_FIRESTORE_SEED_PATH
+    python -m benchmarks.generate_portfolio --customers 100000 --output portfolio.json
+
+    # The Firestore project in FIREBASE_CREDENTIALS_PATH
+    python -m benchmarks.generate_portfolio --backend firestore --customers 100000 --writers 8
+
+Completed loans are not recorded in model_performance; rebuild it afterwards
+with POST /api/v1/admin/system/model-performance/rebuild.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+DAY = np.timedelta64(1, "D")
+TERMS = np.array([12, 24, 36, 48, 60])
+DEFAULT_RATE = 0.116
+MAX_BATCH_SIZE = 500
+
+# Standardised-feature log-odds weights: higher rate, amount and DTI raise the
+# default risk; income, age, tenure and credit score lower it
+RISK_WEIGHTS = {
+    "InterestRate": 0.45,
+    "LoanAmount": 0.30,
+    "DTIRatio": 0.10,
+    "Income": -0.35,
+    "Age": -0.55,
+    "MonthsEmployed": -0.30,
+    "CreditScore": -0.12
+}
+FEATURE_RANGES = {
+    "Age": (18, 70),
+    "Income": (15000, 150000),
+    "LoanAmount": (5000, 250000),
+    "CreditScore": (300, 850),
+    "MonthsEmployed": (0, 120),
+    "InterestRate": (2.0, 25.0),
+    "DTIRatio": (0.1, 0.9)
+}
+PURPOSES = np.array(["Home", "Auto", "Education", "Business", "Other"])
+
+def _uniform(rng, feature: str, size: int, integer: bool = False):
+    low, high = FEATURE_RANGES[feature]
+    if integer:
+        return rng.integers(low, high, size)
+    return np.round(rng.uniform(low, high, size), 2)
+
+def _standardised(feature: str, values):
+    low, high = FEATURE_RANGES[feature]
+    return (values - (low + high) / 2) / ((high - low) / np.sqrt(12))
+
+def default_probability(features: dict, intercept: float) -> np.ndarray:
+    log_odds = intercept + sum(weight * _standardised(name, features[name]) for name, weight in RISK_WEIGHTS.items())
+    return 1 / (1 + np.exp(-log_odds))
+
+def calibrate_intercept(rng, target: float = DEFAULT_RATE, samples: int = 200000) -> float:
+    """Intercept that makes the mean default probability of the population equal `target`"""
+    features = {name: _uniform(rng, name, samples) for name in RISK_WEIGHTS}
+    low, high = -10.0, 5.0
+    for _ in range(50):
+        middle = (low + high) / 2
+        if default_probability(features, middle).mean() < target:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+def credit_scores(probabilities):
+    """Vectorised ScoringService.calculate_credit_score"""
+    clipped = np.clip(probabilities, 1e-6, 1 - 1e-6)
+    return np.clip(600 - 50 * np.log(clipped / (1 - clipped)), 300, 850)
+
+def credit_grades(scores):
+    return np.select([scores >= 720, scores >= 660, scores >= 600], ["excellent", "good", "fair"], "high_risk")
+
+def decisions(probabilities, grades):
+    """Vectorised ScoringService.calculate_loan_decision: (decision, recommendation)"""
+    conditions = [
+        probabilities < 0.3,
+        probabilities < 0.5,
+        (probabilities < 0.7) & (grades != "high_risk")
+    ]
+    decision = np.select(conditions, ["Approve", "Approve", "Approve With Co-Signer"], "Reject")
+    recommendation = np.select(conditions, [
+        "Low risk - favorable terms",
+        "Medium risk - standard terms",
+        "Higher risk detected - co-signer recommended"
+    ], "High default risk")
+    return decision, recommendation
+
+def amortisation(amounts, rates, terms):
+    """(payment, principal, interest, remaining_balance) matrices of shape (loans, max term)"""
+    monthly_rate = rates / 100 / 12
+    months = np.arange(1, terms.max() + 1)
+    growth = (1 + monthly_rate)[:, None] ** months[None, :]
+    payment = amounts * monthly_rate * (1 + monthly_rate) ** terms / ((1 + monthly_rate) ** terms - 1)
+    balance = amounts[:, None] * growth - payment[:, None] * (growth - 1) / monthly_rate[:, None]
+    previous = np.concatenate([amounts[:, None], balance[:, :-1]], axis=1)
+    interest = previous * monthly_rate[:, None]
+    principal = payment[:, None] - interest
+    return payment, principal, interest, np.maximum(balance, 0)
+
+def _datetimes(values):
+    return values.astype("datetime64[us]").tolist()
+
+class PortfolioGenerator:
+
+    def __init__(self, prefix: str, banks: int, packages_per_bank: int, history_days: int, seed: int, settings):
+        self.rng = np.random.default_rng(seed)
+        self.prefix = prefix
+        self.history_days = history_days
+        self.settings = settings
+        self.loans_generated = 0
+        self.now = np.datetime64(datetime.utcnow().replace(microsecond=0), "s")
+        self.intercept = calibrate_intercept(self.rng)
+
+        self.bank_ids = [f"{prefix}-bank-{index:04d}" for index in range(banks)]
+        self.bank_counters = {bank_id: Counter() for bank_id in self.bank_ids}
+        self.packages = self._packages(packages_per_bank)
+
+    def _packages(self, per_bank: int):
+        count = len(self.bank_ids) * per_bank
+        rng = self.rng
+        return {
+            "bank_index": np.repeat(np.arange(len(self.bank_ids)), per_bank),
+            "ids": [f"{bank_id}-package-{index:02d}" for bank_id in self.bank_ids for index in range(per_bank)],
+            "amount": np.round(_uniform(rng, "LoanAmount", count), -2),
+            "interest_rate": _uniform(rng, "InterestRate", count),
+            "term": rng.choice(TERMS, count),
+            "minimum_credit_score": rng.choice([300, 500, 600, 650, 700], count).astype(float)
+        }
+
+    def package_documents(self):
+        created_at = self.now - np.timedelta64(self.history_days + 30, "D")
+        for index, package_id in enumerate(self.packages["ids"]):
+            yield "loan_packages", package_id, {
+                "package_id": package_id,
+                "bank_id": self.bank_ids[self.packages["bank_index"][index]],
+                "name": f"Package {index}",
+                "amount": float(self.packages["amount"][index]),
+                "interest_rate": float(self.packages["interest_rate"][index]),
+                "loan_term_months": int(self.packages["term"][index]),
+                "minimum_credit_score": float(self.packages["minimum_credit_score"][index]),
+                "description": "Generated package",
+                "created_at": created_at.astype(datetime),
+                "is_active": True
+            }
+
+    def bank_documents(self):
+        created_at = (self.now - np.timedelta64(self.history_days + 60, "D")).astype(datetime)
+        package_ids = np.array(self.packages["ids"])
+        for index, bank_id in enumerate(self.bank_ids):
+            counters = self.bank_counters[bank_id]
+            yield "users", bank_id, {
+                "user_id": bank_id,
+                "email": f"{bank_id}@generated.local",
+                "name": f"Bank {index}",
+                "role": "bank",
+                "bank_name": f"Bank {index}",
+                "max_dti_threshold": 0.45,
+                "total_loans_approved": counters["approved"],
+                "total_loans_rejected": counters["rejected"],
+                "total_loans_under_management": counters["approved"],
+                "delinquent_loans": counters["delinquent"],
+                "loan_packages": package_ids[self.packages["bank_index"] == index].tolist(),
+                "created_at": created_at,
+                "updated_at": created_at
+            }
+
+    def chunk(self, start: int, count: int, loans_per_customer: float):
+        """Documents of customers [start, start + count), their loans and repayments"""
+        rng = self.rng
+        customer_ids = [f"{self.prefix}-customer-{index:08d}" for index in range(start, start + count)]
+        age = _uniform(rng, "Age", count, integer=True)
+        income = _uniform(rng, "Income", count)
+        credit_score = _uniform(rng, "CreditScore", count, integer=True).astype(float)
+        months_employed = np.minimum(_uniform(rng, "MonthsEmployed", count, integer=True), (age - 18) * 12)
+        dti = _uniform(rng, "DTIRatio", count)
+        joined = self.now - (rng.uniform(30, self.history_days + 30, count) * 86400).astype("timedelta64[s]")
+
+        # Loans: Poisson count per customer, created after the customer joined
+        loan_counts = rng.poisson(loans_per_customer, count)
+        owner = np.repeat(np.arange(count), loan_counts)
+        n = len(owner)
+        created = joined[owner] + ((self.now - joined[owner]).astype(float) * rng.uniform(0, 1, n)).astype("timedelta64[s]")
+
+        from_package = rng.random(n) < 0.4
+        package = rng.integers(0, len(self.packages["ids"]), n)
+        amount = np.where(from_package, self.packages["amount"][package], np.round(_uniform(rng, "LoanAmount", n), -2))
+        rate = np.where(from_package, self.packages["interest_rate"][package], _uniform(rng, "InterestRate", n))
+        term = np.where(from_package, self.packages["term"][package], rng.choice(TERMS, n))
+
+        features = {
+            "Income": income[owner], "InterestRate": rate, "LoanAmount": amount, "Age": age[owner],
+            "CreditScore": credit_score[owner], "MonthsEmployed": months_employed[owner], "DTIRatio": dti[owner]
+        }
+        probability = default_probability(features, self.intercept)
+        new_score = credit_scores(probability)
+        grade = credit_grades(new_score)
+        decision, recommendation = decisions(probability, grade)
+
+        # Lifecycle: recent applications may still be pending, the rest were decided by a bank
+        age_days = (self.now - created) / DAY
+        pending = (age_days < 7) & (rng.random(n) < 0.6)
+        reject_chance = np.select([decision == "Reject", decision == "Approve With Co-Signer"], [0.85, 0.4], 0.05)
+        rejected = ~pending & (rng.random(n) < reject_chance)
+        approved = ~pending & ~rejected
+        bank = rng.integers(0, len(self.bank_ids), n)
+        bank = np.where(from_package, self.packages["bank_index"][package], bank)
+
+        activated = created + (rng.uniform(0.5, 5, n) * 86400).astype("timedelta64[s]")
+        activated = np.minimum(activated, self.now)
+        first_due = activated + np.timedelta64(30, "D")
+        due_count = np.clip(((self.now - first_due) / DAY // 30 + 1).astype(int), 0, term)
+
+        default_month = rng.integers(1, term + 1)
+        defaulted = approved & (rng.random(n) < probability) & (default_month <= due_count)
+        early_payoff = approved & ~defaulted & (rng.random(n) < 0.03) & (due_count > 0)
+        paid = approved & ~defaulted & ((due_count >= term) | early_payoff)
+        open_loan = approved & ~defaulted & ~paid
+        missed = np.where(open_loan & (rng.random(n) < probability / 2), rng.integers(1, 4, n), 0)
+        missed = np.minimum(missed, due_count)
+        delinquent = missed > 0
+
+        paid_installments = np.select(
+            [defaulted, paid, open_loan],
+            [np.maximum(default_month - 3, 0), term, due_count - missed],
+            0
+        )
+        status = np.select(
+            [pending, rejected, defaulted, paid, open_loan & (rng.random(n) < 0.5)],
+            ["pending", "rejected", "defaulted", "paid", "active"],
+            "approved"
+        )
+
+        payment, principal, interest, balance = amortisation(amount, rate, term)
+        paid_total = payment * np.minimum(paid_installments, term)
+        remaining = np.where(paid, 0.0, np.maximum(amount - paid_total, 0.0))
+        schedule_start = np.where(approved, first_due, created + np.timedelta64(30, "D"))
+        defaulted_at = first_due + (default_month - 1) * np.timedelta64(30, "D")
+        paid_at = np.where(early_payoff, self.now, schedule_start + (term - 1) * np.timedelta64(30, "D"))
+
+        loan_ids = [f"{self.prefix}-loan-{self.loans_generated + index:010d}" for index in range(n)]
+        self.loans_generated += n
+
+        for index in np.flatnonzero(approved):
+            counters = self.bank_counters[self.bank_ids[bank[index]]]
+            counters["approved"] += 1
+            counters["delinquent"] += int(delinquent[index])
+        for index in np.flatnonzero(rejected):
+            self.bank_counters[self.bank_ids[bank[index]]]["rejected"] += 1
+
+        created_dt = _datetimes(created)
+        activated_dt = _datetimes(activated)
+        defaulted_dt = _datetimes(defaulted_at)
+        paid_dt = _datetimes(paid_at)
+        purposes = PURPOSES[rng.integers(0, len(PURPOSES), n)].tolist()
+        late_fee_rate, late_fee_min = self.settings.LATE_FEE_RATE, self.settings.LATE_FEE_MIN
+        grace = timedelta(days=self.settings.DELINQUENCY_GRACE_DAYS)
+        thirty_days = timedelta(days=30)
+        now = self.now.astype(datetime)
+
+        repayments = []
+        for index in range(n):
+            loan_term = int(term[index])
+            start_due = schedule_start[index].astype(datetime)
+            paid_count = int(paid_installments[index])
+            overdue_until = paid_count + int(missed[index])
+            monthly = float(payment[index])
+            schedule = []
+            late_fees = 0.0
+            for month in range(loan_term):
+                due_date = start_due + thirty_days * month
+                installment = {
+                    "month": month + 1,
+                    "due_date": due_date,
+                    "amount_due": monthly,
+                    "principal": float(principal[index, month]),
+                    "interest": float(interest[index, month]),
+                    "remaining_balance": float(balance[index, month]),
+                    "status": "pending"
+                }
+                if month < paid_count:
+                    payment_date = min(due_date + timedelta(days=float(rng.normal(-2, 3))), now)
+                    installment.update(status="paid", amount_paid=monthly, paid_date=payment_date)
+                    repayments.append((loan_ids[index], month + 1, monthly, payment_date, due_date))
+                elif month < overdue_until:
+                    fee = round(max(late_fee_min, late_fee_rate * monthly), 2)
+                    installment.update(status="overdue", late_fee=fee)
+                    late_fees += fee
+                schedule.append(installment)
+
+            loan_status = str(status[index])
+            is_open = loan_status in ("approved", "active")
+            next_payment = start_due + thirty_days * paid_count if is_open and paid_count < loan_term else None
+            updated_at = created_dt[index]
+            loan = {
+                "loan_id": loan_ids[index],
+                "user_id": customer_ids[owner[index]],
+                "application_data": {
+                    "income": float(features["Income"][index]),
+                    "interest_rate": float(rate[index]),
+                    "loan_amount": float(amount[index]),
+                    "age": int(features["Age"][index]),
+                    "credit_score": float(features["CreditScore"][index]),
+                    "months_employed": int(features["MonthsEmployed"][index]),
+                    "dti_ratio": float(features["DTIRatio"][index]),
+                    "loan_term_months": loan_term,
+                    "purpose": purposes[index]
+                },
+                "default_probability": float(probability[index]),
+                "model_version": self.settings.MODEL_VERSION,
+                "credit_score_at_application": float(features["CreditScore"][index]),
+                "updated_credit_score": float(new_score[index]),
+                "credit_grade": str(grade[index]),
+                "decision": str(decision[index]),
+                "recommendation": str(recommendation[index]),
+                "status": loan_status,
+                "amount_remaining": float(remaining[index]),
+                "total_amount": float(amount[index]),
+                "created_at": created_dt[index],
+                "next_payment_date": next_payment,
+                "payment_schedule": schedule
+            }
+            if from_package[index]:
+                loan["package_id"] = self.packages["ids"][package[index]]
+            if not pending[index]:
+                loan["bank_id"] = self.bank_ids[bank[index]]
+                updated_at = min(activated_dt[index], now)
+            if approved[index]:
+                loan["activated_at"] = activated_dt[index]
+            if loan_status == "defaulted":
+                loan["defaulted_at"] = updated_at = defaulted_dt[index]
+                loan["is_delinquent"] = False
+            elif loan_status == "paid":
+                loan["paid_at"] = updated_at = paid_dt[index]
+            elif is_open:
+                if paid_count:
+                    updated_at = schedule[paid_count - 1]["paid_date"]
+                if delinquent[index]:
+                    loan["is_delinquent"] = True
+                    loan["days_past_due"] = max(0, (now - next_payment).days)
+                    loan["delinquent_since"] = next_payment + grace
+                    loan["late_fees_outstanding"] = late_fees
+            loan["updated_at"] = updated_at
+            yield "loans", loan_ids[index], loan
+
+        for loan_id, month, monthly, payment_date, due_date in repayments:
+            payment_id = f"{loan_id}-payment-{month:02d}"
+            yield "repayments", payment_id, {
+                "payment_id": payment_id,
+                "loan_id": loan_id,
+                "amount": monthly,
+                "payment_date": payment_date,
+                "due_date": due_date,
+                "status": "paid",
+                "late_fee": 0.0,
+                "created_at": payment_date
+            }
+
+        # Customers last: their debt, DTI, score and loan history depend on the loans
+        open_debt = np.bincount(owner, weights=np.where(np.isin(status, ["approved", "active"]), remaining, 0), minlength=count)
+        latest_score = credit_score.copy()
+        history = [[] for _ in range(count)]
+        for index in np.argsort(created, kind="stable"):
+            history[owner[index]].append(loan_ids[index])
+            latest_score[owner[index]] = new_score[index]
+        joined_dt = _datetimes(joined)
+        for index, customer_id in enumerate(customer_ids):
+            joined_at = joined_dt[index]
+            yield "users", customer_id, {
+                "user_id": customer_id,
+                "email": f"{customer_id}@generated.local",
+                "name": f"Customer {start + index}",
+                "role": "customer",
+                "income": float(income[index]),
+                "date_of_birth": (joined_at - timedelta(days=365.25 * int(age[index]))).date().isoformat(),
+                "employment_start_date": (now - timedelta(days=30 * int(months_employed[index]))).date().isoformat(),
+                "age": int(age[index]),
+                "months_employed": int(months_employed[index]),
+                "current_credit_score": float(latest_score[index]),
+                "total_debt": float(open_debt[index]),
+                "current_dti": float(open_debt[index] / income[index]) if open_debt[index] else float(dti[index]),
+                "employment_status": "employed",
+                "loan_history": history[index],
+                "created_at": joined_at,
+                "updated_at": joined_at
+            }
+
+class BulkWriter:
+    """Chunked batched writes, up to `writers` batches committing at once"""
+
+    def __init__(self, db, batch_size: int = MAX_BATCH_SIZE, writers: int = 1):
+        self.db = db
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.executor = ThreadPoolExecutor(max_workers=writers) if writers > 1 else None
+        self.max_in_flight = writers * 2
+        self.in_flight = []
+        self.batch = db.batch()
+        self.pending = 0
+        self.written = Counter()
+
+    def set(self, collection: str, document_id: str, data: dict):
+        self.batch.set(self.db.collection(collection).document(document_id), data)
+        self.pending += 1
+        self.written[collection] += 1
+        if self.pending >= self.batch_size:
+            self._commit()
+
+    def _commit(self):
+        batch, self.batch, self.pending = self.batch, self.db.batch(), 0
+        if self.executor is None:
+            batch.commit()
+            return
+        self.in_flight.append(self.executor.submit(batch.commit))
+        if len(self.in_flight) >= self.max_in_flight:
+            self.in_flight.pop(0).result()
+
+    def close(self):
+        if self.pending:
+            self._commit()
+        for future in self.in_flight:
+            future.result()
+        self.in_flight = []
+        if self.executor is not None:
+            self.executor.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["local", "firestore"], default="local")
+    parser.add_argument("--output", help="Seed file to save the local backend to (required for --backend local)")
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--loans-per-customer", type=float, default=1.5, help="Poisson mean")
+    parser.add_argument("--banks", type=int, default=20)
+    parser.add_argument("--packages-per-bank", type=int, default=5)
+    parser.add_argument("--history-days", type=int, default=730, help="How far back customers and loans go")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Customers generated per chunk")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--writers", type=int, default=1, help="Batches committed concurrently")
+    parser.add_argument("--prefix", default="gen", help="Document id prefix, to tell generated data apart")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.backend == "local":
+        if not args.output:
+            parser.error("--output is required with --backend local; the data only lives in this process")
+        os.environ.setdefault("STORAGE_BACKEND", "local")
+        os.environ.setdefault("AUTH_BACKEND", "fake")
+
+    # Imported after the backend is chosen: app.firebase_admin connects at import
+    from app.config import settings
+    from app.firebase_admin import db
+
+    generator = PortfolioGenerator(
+        args.prefix, args.banks, args.packages_per_bank, args.history_days, args.seed, settings
+    )
+    writer = BulkWriter(db, args.batch_size, args.writers)
+    started = time.perf_counter()
+
+    for collection, document_id, data in generator.package_documents():
+        writer.set(collection, document_id, data)
+    for start in range(0, args.customers, args.chunk_size):
+        for collection, document_id, data in generator.chunk(start, min(args.chunk_size, args.customers - start), args.loans_per_customer):
+            writer.set(collection, document_id, data)
+        elapsed = time.perf_counter() - started
+        total = sum(writer.written.values())
+        print(f"{min(start + args.chunk_size, args.customers):>10,} customers  {total:>12,} docs  {total / elapsed * 60:>12,.0f} docs/min", file=sys.stderr)
+    for collection, document_id, data in generator.bank_documents():
+        writer.set(collection, document_id, data)
+    writer.close()
+
+    elapsed = time.perf_counter() - started
+    total = sum(writer.written.values())
+    print(f"\nwrote {total:,} documents in {elapsed:.1f}s ({total / elapsed * 60:,.0f} docs/min)")
+    for collection, written in sorted(writer.written.items()):
+        print(f"  {collection:14s} {written:>12,}")
+
+    if args.backend == "local":
+        saving = time.perf_counter()
+        db.dump_json(args.output)
+        print(f"saved to {args.output} in {time.perf_counter() - saving:.1f}s - start the API with "
+              f"STORAGE_BACKEND=local LOCAL_FIRESTORE_SEED_PATH={args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""
+Full-stack load test and latency benchmark.
+
+Boots the API in a subprocess against the in-memory Firestore stand-in
+(STORAGE_BACKEND=local) and the fake token verifier (AUTH_BACKEND=fake),
+seeds it with synthetic customers, banks and loan packages, and drives each
+scenario with --concurrency clients for --duration seconds:
+
+    apply, apply_package, approve_reject, repay, bank_dashboard, admin_analytics
+
+Throughput and p50/p95/p99 latency per endpoint are written as JSON. Run from
+the backend directory:
+
+    python -m benchmarks.loadtest --output loadtest.json
+    python -m benchmarks.loadtest --baseline benchmarks/baseline.json --tolerance 0.25
+
+With --baseline it exits with status 1 when an endpoint's p95 grew, or its
+throughput or success rate fell, by more than the tolerance. A baseline
+recorded with different run parameters (concurrency, duration, dataset size,
+storage latency) is refused with status 2 before the run starts; a different
+CPU count only prints a warning, since baselines travel between machines. --url points it
+at an already running server instead; that server must use the same
+backends and a seed written with --write-seed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import numpy as np
+
+from app.utils.fake_auth import make_token
+from app.utils.local_firestore import write_seed_file
+
+SCENARIOS = ("apply", "apply_package", "approve_reject", "repay", "bank_dashboard", "admin_analytics")
+
+def build_seed(customers: int, banks: int, packages_per_bank: int, seed: int = 42):
+    """Customers with income/age/score/DTI drawn like the training data, banks with packages and one admin"""
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    users, loan_packages = {}, {}
+
+    for index in range(customers):
+        user_id = f"customer-{index:05d}"
+        age = int(rng.integers(19, 70))
+        months_employed = int(rng.integers(0, min(age - 18, 40) * 12 + 1))
+        users[user_id] = {
+            "user_id": user_id,
+            "email": f"{user_id}@loadtest.local",
+            "name": f"Customer {index}",
+            "role": "customer",
+            "income": float(round(rng.lognormal(10.9, 0.45), 2)),
+            "date_of_birth": (now - timedelta(days=365 * age)).date().isoformat(),
+            "employment_start_date": (now - timedelta(days=30 * months_employed)).date().isoformat(),
+            "age": age,
+            "months_employed": months_employed,
+            "current_credit_score": float(np.clip(rng.normal(680, 60), 300, 850).round()),
+            "total_debt": 0.0,
+            "current_dti": round(float(rng.beta(2, 5)), 3),
+            "employment_status": "employed",
+            "loan_history": [],
+            "created_at": now,
+            "updated_at": now
+        }
+
+    for bank_index in range(banks):
+        bank_id = f"bank-{bank_index:03d}"
+        package_ids = []
+        for package_index in range(packages_per_bank):
+            package_id = f"{bank_id}-package-{package_index:02d}"
+            package_ids.append(package_id)
+            loan_packages[package_id] = {
+                "package_id": package_id,
+                "bank_id": bank_id,
+                "name": f"Package {package_index}",
+                "amount": float(rng.choice([2500, 5000, 10000, 25000, 50000])),
+                "interest_rate": round(float(rng.uniform(4, 18)), 2),
+                "loan_term_months": int(rng.choice([12, 24, 36, 60])),
+                # Most customers qualify; the highest tiers reject some applicants on score
+                "minimum_credit_score": float(rng.choice([300, 500, 600, 700])),
+                "description": "Load test package",
+                "created_at": now,
+                "is_active": True
+            }
+        users[bank_id] = {
+            "user_id": bank_id,
+            "email": f"{bank_id}@loadtest.local",
+            "name": f"Bank {bank_index}",
+            "role": "bank",
+            "bank_name": f"Bank {bank_index}",
+            "max_dti_threshold": 0.45,
+            "total_loans_approved": 0,
+            "total_loans_rejected": 0,
+            "total_loans_under_management": 0,
+            "loan_packages": package_ids,
+            "created_at": now,
+            "updated_at": now
+        }
+
+    users["admin-000"] = {
+        "user_id": "admin-000",
+        "email": "admin-000@loadtest.local",
+        "name": "Admin",
+        "role": "admin",
+        "created_at": now,
+        "updated_at": now
+    }
+    return {"users": users, "loan_packages": loan_packages}
+
+class Recorder:
+    """Latencies and failures per endpoint, keyed by method and route template"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.status_codes = {}
+
+    def record(self, endpoint: str, seconds: float, status_code: int):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        codes = self.status_codes.setdefault(endpoint, {})
+        codes[status_code] = codes.get(status_code, 0) + 1
+        if status_code >= 400:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, elapsed_by_endpoint: dict) -> dict:
+        results = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            milliseconds = np.asarray(latencies) * 1000
+            p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+            elapsed = elapsed_by_endpoint.get(endpoint) or 1.0
+            results[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors.get(endpoint, 0),
+                "status_codes": {str(code): count for code, count in sorted(self.status_codes[endpoint].items())},
+                "rps": round(len(latencies) / elapsed, 2),
+                "mean_ms": round(float(milliseconds.mean()), 2),
+                "p50_ms": round(float(p50), 2),
+                "p95_ms": round(float(p95), 2),
+                "p99_ms": round(float(p99), 2),
+                "max_ms": round(float(milliseconds.max()), 2)
+            }
+        return results
+
+class LoadTest:
+
+    def __init__(self, client: httpx.AsyncClient, seed: dict, concurrency: int, duration: float):
+        self.client = client
+        self.concurrency = concurrency
+        self.duration = duration
+        self.recorder = Recorder()
+        self.elapsed = {}
+        self.rng = random.Random(7)
+
+        users = seed["users"].values()
+        self.customers = [user["user_id"] for user in users if user["role"] == "customer"]
+        self.banks = [user["user_id"] for user in users if user["role"] == "bank"]
+        self.admins = [user["user_id"] for user in users if user["role"] == "admin"]
+        self.package_ids = list(seed["loan_packages"])
+        # Loans created during the run: pending ones feed approve/reject, approved ones feed repay
+        self.pending = []
+        self.approved = []
+
+    def headers(self, user_id: str) -> dict:
+        return {"Authorization": f"Bearer {make_token(user_id, f'{user_id}@loadtest.local')}"}
+
+    async def call(self, method: str, endpoint: str, path: str, user_id: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=self.headers(user_id), **kwargs)
+            status_code = response.status_code
+        except httpx.HTTPError:
+            response, status_code = None, 599
+        self.recorder.record(f"{method} {endpoint}", time.perf_counter() - started, status_code)
+        return response if status_code < 400 else None
+
+    async def apply(self):
+        user_id = self.rng.choice(self.customers)
+        body = {
+            "income": round(self.rng.lognormvariate(10.9, 0.45), 2),
+            "interest_rate": round(self.rng.uniform(4, 20), 2),
+            "loan_amount": float(self.rng.choice([1000, 5000, 15000, 40000])),
+            "age": self.rng.randint(19, 70),
+            "credit_score": self.rng.randint(450, 820),
+            "months_employed": self.rng.randint(0, 240),
+            "dti_ratio": round(self.rng.betavariate(2, 5), 3),
+            "loan_term_months": self.rng.choice([12, 24, 36, 60]),
+            "purpose": "Personal Loan"
+        }
+        response = await self.call("POST", "/api/v1/customers/loans/apply", "/api/v1/customers/loans/apply", user_id, json=body)
+        if response is not None:
+            self.pending.append((response.json()["loan_id"], user_id))
+
+    async def apply_package(self):
+        user_id = self.rng.choice(self.customers)
+        body = {"package_id": self.rng.choice(self.package_ids), "purpose": "Home Improvement"}
+        response = await self.call("POST", "/api/v1/customers/loans/apply-package", "/api/v1/customers/loans/apply-package", user_id, json=body)
+        if response is not None:
+            self.pending.append((response.json()["loan_id"], user_id))
+
+    async def approve_reject(self):
+        if not self.pending:
+            return False
+        loan_id, user_id = self.pending.pop(self.rng.randrange(len(self.pending)))
+        bank_id = self.rng.choice(self.banks)
+        # Approve most loans so the repay scenario has work
+        action = "approve" if self.rng.random() < 0.8 else "reject"
+        response = await self.call("POST", f"/api/v1/banks/loans/{{loan_id}}/{action}", f"/api/v1/banks/loans/{loan_id}/{action}", bank_id)
+        if response is not None and action == "approve":
+            self.approved.append((loan_id, user_id))
+        return True
+
+    async def repay(self):
+        if not self.approved:
+            return False
+        loan_id, user_id = self.rng.choice(self.approved)
+        body = {"amount": round(self.rng.uniform(50, 500), 2)}
+        await self.call("POST", "/api/v1/customers/loans/{loan_id}/repay", f"/api/v1/customers/loans/{loan_id}/repay", user_id, json=body)
+        return True
+
+    async def bank_dashboard(self):
+        bank_id = self.rng.choice(self.banks)
+        await self.call("GET", "/api/v1/banks/dashboard", "/api/v1/banks/dashboard", bank_id)
+        await self.call("GET", "/api/v1/banks/loans/pending", "/api/v1/banks/loans/pending", bank_id)
+
+    async def admin_analytics(self):
+        admin_id = self.rng.choice(self.admins)
+        await self.call("GET", "/api/v1/admin/system/analytics", "/api/v1/admin/system/analytics", admin_id)
+        await self.call("GET", "/api/v1/admin/system/metrics", "/api/v1/admin/system/metrics", admin_id)
+
+    async def run_scenario(self, name: str) -> dict:
+        step = getattr(self, name)
+        deadline = time.perf_counter() + self.duration
+        iterations = 0
+
+        async def worker():
+            nonlocal iterations
+            while time.perf_counter() < deadline:
+                # Scenarios that consume earlier work return False once it runs out
+                if await step() is False:
+                    break
+                iterations += 1
+
+        before = {endpoint: len(latencies) for endpoint, latencies in self.recorder.latencies.items()}
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        for endpoint, latencies in self.recorder.latencies.items():
+            if len(latencies) != before.get(endpoint, 0):
+                self.elapsed[endpoint] = self.elapsed.get(endpoint, 0.0) + elapsed
+        return {"iterations": iterations, "seconds": round(elapsed, 2), "iterations_per_second": round(iterations / elapsed, 2)}
+
+    async def run(self, scenarios) -> dict:
+        results = {}
+        for name in scenarios:
+            results[name] = await self.run_scenario(name)
+            print(f"{name:16s} {results[name]['iterations']:6d} iterations in {results[name]['seconds']:.1f}s")
+        return results
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(seed_path: str, port: int, storage_latency_ms: float, log_path: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "STORAGE_BACKEND": "local",
+        "AUTH_BACKEND": "fake",
+        "LOCAL_FIRESTORE_SEED_PATH": seed_path,
+        "LOCAL_FIRESTORE_LATENCY_MS": str(storage_latency_ms),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING")
+    }
+    log_file = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--no-access-log"],
+        env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+
+async def wait_until_healthy(url: str, timeout: float, server: subprocess.Popen = None):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.perf_counter() < deadline:
+            if server is not None and server.poll() is not None:
+                raise RuntimeError(f"Server exited with status {server.returncode}")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {url} did not become healthy within {timeout:.0f}s")
+
+# Run parameters that move the numbers: runs differing in any are not comparable
+COMPARABLE_META = (
+    "concurrency", "duration_seconds", "customers", "banks", "packages_per_bank", "storage_latency_ms"
+)
+# Properties of the machine: a difference is reported but does not refuse the comparison
+HOST_META = ("cpu_count",)
+
+def run_meta(args) -> dict:
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "concurrency": args.concurrency,
+        "duration_seconds": args.duration,
+        "customers": args.customers,
+        "banks": args.banks,
+        "packages_per_bank": args.packages_per_bank,
+        "storage_latency_ms": args.storage_latency_ms,
+        "url": args.url
+    }
+
+def meta_mismatches(meta: dict, baseline_meta: dict, keys=COMPARABLE_META) -> list:
+    """Run parameters that differ from the baseline's, as printable lines"""
+    return [
+        f"{key}: {baseline_meta.get(key)} in the baseline, {meta.get(key)} in this run"
+        for key in keys if meta.get(key) != baseline_meta.get(key)
+    ]
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions of the current endpoints against the baseline, as printable lines"""
+    regressions = []
+    # A run limited with --scenarios is only compared on the endpoints it hit
+    ran_all = set(baseline["scenarios"]) <= set(results["scenarios"])
+    for endpoint, before in baseline["endpoints"].items():
+        after = results["endpoints"].get(endpoint)
+        if after is None:
+            if ran_all:
+                regressions.append(f"{endpoint}: missing from this run")
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {before['p95_ms']:.1f}ms -> {after['p95_ms']:.1f}ms")
+        if after["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {before['rps']:.1f} -> {after['rps']:.1f} req/s")
+        success_before = 1 - before["errors"] / max(before["requests"], 1)
+        success_after = 1 - after["errors"] / max(after["requests"], 1)
+        if success_after < success_before * (1 - tolerance):
+            regressions.append(f"{endpoint}: success rate {success_before:.1%} -> {success_after:.1%}")
+    return regressions
+
+def print_table(endpoints: dict, baseline: dict = None):
+    print(f"\n{'endpoint':58s} {'req':>6s} {'err':>5s} {'rps':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s}")
+    for endpoint, stats in endpoints.items():
+        line = (
+            f"{endpoint:58s} {stats['requests']:6d} {stats['errors']:5d} {stats['rps']:8.1f} "
+            f"{stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} {stats['p99_ms']:8.1f}"
+        )
+        before = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if before and before["p95_ms"]:
+            line += f"  p95 {stats['p95_ms'] / before['p95_ms'] - 1:+.0%}"
+        print(line)
+
+async def run(args) -> dict:
+    seed = build_seed(args.customers, args.banks, args.packages_per_bank)
+    server = None
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    seed_path = args.write_seed or os.path.join(workdir, "seed.json")
+    write_seed_file(seed_path, seed)
+
+    url = args.url
+    if url is None:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        server_log = os.path.join(workdir, "server.log")
+        server = start_server(seed_path, port, args.storage_latency_ms, server_log)
+        print(f"server log: {server_log}")
+    try:
+        await wait_until_healthy(url, args.startup_timeout, server)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.request_timeout) as client:
+            load_test = LoadTest(client, seed, args.concurrency, args.duration)
+            if args.warmup:
+                # Untimed pass so model warm-up and first-request imports are not measured
+                warmup = LoadTest(client, seed, 1, args.warmup)
+                for name in ("apply", "apply_package"):
+                    await warmup.run_scenario(name)
+            # Keep the canonical order: approve/reject and repay consume loans the apply scenarios created
+            scenarios = await load_test.run([name for name in SCENARIOS if name in args.scenarios])
+            endpoints = load_test.recorder.summary(load_test.elapsed)
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    return {
+        "meta": run_meta(args),
+        "scenarios": scenarios,
+        "endpoints": endpoints
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark a running server instead of starting one")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Untimed seconds before the run")
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--banks", type=int, default=5)
+    parser.add_argument("--packages-per-bank", type=int, default=6)
+    parser.add_argument("--storage-latency-ms", type=float, default=0.0, help="Simulated Firestore round trip")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--write-seed", help="Also keep the generated seed at this path")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        meta = run_meta(args)
+        for mismatch in meta_mismatches(meta, baseline.get("meta", {}), HOST_META):
+            print(f"Warning: baseline recorded on a different machine ({mismatch})")
+        mismatches = meta_mismatches(meta, baseline.get("meta", {}))
+        if mismatches:
+            print(f"Not comparable with {args.baseline}:")
+            for mismatch in mismatches:
+                print(f"  {mismatch}")
+            print("Run with the baseline's parameters, or record a new baseline with --output.")
+            sys.exit(2)
+
+    results = asyncio.run(run(args))
+    print_table(results["endpoints"], baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nresults written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"[REGRESSION] {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"\nno regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+if __name__ == "__main__":
+    main()